@@ -0,0 +1,350 @@
+# fake_services.py
+
+import base64
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytz
+
+######################################
+# LOCAL STAND-INS FOR GMAIL, CALENDAR AND OPENWEATHER
+######################################
+# One HTTP server answers the Gmail v1, Calendar v3 and OpenWeather endpoints
+# that tools.py uses, including Google's multipart batch endpoint. Point the
+# agent at it with GOOGLE_API_ROOT_URL and OPENWEATHER_URL.
+#
+# Every HTTP request (a batch counts once) is one round trip; counters are
+# kept per endpoint. Latency, jitter and error rate apply per round trip and
+# use a seeded RNG so runs are repeatable.
+
+SENDERS = [
+    ('Priya Sharma', 'priya@example.com'),
+    ('Rahul Verma', 'rahul@example.com'),
+    ('GitHub', 'noreply@github.com'),
+    ('Anita Desai', 'anita@example.com'),
+    ('Accounts Team', 'accounts@example.com'),
+]
+SUBJECTS = [
+    'Invoice for March',
+    'Project status update',
+    'Meeting notes from Monday',
+    'Your pull request was merged',
+    'Lunch tomorrow?',
+    'Quarterly review schedule',
+]
+WEATHER = {
+    'delhi': {'temp': 303.15, 'feels_like': 305.0, 'humidity': 40, 'wind': 3.2, 'description': 'haze'},
+    'mumbai': {'temp': 301.15, 'feels_like': 304.0, 'humidity': 78, 'wind': 5.1, 'description': 'light rain'},
+    'bangalore': {'temp': 296.15, 'feels_like': 296.0, 'humidity': 60, 'wind': 4.0, 'description': 'scattered clouds'},
+}
+
+
+class FakeMailbox:
+    def __init__(self, size: int):
+        self.history_id = 1000 + size
+        self.messages = []  # newest first
+        for n in range(size):
+            name, email = SENDERS[n % len(SENDERS)]
+            body = f"Hello,\n\nThis is message {n} about {SUBJECTS[n % len(SUBJECTS)].lower()}.\n\nRegards,\n{name}"
+            self.messages.append({
+                'id': f"m{n:05d}",
+                'historyId': str(self.history_id - n),
+                'snippet': body[:80],
+                'from': f"{name} <{email}>",
+                'subject': SUBJECTS[n % len(SUBJECTS)],
+                'body': body,
+                'unread': n % 3 == 0,
+                'labels': ['INBOX'] + (['UNREAD'] if n % 3 == 0 else []),
+            })
+        self.by_id = {m['id']: m for m in self.messages}
+        self.labels = [{'id': 'INBOX', 'name': 'INBOX'}, {'id': 'UNREAD', 'name': 'UNREAD'}]
+        self.drafts = []
+
+    def search(self, query: str):
+        if not query:
+            return self.messages
+        terms = query.lower().split()
+        matches = []
+        for message in self.messages:
+            text = f"{message['from']} {message['subject']} {message['body']}".lower()
+            if all(term.split(':', 1)[-1] in text for term in terms):
+                matches.append(message)
+        return matches
+
+
+class FakeCalendar:
+    def __init__(self):
+        ist = pytz.timezone('Asia/Kolkata')
+        today = datetime.now(ist).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.events = []
+        self.version = 0
+        for day in range(3):
+            for hour, title in ((10, 'Standup'), (15, 'Design review')):
+                start = today + timedelta(days=day, hours=hour)
+                self.add({
+                    'summary': title,
+                    'start': {'dateTime': start.isoformat()},
+                    'end': {'dateTime': (start + timedelta(minutes=30)).isoformat()},
+                })
+
+    def add(self, event):
+        self.version += 1
+        event = dict(event, id=f"e{len(self.events):04d}", status='confirmed', version=self.version)
+        self.events.append(event)
+        return event
+
+    def between(self, time_min, time_max):
+        def start_of(event):
+            return datetime.fromisoformat(event['start'].get('dateTime', event['start'].get('date')))
+        items = [
+            e for e in self.events
+            if (time_min is None or start_of(e) >= time_min) and (time_max is None or start_of(e) < time_max)
+        ]
+        return sorted(items, key=start_of)
+
+
+class FakeServices:
+    """Gmail v1 + Calendar v3 + OpenWeather stand-in on a local port."""
+
+    def __init__(self, latency_ms: float = 40, jitter_ms: float = 10, error_rate: float = 0.0, mailbox_size: int = 200, seed: int = 7):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.mailbox = FakeMailbox(mailbox_size)
+        self.calendar = FakeCalendar()
+        self.round_trips = Counter()
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    ######################################
+    # SERVER
+    ######################################
+    def start(self) -> str:
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like googleapis.com
+
+            def _handle(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                status, headers, payload = services.handle(method, self.path, self.headers, body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='fake-services', daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}/"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def snapshot(self):
+        with self._lock:
+            return sum(self.round_trips.values()), self.errors, dict(self.round_trips)
+
+    ######################################
+    # ROUTING
+    ######################################
+    def handle(self, method: str, raw_path: str, headers, body: bytes):
+        url = urlsplit(raw_path)
+        path = url.path
+        endpoint = self._endpoint(method, path)
+        with self._lock:
+            self.round_trips[endpoint] += 1
+            delay = max(0.0, self._random.gauss(self.latency, self.jitter))
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        time.sleep(delay)
+        if failed:
+            return self._json(503, {'error': {'code': 503, 'message': 'Injected failure'}})
+
+        if path.startswith('/batch'):
+            return self._batch(headers, body)
+        status, data = self.route(method, path, parse_qs(url.query), body)
+        return self._json(status, data)
+
+    def _endpoint(self, method: str, path: str) -> str:
+        if path.startswith('/batch'):
+            return 'batch'
+        # Collapse ids so counters group by endpoint
+        path = re.sub(r'/messages/(?!batchModify)[^/]+', '/messages/{id}', path)
+        path = re.sub(r'/labels/[^/]+', '/labels/{id}', path)
+        return f"{method} {path}"
+
+    def _json(self, status: int, data):
+        return status, {'Content-Type': 'application/json; charset=UTF-8'}, json.dumps(data).encode('utf-8')
+
+    def route(self, method: str, path: str, query, body: bytes):
+        arg = lambda name, default=None: query.get(name, [default])[0]
+        if path == '/data/2.5/weather':
+            return self.weather(arg('q', ''))
+
+        gmail = re.match(r'^/gmail/v1/users/me/(.*)$', path)
+        if gmail:
+            return self.gmail(method, gmail.group(1), arg, body)
+
+        calendar = re.match(r'^/calendar/v3/calendars/primary/events$', path)
+        if calendar:
+            return self.events(method, arg, body)
+
+        return 404, {'error': {'code': 404, 'message': f"No fake for {method} {path}"}}
+
+    ######################################
+    # GOOGLE BATCH
+    ######################################
+    def _batch(self, headers, body: bytes):
+        content_type = headers.get('Content-Type', '')
+        message = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + body)
+        boundary = 'batch_fake_boundary'
+        parts = []
+        for part in message.get_payload():
+            request = part.get_payload()
+            request_line, _, rest = request.partition('\r\n') if '\r\n' in request else request.partition('\n')
+            inner_method, inner_path, _ = request_line.split(' ', 2)
+            inner_body = rest.split('\r\n\r\n', 1)[1].encode('utf-8') if '\r\n\r\n' in rest else b''
+            url = urlsplit(inner_path)
+            status, data = self.route(inner_method, url.path, parse_qs(url.query), inner_body)
+            content_id = part['Content-ID'][1:-1]
+            parts.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(data)}\r\n"
+            )
+        payload = "".join(parts) + f"--{boundary}--\r\n"
+        return 200, {'Content-Type': f"multipart/mixed; boundary={boundary}"}, payload.encode('utf-8')
+
+    ######################################
+    # GMAIL
+    ######################################
+    def gmail(self, method: str, rest: str, arg, body: bytes):
+        mailbox = self.mailbox
+        if rest == 'messages' and method == 'GET':
+            matches = mailbox.search(arg('q', ''))[:int(arg('maxResults', 100))]
+            return 200, {'messages': [{'id': m['id'], 'threadId': m['id']} for m in matches]}
+
+        if rest == 'messages/batchModify' and method == 'POST':
+            request = json.loads(body or b'{}')
+            for message_id in request.get('ids', []):
+                message = mailbox.by_id.get(message_id)
+                if message is not None:
+                    message['labels'] = sorted(set(message['labels']) | set(request.get('addLabelIds', [])))
+            return 200, {}
+
+        match = re.match(r'^messages/([^/]+)$', rest)
+        if match and method == 'GET':
+            message = mailbox.by_id.get(match.group(1))
+            if message is None:
+                return 404, {'error': {'code': 404, 'message': 'Not Found'}}
+            if arg('format') == 'metadata':
+                return 200, {
+                    'id': message['id'],
+                    'historyId': message['historyId'],
+                    'snippet': message['snippet'],
+                    'payload': {'headers': [
+                        {'name': 'From', 'value': message['from']},
+                        {'name': 'Subject', 'value': message['subject']},
+                    ]},
+                }
+            data = base64.urlsafe_b64encode(message['body'].encode('utf-8')).decode('ascii')
+            return 200, {
+                'id': message['id'],
+                'payload': {
+                    'mimeType': 'multipart/alternative',
+                    'headers': [
+                        {'name': 'From', 'value': message['from']},
+                        {'name': 'Subject', 'value': message['subject']},
+                    ],
+                    'parts': [{'partId': '0', 'mimeType': 'text/plain', 'body': {'size': len(message['body']), 'data': data}}],
+                },
+            }
+
+        if rest == 'history' and method == 'GET':
+            # The mailbox doesn't change during a run
+            return 200, {'historyId': str(mailbox.history_id)}
+
+        if rest == 'labels' and method == 'GET':
+            return 200, {'labels': mailbox.labels}
+        if rest == 'labels' and method == 'POST':
+            label = dict(json.loads(body or b'{}'), id=f"Label_{len(mailbox.labels)}")
+            mailbox.labels.append(label)
+            return 200, label
+        if rest == 'labels/INBOX' and method == 'GET':
+            return 200, {
+                'id': 'INBOX',
+                'messagesTotal': len(mailbox.messages),
+                'messagesUnread': sum(1 for m in mailbox.messages if m['unread']),
+            }
+
+        if rest == 'drafts' and method == 'POST':
+            draft = {'id': f"d{len(mailbox.drafts):04d}", 'message': {'id': f"dm{len(mailbox.drafts):04d}"}}
+            mailbox.drafts.append(json.loads(body or b'{}'))
+            return 200, draft
+
+        return 404, {'error': {'code': 404, 'message': f"No fake for Gmail {method} {rest}"}}
+
+    ######################################
+    # CALENDAR
+    ######################################
+    def events(self, method: str, arg, body: bytes):
+        calendar = self.calendar
+        if method == 'POST':
+            return 200, calendar.add(json.loads(body or b'{}'))
+
+        sync_token = arg('syncToken')
+        if sync_token:
+            since = int(sync_token.split('-')[1])
+            items = [e for e in calendar.events if e['version'] > since]
+        else:
+            time_min, time_max = arg('timeMin'), arg('timeMax')
+            items = calendar.between(
+                datetime.fromisoformat(time_min) if time_min else None,
+                datetime.fromisoformat(time_max) if time_max else None,
+            )
+        return 200, {'items': items, 'nextSyncToken': f"sync-{calendar.version}"}
+
+    ######################################
+    # OPENWEATHER
+    ######################################
+    def weather(self, location: str):
+        city = location.split(',')[0].strip().lower()
+        data = WEATHER.get(city)
+        if data is None:
+            return 404, {'cod': '404', 'message': 'city not found'}
+        return 200, {
+            'name': city.title(),
+            'main': {'temp': data['temp'], 'feels_like': data['feels_like'], 'humidity': data['humidity']},
+            'weather': [{'description': data['description']}],
+            'wind': {'speed': data['wind']},
+            'cod': 200,
+        }
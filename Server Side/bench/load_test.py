@@ -0,0 +1,283 @@
+# load_test.py
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_services import FakeServices
+from run_bench import configure, google_pool, percentile
+
+logger = logging.getLogger("voice-assistant-bench")
+
+######################################
+# MULTI-SESSION LOAD TEST
+######################################
+# A worker process runs many jobs. This starts N simulated sessions in one
+# process, sharing what prewarm() shares (tool executor, Google client pool,
+# mailbox/weather/calendar caches), each with its own AssistantTools, chat
+# context and token budget, as entrypoint() builds them. STT, LLM and TTS are
+# replaced by sleeps of realistic duration; Google and OpenWeather by the
+# local fakes. For each N it records:
+#   - event-loop lag (how late a 50 ms timer fires), which is what VAD, STT
+#     streaming and audio playout would feel,
+#   - process RSS growth per session and the size of per-session tool state,
+#   - tool call latency.
+# A discarded warm-up pass runs first, so imports, connection pools and the
+# first API discovery don't land on the smallest level. The capacity report
+# names the largest N that stays within the lag and tool latency limits along
+# with every smaller level tested, for setting the worker's load threshold.
+#
+#   python bench/load_test.py --sessions 1,5,10,20,40 --turns 8
+
+LAG_INTERVAL = 0.05
+
+# One user turn per entry: (user text, tool, kwargs)
+TURN_SCRIPT = [
+    ('check my emails', 'get_email_summary', {'max_results': 5}),
+    ('read email number 1', 'get_email_details', {'email_number': '1'}),
+    ('weather in Delhi', 'get_weather', {'location': 'Delhi'}),
+    ('what is on my calendar today', 'fetch_calendar_events', {'date_query': 'today'}),
+    ('read email number 2', 'get_email_details', {'email_number': '2'}),
+    ('search emails about invoice', 'get_email_summary', {'max_results': 5, 'search_query': 'invoice'}),
+    ('weather in Mumbai', 'get_weather', {'location': 'Mumbai'}),
+    ('what about tomorrow', 'fetch_calendar_events', {'date_query': 'tomorrow'}),
+]
+
+
+class FakeLLM:
+    """Stands in for the summarizer LLM used by ContextBudget."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def chat(self, chat_ctx=None, **kwargs):
+        return _FakeStream(self.delay)
+
+
+class _FakeStream:
+    def __init__(self, delay: float):
+        self._delay = delay
+        self._sent = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._sent:
+            raise StopAsyncIteration
+        await asyncio.sleep(self._delay)
+        self._sent = True
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="The user checked emails, weather and calendar."))])
+
+    async def aclose(self):
+        pass
+
+
+def deep_size(obj, seen=None) -> int:
+    """Approximate bytes held by a container tree (dicts, lists, sets, strings)."""
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+
+async def monitor_lag(samples, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(time.perf_counter() - start - LAG_INTERVAL)
+
+
+async def run_session(shared, args, tool_latencies, footprints, rng):
+    from livekit.agents import llm
+    from context_budget import ContextBudget
+    from prompts import PromptLayout
+    from tools import AssistantTools
+
+    tools = AssistantTools(**shared)
+    layout = PromptLayout()
+    chat_ctx = layout.session_context(layout.volatile_facts(await tools.get_current_date()))
+    budget = ContextBudget(summarizer=FakeLLM(args.llm_ms / 1000))
+
+    # Sessions don't join in lockstep
+    await asyncio.sleep(rng.uniform(0, args.think_ms / 1000))
+    for turn in range(args.turns):
+        text, tool, kwargs = TURN_SCRIPT[turn % len(TURN_SCRIPT)]
+        await asyncio.sleep(args.stt_ms / 1000)
+        chat_ctx.append(role="user", text=text)
+        tools.prefetch_for_input(text)
+        budget.apply(chat_ctx)
+        await asyncio.sleep(args.llm_ms / 1000)
+
+        start = time.perf_counter()
+        result = await getattr(tools, tool)(**kwargs)
+        tool_latencies.append(time.perf_counter() - start)
+        chat_ctx.messages.append(llm.ChatMessage.create(text=str(result), role="tool"))
+
+        await asyncio.sleep(args.llm_ms / 1000)
+        chat_ctx.append(role="assistant", text=f"Here is what I found. {str(result)[:200]}")
+        # TTS, playout and the user's think time
+        await asyncio.sleep((args.tts_ms + args.think_ms * rng.uniform(0.5, 1.5)) / 1000)
+
+    footprints.append({
+        'tool_state': tools.current_emails.nbytes + deep_size(tools.discussed_emails),
+        'chat_context': deep_size([m.content for m in chat_ctx.messages]),
+    })
+    await tools.flush_labels()
+    tools.settle_prefetches()
+    await budget.aclose()
+
+
+async def run_level(sessions: int, args, shared, process):
+    rng = random.Random(args.seed + sessions)
+    gc.collect()
+    rss_before = process.memory_info().rss
+    lag, tool_latencies, footprints = [], [], []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_lag(lag, stop))
+
+    peak_rss = rss_before
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while not stop.is_set():
+            peak_rss = max(peak_rss, process.memory_info().rss)
+            await asyncio.sleep(0.2)
+
+    sampler = asyncio.create_task(sample_rss())
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(shared, args, tool_latencies, footprints, rng) for _ in range(sessions)))
+    duration = time.perf_counter() - start
+    stop.set()
+    await asyncio.gather(monitor, sampler)
+
+    return {
+        'sessions': sessions,
+        'duration': round(duration, 2),
+        'loop_lag_p50_ms': round(percentile(lag, 0.5) * 1000, 2),
+        'loop_lag_p99_ms': round(percentile(lag, 0.99) * 1000, 2),
+        'loop_lag_max_ms': round(max(lag) * 1000, 2),
+        'tool_p50_ms': round(percentile(tool_latencies, 0.5) * 1000, 1),
+        'tool_p95_ms': round(percentile(tool_latencies, 0.95) * 1000, 1),
+        'rss_mb': round(peak_rss / 2 ** 20, 1),
+        'rss_per_session_kb': round((peak_rss - rss_before) / sessions / 1024, 1),
+        'tool_state_kb': round(statistics.mean(f['tool_state'] for f in footprints) / 1024, 1),
+        'chat_context_kb': round(statistics.mean(f['chat_context'] for f in footprints) / 1024, 1),
+    }
+
+
+async def run(args):
+    from calendar_cache import CalendarCacheRegistry
+    from mailbox_cache import MailboxCacheRegistry
+    from tool_executor import ToolExecutor
+    from weather_cache import WeatherCache
+
+    # What prewarm() builds once per job process
+    shared = {
+        'executor': ToolExecutor(),
+        'google_clients': google_pool(),
+        'mailbox_caches': MailboxCacheRegistry(),
+        'weather_cache': WeatherCache(),
+        'calendar_caches': CalendarCacheRegistry(),
+    }
+    process = psutil.Process()
+    if args.warmup_sessions:
+        # Not reported: first-use costs would otherwise count against the first level
+        await run_level(args.warmup_sessions, args, shared, process)
+    levels = []
+    for sessions in args.sessions:
+        level = await run_level(sessions, args, shared, process)
+        levels.append(level)
+        print(
+            f"{sessions:>4} sessions: lag p99 {level['loop_lag_p99_ms']:>7.1f} ms, "
+            f"tool p95 {level['tool_p95_ms']:>7.1f} ms, RSS {level['rss_mb']:>7.1f} MB "
+            f"(+{level['rss_per_session_kb']:.0f} KB/session)"
+        )
+    shared['executor'].shutdown()
+    return levels
+
+
+def capacity(levels, max_lag_ms: float, max_tool_ms: float):
+    """Largest session count that, like every smaller level tested, stays within the limits."""
+    max_sessions = 0
+    for level in sorted(levels, key=lambda level: level['sessions']):
+        if level['loop_lag_p99_ms'] > max_lag_ms or level['tool_p95_ms'] > max_tool_ms:
+            break
+        max_sessions = level['sessions']
+    return max_sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test N simulated sessions in one worker process.")
+    parser.add_argument('--sessions', default='1,5,10,20,40', help="Comma-separated session counts")
+    parser.add_argument('--turns', type=int, default=8)
+    parser.add_argument('--warmup-sessions', type=int, default=1, help="Sessions in the discarded warm-up pass; 0 skips it")
+    parser.add_argument('--stt-ms', type=float, default=300)
+    parser.add_argument('--llm-ms', type=float, default=400)
+    parser.add_argument('--tts-ms', type=float, default=250)
+    parser.add_argument('--think-ms', type=float, default=1500)
+    parser.add_argument('--latency-ms', type=float, default=60, help="Latency of the fake APIs")
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--mailbox-size', type=int, default=200)
+    parser.add_argument('--max-lag-ms', type=float, default=50, help="Event-loop lag p99 a healthy worker stays under")
+    parser.add_argument('--max-tool-ms', type=float, default=1500, help="Tool latency p95 a healthy worker stays under")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--report', default='capacity_report.json')
+    args = parser.parse_args()
+    args.sessions = [int(n) for n in args.sessions.split(',') if n.strip()]
+
+    logging.basicConfig(level=logging.WARNING)
+    services = FakeServices(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        mailbox_size=args.mailbox_size,
+        seed=args.seed,
+    )
+    configure(services.start())
+    try:
+        levels = asyncio.run(run(args))
+    finally:
+        services.stop()
+
+    max_sessions = capacity(levels, args.max_lag_ms, args.max_tool_ms)
+    tested = max(args.sessions)
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k != 'report'},
+        'levels': levels,
+        'max_healthy_sessions': max_sessions,
+        'limit_reached': max_sessions < tested,
+    }
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if max_sessions == 0:
+        print("No tested level stayed within the limits")
+    elif max_sessions < tested:
+        print(f"Capacity: {max_sessions} concurrent sessions per process (limits hit above that)")
+    else:
+        print(f"Capacity: at least {max_sessions} concurrent sessions per process; test higher counts to find the limit")
+    print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
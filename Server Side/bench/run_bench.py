@@ -0,0 +1,226 @@
+# run_bench.py
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_services import FakeServices
+from scenarios import SCENARIOS
+
+logger = logging.getLogger("voice-assistant-bench")
+
+######################################
+# OFFLINE TOOL BENCHMARK
+######################################
+# Replays the scripted scenarios against AssistantTools wired to the local
+# fakes, records per-scenario latency and upstream round trips, and compares
+# them with a stored baseline:
+#
+#   python bench/run_bench.py                      # run and compare
+#   python bench/run_bench.py --update-baseline    # accept the current numbers
+#
+# Exits with status 1 when a scenario's p50/p95 latency or its round trips
+# regress beyond the tolerance, and with status 2 when there is nothing valid
+# to compare against: no baseline file, or one recorded with a different fake
+# configuration (latency, jitter, error rate, mailbox size, seed, iterations). The
+# committed bench/baseline.json uses the defaults.
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+LATENCY_SLACK = 0.010  # Absolute seconds allowed on top of the relative tolerance
+ROUND_TRIP_SLACK = 0.5
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def configure(base_url: str):
+    """Point the agent's clients at the fakes before tools.py is imported."""
+    os.environ['GOOGLE_API_ROOT_URL'] = base_url
+    os.environ['OPENWEATHER_URL'] = f"{base_url}data/2.5/weather"
+    os.environ.setdefault('OPENWEATHER_API_KEY', 'bench')
+
+
+def google_pool():
+    from google.oauth2.credentials import Credentials
+    from google_clients import GoogleClientPool
+
+    pool = GoogleClientPool()
+    # Never expires, so the pool never tries to refresh against Google
+    pool.set_credentials(Credentials(token='bench-token', client_id='bench'))
+    pool.warm()
+    return pool
+
+
+async def run_scenario(steps, executor, pool):
+    from calendar_cache import CalendarCacheRegistry
+    from mailbox_cache import MailboxCacheRegistry
+    from tools import AssistantTools
+    from weather_cache import WeatherCache
+
+    # A fresh session with cold per-user caches, as on a new job process
+    tools = AssistantTools(
+        executor=executor,
+        google_clients=pool,
+        mailbox_caches=MailboxCacheRegistry(),
+        weather_cache=WeatherCache(),
+        calendar_caches=CalendarCacheRegistry(),
+    )
+    step_times = []
+    start = time.perf_counter()
+    for step in steps:
+        step_start = time.perf_counter()
+        if step[0] == 'say':
+            tools.prefetch_for_input(step[1])
+            continue
+        if step[0] == 'call':
+            await getattr(tools, step[1])(**step[2])
+        elif step[0] == 'parallel':
+            calls = [
+                SimpleNamespace(function_info=SimpleNamespace(name=name), arguments=kwargs)
+                for name, kwargs in step[1]
+            ]
+            tools.dispatch_calls(calls)
+            # The agent still awaits them one by one; each claims its running task
+            for name, kwargs in step[1]:
+                await getattr(tools, name)(**kwargs)
+        step_times.append(time.perf_counter() - step_start)
+
+    await tools.flush_labels()
+    tools.settle_prefetches()
+    return time.perf_counter() - start, step_times
+
+
+async def run(args, services):
+    from tool_executor import ToolExecutor
+
+    executor = ToolExecutor()
+    pool = google_pool()
+    results = {}
+    for name, steps in SCENARIOS.items():
+        if args.scenario and name not in args.scenario:
+            continue
+        totals, trips, errors = [], [], 0
+        for _ in range(args.iterations):
+            trips_before, errors_before, _ = services.snapshot()
+            total, _ = await run_scenario(steps, executor, pool)
+            # Background work (prefetches, stale refreshes) still counts towards the scenario
+            await asyncio.sleep(0.05)
+            trips_after, errors_after, _ = services.snapshot()
+            totals.append(total)
+            trips.append(trips_after - trips_before)
+            errors += errors_after - errors_before
+
+        results[name] = {
+            'p50': round(percentile(totals, 0.5), 4),
+            'p95': round(percentile(totals, 0.95), 4),
+            'max': round(max(totals), 4),
+            'mean': round(statistics.mean(totals), 4),
+            'round_trips': round(statistics.mean(trips), 2),
+            'injected_errors': errors,
+        }
+    executor.shutdown()
+    return results
+
+
+def compare(results, baseline, tolerance: float):
+    """Regressions of the current results against the baseline, as readable lines."""
+    regressions = []
+    for name, current in results.items():
+        expected = baseline.get('scenarios', {}).get(name)
+        if expected is None:
+            continue
+        for metric in ('p50', 'p95'):
+            limit = expected[metric] * (1 + tolerance) + LATENCY_SLACK
+            if current[metric] > limit:
+                regressions.append(f"{name}: {metric} {current[metric]:.3f}s > {limit:.3f}s (baseline {expected[metric]:.3f}s)")
+        limit = expected['round_trips'] + ROUND_TRIP_SLACK
+        if current['round_trips'] > limit:
+            regressions.append(f"{name}: {current['round_trips']} round trips > baseline {expected['round_trips']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AssistantTools against local Gmail/Calendar/OpenWeather fakes.")
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=40)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--mailbox-size', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--scenario', action='append', help="Run only this scenario (repeatable)")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative latency regression")
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--output', help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    services = FakeServices(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        mailbox_size=args.mailbox_size,
+        seed=args.seed,
+    )
+    configure(services.start())
+    try:
+        results = asyncio.run(run(args, services))
+    finally:
+        services.stop()
+
+    print(f"{'scenario':<24}{'p50':>9}{'p95':>9}{'max':>9}{'trips':>8}{'errors':>8}")
+    for name, r in results.items():
+        print(f"{name:<24}{r['p50']:>9.3f}{r['p95']:>9.3f}{r['max']:>9.3f}{r['round_trips']:>8}{r['injected_errors']:>8}")
+
+    report = {
+        'config': {
+            'iterations': args.iterations,
+            'latency_ms': args.latency_ms,
+            'jitter_ms': args.jitter_ms,
+            'error_rate': args.error_rate,
+            'mailbox_size': args.mailbox_size,
+            'seed': args.seed,
+        },
+        'scenarios': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"ERROR no baseline at {args.baseline}; run with --update-baseline to record one")
+        return 2
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('config') != report['config']:
+        print(f"ERROR baseline was recorded with {baseline.get('config')}, not {report['config']}; "
+              f"rerun with the baseline's settings or record a new one")
+        return 2
+    missing = sorted(set(results) - set(baseline.get('scenarios', {})))
+    if missing:
+        print(f"Warning: no baseline for {', '.join(missing)}; record one with --update-baseline")
+
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+# scenarios.py
+
+######################################
+# SCRIPTED TOOL-CALL SEQUENCES
+######################################
+# Each scenario is a list of steps replayed against one fresh AssistantTools
+# session. A step is:
+#   ('say', text)               a user turn: starts the intent prefetch, like before_llm
+#   ('call', tool, kwargs)      one tool call, awaited
+#   ('parallel', [(tool, kwargs), ...])
+#                               calls the LLM issued in one response, dispatched together
+
+SCENARIOS = {
+    'inbox_read_draft': [
+        ('say', 'check my emails'),
+        ('call', 'get_email_summary', {'max_results': 5}),
+        ('say', 'read email number 2'),
+        ('call', 'get_email_details', {'email_number': '2'}),
+        ('say', 'write a reply to him'),
+        ('call', 'create_draft', {'to': '2', 'subject': 'Re: update', 'body': 'Thanks, noted.'}),
+    ],
+    'inbox_repeat_check': [
+        ('call', 'get_email_summary', {'max_results': 5}),
+        ('call', 'get_email_summary', {'max_results': 5}),
+        ('call', 'get_email_details', {'email_number': '1'}),
+        ('call', 'get_email_details', {'email_number': '1'}),
+    ],
+    'email_search': [
+        ('call', 'get_email_summary', {'max_results': 5}),
+        ('call', 'get_email_summary', {'max_results': 5, 'search_query': 'invoice'}),
+        ('call', 'get_email_summary', {'max_results': 5, 'search_query': 'from:github'}),
+    ],
+    'calendar_day': [
+        ('say', 'what is on my calendar today'),
+        ('call', 'fetch_calendar_events', {'date_query': 'today'}),
+        ('call', 'create_calendar_event', {'summary': 'Bench sync', 'start_time': '11:00 AM', 'end_time': '11:30 AM', 'date': 'tomorrow'}),
+        ('call', 'fetch_calendar_events', {'date_query': 'tomorrow'}),
+    ],
+    'weather_repeat': [
+        ('call', 'get_weather', {'location': 'Delhi'}),
+        ('call', 'get_weather', {'location': 'new delhi'}),
+        ('call', 'get_weather', {'location': 'Mumbai'}),
+        ('call', 'get_weather', {'location': 'Atlantis'}),
+    ],
+    'weather_and_meetings': [
+        ('say', 'weather in Bangalore and my meetings today?'),
+        ('parallel', [
+            ('get_weather', {'location': 'Bangalore'}),
+            ('fetch_calendar_events', {'date_query': 'today'}),
+        ]),
+    ],
+}
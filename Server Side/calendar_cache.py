@@ -0,0 +1,312 @@
+# calendar_cache.py
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import pytz
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger("voice-assistant-tools")
+
+######################################
+# CALENDAR WINDOW CACHE
+######################################
+# Keeps the user's primary calendar from today through the next N days in
+# memory. The window is loaded once with a full events.list and then kept
+# current with the Calendar API's syncToken, which returns only events that
+# changed since the previous sync. Between syncs, questions about dates inside
+# the window are answered without any network call, and events we create are
+# written through so they show up immediately.
+#
+# Deltas cover the whole calendar, so only events overlapping the window are
+# kept. Google doesn't promise a sync token for a time-bounded list; without
+# one, or when the token expires (410), the window is loaded again, no more
+# often than the sync interval. A
+# sync runs outside the lock: one caller talks to Google while concurrent
+# callers wait for its result (single flight, as in the weather cache).
+#
+# With a SharedCache, each sync publishes the window under "calendar:<user>"
+# for one sync interval, and a process whose window is due for a sync first
+# adopts a newer window published by another job process for the same user.
+#
+# Configuration (environment):
+#   CALENDAR_CACHE_DAYS           days after today kept in the window (default 7)
+#   CALENDAR_SYNC_INTERVAL        seconds between incremental syncs (default 60)
+
+DEFAULT_WINDOW_DAYS = 7
+DEFAULT_SYNC_INTERVAL = 60
+
+IST = pytz.timezone('Asia/Kolkata')
+
+EVENT_FIELDS = 'items(id,status,summary,start,end),nextPageToken,nextSyncToken'
+
+
+def event_bounds(event):
+    """Start and end of an event as aware datetimes; all-day events span whole IST days."""
+    def parse(value):
+        if 'dateTime' in value:
+            return datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+        return IST.localize(datetime.strptime(value['date'], '%Y-%m-%d'))
+
+    start = parse(event['start'])
+    end = parse(event['end']) if 'end' in event else start
+    return start, end
+
+
+class CalendarCache:
+    """Events of one user's primary calendar for a rolling window starting today."""
+
+    def __init__(self, days: int = None, sync_interval: float = None, shared=None, namespace: str = 'calendar'):
+        self.days = days or int(os.environ.get('CALENDAR_CACHE_DAYS', DEFAULT_WINDOW_DAYS))
+        self.sync_interval = sync_interval if sync_interval is not None else float(
+            os.environ.get('CALENDAR_SYNC_INTERVAL', DEFAULT_SYNC_INTERVAL))
+
+        self.window_start = None
+        self.window_end = None
+        self._events = {}  # event id -> event resource
+        self._sync_token = None
+        self._synced_at = 0.0  # Wall-clock time, comparable with windows synced by other processes
+        self._inflight = None  # Future of the sync under way, shared by concurrent callers
+        self._written = {}  # Events written through while that sync is in flight
+        self._lock = threading.Lock()
+        self._shared = shared
+        self._namespace = namespace
+
+        self.hits = 0
+        self.misses = 0
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self.shared_loads = 0
+
+    ######################################
+    # WINDOW
+    ######################################
+    def _today(self):
+        return datetime.now(IST).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def covers(self, start_time: datetime, end_time: datetime) -> bool:
+        """True when a date range lies inside the window this cache keeps (today + N days)."""
+        today = self._today()
+        covered = today <= start_time and end_time <= today + timedelta(days=self.days + 1)
+        with self._lock:
+            if covered:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return covered
+
+    def refresh(self, service):
+        """Bring the window up to date: full load when the day rolled over, else syncToken deltas.
+
+        The lock is never held across a Google request: one caller syncs while
+        concurrent callers wait for its result instead of queueing up syncs.
+        """
+        with self._lock:
+            today = self._today()
+            # A window for today is synced at most once per interval, whether by delta or reload
+            if self.window_start == today and time.time() - self._synced_at < self.sync_interval:
+                return
+            reload = self._sync_token is None or self.window_start != today
+            synced_at = self._synced_at
+            flight = self._inflight
+            leader = flight is None
+            if leader:
+                flight = self._inflight = Future()
+                sync_token = self._sync_token
+
+        if not leader:
+            flight.result()
+            return
+        try:
+            if not self._adopt_shared(today, synced_at):
+                if reload:
+                    self._full_sync(service, today)
+                else:
+                    self._incremental_sync(service, today, sync_token)
+                self._publish()
+        except Exception as e:
+            with self._lock:
+                self._inflight = None
+                self._written.clear()
+            flight.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight = None
+            self._written.clear()
+        flight.set_result(None)
+
+    def _adopt_shared(self, today, synced_at: float) -> bool:
+        """Take over a window for today that another process synced more recently than we did."""
+        if self._shared is None:
+            return False
+        snapshot = self._shared.get(self._namespace, 'window')
+        if (
+            snapshot is None
+            or snapshot['window_start'] != today.isoformat()
+            or snapshot['days'] != self.days
+            or snapshot['synced_at'] <= synced_at
+        ):
+            return False
+        with self._lock:
+            self._install({event['id']: event for event in snapshot['events']}, today)
+            self._sync_token = snapshot['sync_token']
+            self._synced_at = snapshot['synced_at']
+            self.shared_loads += 1
+        return True
+
+    def _publish(self):
+        if self._shared is None:
+            return
+        with self._lock:
+            if self.window_start is None:
+                return
+            snapshot = {
+                'window_start': self.window_start.isoformat(),
+                'days': self.days,
+                'events': list(self._events.values()),
+                'sync_token': self._sync_token,
+                'synced_at': self._synced_at,
+            }
+        self._shared.set(self._namespace, 'window', snapshot, ttl=self.sync_interval)
+
+    def _install(self, events, today):
+        """Replace the window (lock held), keeping events written through while the load was in flight."""
+        events.update(self._written)
+        self._events = events
+        self.window_start = today
+        self.window_end = today + timedelta(days=self.days + 1)
+
+    def _in_window(self, event) -> bool:
+        event_start, event_end = event_bounds(event)
+        return event_end >= self.window_start and event_start < self.window_end
+
+    def _full_sync(self, service, today):
+        events = {}
+        page_token = None
+        while True:
+            response = service.events().list(
+                calendarId='primary',
+                timeMin=today.isoformat(),
+                timeMax=(today + timedelta(days=self.days + 1)).isoformat(),
+                singleEvents=True,
+                fields=EVENT_FIELDS,
+                pageToken=page_token
+            ).execute()
+            for event in response.get('items', []):
+                if event.get('status') != 'cancelled':
+                    events[event['id']] = event
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+        sync_token = response.get('nextSyncToken')
+        if sync_token is None:
+            # Not guaranteed for a time-bounded list; the next refresh loads the window again
+            logger.info("Calendar returned no sync token for the window; next refresh reloads it")
+        with self._lock:
+            self._install(events, today)
+            self._sync_token = sync_token
+            self._synced_at = time.time()
+            self.full_syncs += 1
+
+    def _incremental_sync(self, service, today, sync_token: str):
+        changes = []
+        page_token = None
+        try:
+            while True:
+                response = service.events().list(
+                    calendarId='primary',
+                    syncToken=sync_token,
+                    singleEvents=True,
+                    fields=EVENT_FIELDS,
+                    pageToken=page_token
+                ).execute()
+                changes.extend(response.get('items', []))
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    break
+        except HttpError as e:
+            if e.resp.status == 410:
+                # Sync token expired; Google requires a fresh full sync
+                logger.info("Calendar sync token expired, reloading window")
+                self._full_sync(service, today)
+                return
+            raise
+
+        with self._lock:
+            for event in changes:
+                # Deltas cover the whole calendar; keep only what falls in the window
+                if event.get('status') == 'cancelled' or not self._in_window(event):
+                    self._events.pop(event['id'], None)
+                else:
+                    self._events[event['id']] = event
+            self._sync_token = response.get('nextSyncToken', sync_token)
+            self._synced_at = time.time()
+            self.incremental_syncs += 1
+
+    ######################################
+    # READS & WRITES
+    ######################################
+    def events_between(self, start_time: datetime, end_time: datetime):
+        """Events overlapping [start_time, end_time), ordered by start like orderBy=startTime."""
+        with self._lock:
+            matches = []
+            for event in self._events.values():
+                event_start, event_end = event_bounds(event)
+                if (event_end > start_time and event_start < end_time) or event_start == start_time:
+                    matches.append((event_start, event))
+        return [event for _, event in sorted(matches, key=lambda item: item[0])]
+
+    def add(self, event):
+        """Write-through for an event we just created."""
+        with self._lock:
+            if self.window_start is None:
+                return
+            self._events[event['id']] = event
+            if self._inflight is not None:
+                # A full load already under way may not include it
+                self._written[event['id']] = event
+        self._publish()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'events': len(self._events),
+                'hits': self.hits,
+                'misses': self.misses,
+                'full_syncs': self.full_syncs,
+                'incremental_syncs': self.incremental_syncs,
+                'shared_loads': self.shared_loads,
+            }
+
+
+class CalendarCacheRegistry:
+    """Process-wide map of user key -> CalendarCache, shared by every session in the process."""
+
+    def __init__(self, shared=None, **cache_options):
+        self._shared = shared
+        self._cache_options = cache_options
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def for_user(self, user_key: str) -> CalendarCache:
+        with self._lock:
+            if user_key not in self._caches:
+                self._caches[user_key] = CalendarCache(
+                    shared=self._shared, namespace=f"calendar:{user_key}", **self._cache_options)
+            return self._caches[user_key]
+
+
+_default_registry = None
+
+
+def get_default_registry() -> CalendarCacheRegistry:
+    """Process-wide registry used when a session isn't handed one explicitly."""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = CalendarCacheRegistry()
+    return _default_registry
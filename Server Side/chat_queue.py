@@ -0,0 +1,164 @@
+# chat_queue.py
+
+import asyncio
+import logging
+import os
+from collections import deque
+
+logger = logging.getLogger("voice-assistant")
+
+######################################
+# INBOUND CHAT QUEUE
+######################################
+# Typed messages arrive on the data channel as fast as a client can send them.
+# Starting an LLM stream per packet lets a burst of messages race each other
+# for agent.say. Instead each participant gets a small bounded queue that is
+# drained in order by a single worker:
+#   - a message is answered right away; a follow-up sent within the merge
+#     window, while that answer is still being generated or spoken, replaces
+#     it with one answer to both,
+#   - otherwise a new message supersedes the answer still being generated or
+#     spoken,
+#   - when the queue is full the oldest waiting message is dropped.
+#
+# Configuration (environment):
+#   CHAT_QUEUE_MAX_DEPTH  waiting messages kept per participant (default 5)
+#   CHAT_MERGE_WINDOW     seconds a follow-up is merged into the answer in progress (default 0.6)
+
+DEFAULT_MAX_DEPTH = 5
+DEFAULT_MERGE_WINDOW = 0.6
+
+
+class _ParticipantQueue:
+    def __init__(self, max_depth: int):
+        self.pending = deque()
+        self.max_depth = max_depth
+        self.worker = None
+        self.answer = None  # Task generating the current answer
+        self.answer_texts = []  # Messages that answer covers
+        self.answer_started = 0.0  # Loop time it started
+        self.speech = None  # SpeechHandle of the current answer
+
+
+def _speaking(speech) -> bool:
+    """Whether a SpeechHandle is still playing (or waiting to play)."""
+    return not speech.interrupted and not speech.join().done()
+
+
+class ChatInbox:
+    """Per-participant bounded, ordered, merging queue in front of the chat answer handler."""
+
+    def __init__(self, handler, max_depth: int = None, merge_window: float = None):
+        # handler(text) -> awaitable SpeechHandle (or None)
+        self._handler = handler
+        self.max_depth = max_depth or int(os.environ.get('CHAT_QUEUE_MAX_DEPTH', DEFAULT_MAX_DEPTH))
+        self.merge_window = merge_window if merge_window is not None else float(
+            os.environ.get('CHAT_MERGE_WINDOW', DEFAULT_MERGE_WINDOW))
+        self._queues = {}
+
+        self.received = 0
+        self.dropped = 0
+        self.merged = 0
+        self.superseded = 0
+
+    def put(self, identity: str, text: str):
+        """Queue a message from the room's event callback (sync, on the event loop)."""
+        queue = self._queues.get(identity)
+        if queue is None:
+            queue = self._queues[identity] = _ParticipantQueue(self.max_depth)
+
+        self.received += 1
+        queue.pending.append(text)
+        if not self._merge_into_answer(queue):
+            # The user moved on; stop generating or speaking the previous answer
+            self._supersede(queue)
+        while len(queue.pending) > queue.max_depth:
+            queue.pending.popleft()
+            self.dropped += 1
+            logger.warning(f"Chat queue full for {identity}, dropped oldest message")
+
+        if queue.worker is None or queue.worker.done():
+            queue.worker = asyncio.create_task(self._drain(identity, queue))
+
+    def _merge_into_answer(self, queue: _ParticipantQueue) -> bool:
+        """A quick follow-up: restart the answer in progress as one answer to both messages."""
+        if not queue.answer_texts or asyncio.get_running_loop().time() - queue.answer_started >= self.merge_window:
+            return False
+        answer, speech = queue.answer, queue.speech
+        if answer is not None and not answer.done():
+            answer.cancel()
+        elif speech is not None and _speaking(speech) and speech.allow_interruptions:
+            speech.interrupt()
+        else:
+            return False
+        queue.speech = None
+        queue.pending.extendleft(reversed(queue.answer_texts))
+        queue.answer_texts = []
+        return True
+
+    def _supersede(self, queue: _ParticipantQueue):
+        superseded = False
+        if queue.answer is not None and not queue.answer.done():
+            queue.answer.cancel()
+            superseded = True
+        if queue.speech is not None and _speaking(queue.speech):
+            try:
+                queue.speech.interrupt()
+                superseded = True
+            except RuntimeError:
+                # Speech that doesn't allow interruptions plays out
+                pass
+        queue.speech = None
+        if superseded:
+            self.superseded += 1
+
+    async def _drain(self, identity: str, queue: _ParticipantQueue):
+        while queue.pending:
+            # Messages that arrived in the same tick are one turn
+            await asyncio.sleep(0)
+            texts = list(queue.pending)
+            queue.pending.clear()
+            if not texts:
+                continue
+            self.merged += len(texts) - 1
+
+            answer = queue.answer = asyncio.create_task(self._handler("\n".join(texts)))
+            queue.answer_texts = texts
+            queue.answer_started = asyncio.get_running_loop().time()
+            try:
+                # wait() rather than await, so a superseded answer doesn't cancel this worker
+                await asyncio.wait({answer})
+            except asyncio.CancelledError:
+                answer.cancel()
+                raise
+            finally:
+                queue.answer = None
+
+            if answer.cancelled():
+                logger.debug(f"Chat answer for {identity} superseded by a newer message")
+            elif answer.exception() is not None:
+                logger.error(f"Error answering chat message from {identity}: {answer.exception()}")
+            else:
+                queue.speech = answer.result()
+
+    def depth(self, identity: str = None) -> int:
+        if identity is not None:
+            queue = self._queues.get(identity)
+            return len(queue.pending) if queue else 0
+        return sum(len(queue.pending) for queue in self._queues.values())
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'depth': self.depth(),
+            'dropped': self.dropped,
+            'merged': self.merged,
+            'superseded': self.superseded,
+        }
+
+    async def aclose(self):
+        for queue in self._queues.values():
+            queue.pending.clear()
+            for task in (queue.answer, queue.worker):
+                if task is not None and not task.done():
+                    task.cancel()
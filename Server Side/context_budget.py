@@ -0,0 +1,189 @@
+# context_budget.py
+
+import asyncio
+import dataclasses
+import logging
+import os
+
+from livekit.agents import llm
+
+logger = logging.getLogger("voice-assistant")
+
+######################################
+# TOKEN-BUDGETED CHAT CONTEXT
+######################################
+# Without a bound, every turn of a long call (and every email body read aloud)
+# stays in the prompt, so prompt size and LLM latency grow for the whole call.
+# Before each LLM request the budget:
+#   1. replaces tool results that have already been spoken with a short
+#      reference (the tool can simply be called again),
+#   2. when the history is still over budget, folds everything older than the
+#      last N user turns into a running summary.
+# The summary itself is written by the LLM in a background task; until it is
+# ready the folded turns are represented by a cheap extractive digest, so the
+# request never waits on summarization. The static prompt prefix is untouched
+# and the summary is inserted right after it.
+#
+# Configuration (environment):
+#   CHAT_TOKEN_BUDGET      approximate prompt tokens for the history (default 6000)
+#   CHAT_KEEP_TURNS        most recent user turns kept verbatim (default 6)
+#   TOOL_RESULT_MAX_CHARS  spoken tool results longer than this are compacted (default 600)
+
+DEFAULT_TOKEN_BUDGET = 6000
+DEFAULT_KEEP_TURNS = 6
+DEFAULT_TOOL_RESULT_MAX_CHARS = 600
+
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+DIGEST_SNIPPET_CHARS = 160
+
+SUMMARY_INSTRUCTIONS = (
+    "Summarize this part of a voice conversation between a user and the assistant Lisa "
+    "in under 120 words. Keep names, email numbers, senders, dates, times, events created "
+    "and anything the user asked to remember. Write plain sentences, no lists."
+)
+
+
+def estimate_tokens(text) -> int:
+    """Rough token count: ~4 chars per token for ASCII, ~2 for Devanagari and other scripts."""
+    if not isinstance(text, str):
+        return 0
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return ascii_chars // 4 + (len(text) - ascii_chars) // 2 + 4
+
+
+def message_key(message):
+    return getattr(message, 'id', None) or id(message)
+
+
+class ContextBudget:
+    """Keeps the LLM prompt within a token budget for the length of a session."""
+
+    def __init__(self, summarizer: llm.LLM, budget_tokens: int = None, keep_turns: int = None, tool_result_max_chars: int = None):
+        self._summarizer = summarizer
+        self.budget_tokens = budget_tokens or int(os.environ.get('CHAT_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET))
+        self.keep_turns = keep_turns or int(os.environ.get('CHAT_KEEP_TURNS', DEFAULT_KEEP_TURNS))
+        self.tool_result_max_chars = tool_result_max_chars or int(
+            os.environ.get('TOOL_RESULT_MAX_CHARS', DEFAULT_TOOL_RESULT_MAX_CHARS))
+
+        self._summary = ""
+        self._pending = []  # Folded messages not yet covered by the LLM summary
+        self._folded = set()  # Keys of messages folded out of the history
+        self._compacted = {}  # Key of spoken tool result -> compact reference text
+        self._task = None
+
+    def apply(self, chat_ctx: llm.ChatContext, allow_fold: bool = True):
+        """Rewrite `chat_ctx.messages` in place to fit the budget."""
+        messages = [
+            m for m in chat_ctx.messages
+            if message_key(m) not in self._folded and not self._is_summary(m)
+        ]
+        prefix_end = 0
+        while prefix_end < len(messages) and messages[prefix_end].role == "system":
+            prefix_end += 1
+        prefix, history = messages[:prefix_end], messages[prefix_end:]
+
+        history = self._compact_tool_results(history)
+
+        if allow_fold and self._tokens(prefix) + self._tokens(history) > self.budget_tokens:
+            turn_starts = [i for i, m in enumerate(history) if m.role == "user"]
+            if len(turn_starts) > self.keep_turns:
+                cut = turn_starts[-self.keep_turns]
+                self._fold(history[:cut])
+                history = history[cut:]
+
+        summary = self._summary_message()
+        chat_ctx.messages[:] = prefix + ([summary] if summary else []) + history
+
+    ######################################
+    # TOOL RESULTS
+    ######################################
+    def _compact_tool_results(self, history):
+        # A tool result followed by an assistant reply has already been spoken
+        last_assistant = max((i for i, m in enumerate(history) if m.role == "assistant" and m.content), default=-1)
+        compacted = []
+        for i, message in enumerate(history):
+            key = message_key(message)
+            if (
+                key not in self._compacted
+                and message.role == "tool"
+                and i < last_assistant
+                and isinstance(message.content, str)
+                and len(message.content) > self.tool_result_max_chars
+            ):
+                self._compacted[key] = (
+                    f"[{message.name or 'tool'} result already spoken to the user, "
+                    f"{len(message.content)} characters omitted. Call the tool again if the details are needed.]"
+                )
+            if key in self._compacted and message.content != self._compacted[key]:
+                message = dataclasses.replace(message, content=self._compacted[key])
+            compacted.append(message)
+        return compacted
+
+    ######################################
+    # SUMMARY
+    ######################################
+    def _tokens(self, messages) -> int:
+        return sum(estimate_tokens(m.content) for m in messages)
+
+    def _is_summary(self, message) -> bool:
+        return message.role == "system" and isinstance(message.content, str) and message.content.startswith(SUMMARY_HEADER)
+
+    def _fold(self, messages):
+        self._folded.update(message_key(m) for m in messages)
+        self._pending.extend(m for m in messages if m.role in ("user", "assistant") and isinstance(m.content, str) and m.content)
+        logger.info(f"Folded {len(messages)} older messages into the conversation summary")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._summarize())
+
+    def _summary_message(self):
+        parts = [self._summary] if self._summary else []
+        # Turns the background summary doesn't cover yet, as a short digest
+        for message in self._pending:
+            speaker = "User" if message.role == "user" else "Lisa"
+            parts.append(f"{speaker}: {message.content[:DIGEST_SNIPPET_CHARS]}")
+        if not parts:
+            return None
+        return llm.ChatMessage.create(text=f"{SUMMARY_HEADER}\n" + "\n".join(parts), role="system")
+
+    async def _summarize(self):
+        while self._pending:
+            batch = list(self._pending)
+            transcript = "\n".join(
+                f"{'User' if m.role == 'user' else 'Lisa'}: {m.content}" for m in batch
+            )
+            request = llm.ChatContext().append(role="system", text=SUMMARY_INSTRUCTIONS).append(
+                role="user",
+                text=f"Previous summary:\n{self._summary or '(none)'}\n\nNew conversation:\n{transcript}",
+            )
+            try:
+                stream = self._summarizer.chat(chat_ctx=request)
+                chunks = []
+                try:
+                    async for chunk in stream:
+                        for choice in chunk.choices:
+                            if choice.delta.content:
+                                chunks.append(choice.delta.content)
+                finally:
+                    await stream.aclose()
+            except Exception as e:
+                logger.error(f"Error summarizing conversation, keeping digest: {e}")
+                return
+
+            summary = "".join(chunks).strip()
+            if not summary:
+                return
+            self._summary = summary
+            del self._pending[:len(batch)]
+
+    def snapshot(self) -> str:
+        """Summary of the folded part of the conversation (with the digest of turns not yet summarized)."""
+        summary = self._summary_message()
+        return summary.content[len(SUMMARY_HEADER) + 1:] if summary else ""
+
+    def resume(self, summary: str):
+        """Start from the summary of an earlier session of the same user."""
+        self._summary = summary
+
+    async def aclose(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
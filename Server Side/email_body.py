@@ -0,0 +1,227 @@
+# email_body.py
+
+import base64
+import codecs
+import logging
+import os
+import re
+from html.parser import HTMLParser
+
+logger = logging.getLogger("voice-assistant-tools")
+
+######################################
+# SPEAKABLE EMAIL BODIES
+######################################
+# A Gmail "full" payload is a tree of MIME parts: multipart/mixed around
+# multipart/alternative around text/plain and text/html, with attachments
+# alongside. Only one text part is ever read aloud, and only its beginning,
+# so the extractor walks the tree without decoding anything, picks the best
+# text part (plain over HTML, never attachments) and then decodes it a chunk
+# at a time: base64 -> charset -> (HTML -> text), stopping as soon as the
+# speech-length cap or the part byte cap is reached. A 2 MB newsletter costs
+# about as much as a short note.
+#
+# Gmail can't return a single inline part or a byte range of one, so the
+# message request asks only for the fields the walk needs. Parts Gmail sends
+# by attachment id instead of inline (attachments, and very large bodies)
+# never come with it; when the chosen text part is one of those, only that
+# part is fetched, through the `fetch_data` callback. Callers are told when
+# either cap cut the text short, so the end of the text isn't announced as
+# the end of the email.
+#
+# Configuration (environment):
+#   EMAIL_SPEECH_MAX_CHARS  characters of body text extracted (default 12000)
+#   EMAIL_PART_MAX_BYTES    bytes of the chosen text part decoded at most (default 1 MB)
+
+DEFAULT_SPEECH_MAX_CHARS = 12000
+DEFAULT_PART_MAX_BYTES = 1024 * 1024
+
+# Base64 characters decoded per step; a multiple of 4 so chunks decode independently
+CHUNK_CHARS = 16 * 1024
+MAX_DEPTH = 12
+MASK_DEPTH = 6  # Nesting levels of parts requested; real mail rarely goes past three
+
+PART_FIELDS = 'mimeType,filename,headers,body(size,data,attachmentId)'
+
+
+def _part_fields(depth: int) -> str:
+    return PART_FIELDS if depth == 0 else f"{PART_FIELDS},parts({_part_fields(depth - 1)})"
+
+
+# Partial response for messages.get(format='full'): just the part tree the walk reads,
+# no ids, labels or part ids
+BODY_FIELDS = f"payload({_part_fields(MASK_DEPTH)})"
+
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'li', 'tr', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'blockquote', 'section', 'article', 'header', 'footer', 'hr', 'pre',
+}
+SKIPPED_TAGS = {'script', 'style', 'head', 'title', 'noscript', 'template'}
+
+_SPACES = re.compile(r'[ \t\r\f\v\u00a0]+')
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+
+
+def _header(part, name: str) -> str:
+    name = name.lower()
+    return next((h['value'] for h in part.get('headers', []) if h['name'].lower() == name), '')
+
+
+def _charset(part) -> str:
+    match = re.search(r'charset="?([\w.:-]+)"?', _header(part, 'Content-Type'), re.IGNORECASE)
+    charset = match.group(1) if match else 'utf-8'
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        charset = 'utf-8'
+    return charset
+
+
+def _is_attachment(part) -> bool:
+    # An attachment id alone isn't one: Gmail also sends very large bodies by id
+    return (
+        bool(part.get('filename'))
+        or _header(part, 'Content-Disposition').lower().startswith('attachment')
+    )
+
+
+def select_text_part(payload):
+    """The part to read aloud: first inline text/plain, else first inline text/html, else None."""
+    plain = html = None
+    stack = [(payload, 0)]
+    while stack and plain is None:
+        part, depth = stack.pop()
+        mime_type = part.get('mimeType', '').lower()
+        if mime_type.startswith('multipart/'):
+            if depth < MAX_DEPTH:
+                # Reversed so parts are visited in document order
+                stack.extend((child, depth + 1) for child in reversed(part.get('parts', [])))
+            continue
+        if mime_type not in ('text/plain', 'text/html') or _is_attachment(part):
+            continue
+        body = part.get('body', {})
+        if not body.get('data') and not body.get('attachmentId'):
+            continue
+        if mime_type == 'text/plain':
+            plain = part
+        elif html is None:
+            html = part
+    return plain or html
+
+
+class _TextCollector:
+    """Accumulates speakable text up to a character cap."""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.pieces = []
+        self.length = 0
+
+    @property
+    def full(self) -> bool:
+        return self.length >= self.max_chars
+
+    def add(self, text: str):
+        if text and not self.full:
+            text = text[:self.max_chars - self.length]
+            self.pieces.append(text)
+            self.length += len(text)
+
+    def text(self) -> str:
+        text = _SPACES.sub(' ', "".join(self.pieces))
+        text = "\n".join(line.strip() for line in text.split("\n"))
+        return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+class _HTMLText(HTMLParser):
+    """Incremental HTML to text: visible text only, block elements become line breaks."""
+
+    def __init__(self, collector: _TextCollector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skipping += 1
+        elif tag in BLOCK_TAGS:
+            self.collector.add("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.collector.add("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in BLOCK_TAGS:
+            self.collector.add("\n")
+
+    def handle_data(self, data):
+        if not self._skipping:
+            # Source newlines inside HTML are just whitespace
+            self.collector.add(data.replace("\n", " "))
+
+
+def _decoded_chunks(data: str):
+    """Yield the bytes of a urlsafe base64 string a chunk at a time."""
+    data = data.rstrip('=')
+    for start in range(0, len(data), CHUNK_CHARS):
+        chunk = data[start:start + CHUNK_CHARS]
+        yield base64.urlsafe_b64decode(chunk + '=' * (-len(chunk) % 4))
+
+
+def extract_speakable_text(payload, max_chars: int = None, max_part_bytes: int = None, fetch_data=None) -> str:
+    """Decode at most `max_chars` of readable text from a Gmail message payload.
+
+    `fetch_data(attachment_id)` returns the base64 data of a part Gmail sent by id;
+    without it such parts are skipped.
+    """
+    return extract_speakable_body(payload, max_chars, max_part_bytes, fetch_data)[0]
+
+
+def extract_speakable_body(payload, max_chars: int = None, max_part_bytes: int = None, fetch_data=None):
+    """Like extract_speakable_text, returning (text, cut_off): cut_off is True when a cap ended the text."""
+    max_chars = max_chars or int(os.environ.get('EMAIL_SPEECH_MAX_CHARS', DEFAULT_SPEECH_MAX_CHARS))
+    max_part_bytes = max_part_bytes or int(os.environ.get('EMAIL_PART_MAX_BYTES', DEFAULT_PART_MAX_BYTES))
+
+    part = select_text_part(payload)
+    if part is None:
+        return "", False
+    body = part['body']
+    data = body.get('data')
+    if not data:
+        if fetch_data is None:
+            return "", False
+        logger.info(f"Fetching {part['mimeType']} part of {body.get('size', 0)} bytes by attachment id")
+        data = fetch_data(body['attachmentId'])
+
+    # Only the leading bytes of an oversized part are decoded; 4 base64 characters per 3 bytes
+    limit = (max_part_bytes + 2) // 3 * 4
+    cut = len(data.rstrip('=')) * 3 // 4 > max_part_bytes
+    data = data[:limit]
+    remaining = max_part_bytes
+
+    collector = _TextCollector(max_chars)
+    html = _HTMLText(collector) if part['mimeType'].lower() == 'text/html' else None
+    decoder = codecs.getincrementaldecoder(_charset(part))(errors='replace')
+    for chunk in _decoded_chunks(data):
+        chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        text = decoder.decode(chunk)
+        if html is not None:
+            html.feed(text)
+        else:
+            collector.add(text)
+        if collector.full:
+            cut = True
+            break
+    else:
+        # A character split by the byte cap is dropped rather than spoken as a replacement
+        tail = '' if cut else decoder.decode(b'', final=True)
+        if html is not None:
+            html.feed(tail)
+            html.close()
+        else:
+            collector.add(tail)
+    return collector.text(), cut
@@ -0,0 +1,174 @@
+# email_index.py
+
+import math
+import re
+import unicodedata
+from collections import defaultdict
+
+######################################
+# LOCAL EMAIL SEARCH INDEX
+######################################
+# An in-process inverted index over the sender, subject and decoded text of
+# cached emails, so "find emails about meeting" can be answered from memory.
+# Users speak in Hindi, English and Hinglish, so tokenization keeps Devanagari
+# words intact (vowel signs and viramas included), folds a handful of common
+# Devanagari loanwords onto their English spelling and lightly stems English
+# plurals. Ranking is BM25 with per-field weights.
+
+# Latin letters/digits or a run of Devanagari (U+0900-U+097F, incl. matras)
+TOKEN_PATTERN = re.compile(r"[0-9a-z]+|[\u0900-\u097F]+")
+
+FIELD_WEIGHTS = {
+    'sender': 3.0,
+    'subject': 2.0,
+    'text': 1.0,
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words that carry no search intent in a spoken query
+STOPWORDS = {
+    'a', 'an', 'the', 'about', 'from', 'for', 'of', 'to', 'on', 'in', 'with',
+    'email', 'emails', 'mail', 'mails', 'message', 'messages', 'find', 'search',
+    'show', 'me', 'my', 'any', 'some',
+    'ka', 'ki', 'ke', 'se', 'wala', 'wali', 'wale', 'mein', 'koi', 'sab',
+    'का', 'की', 'के', 'से', 'में', 'वाला', 'वाली', 'वाले', 'कोई', 'सब',
+    'ईमेल', 'मेल', 'मैसेज',
+}
+
+# Devanagari spellings of English words people actually say when searching mail
+DEVANAGARI_ALIASES = {
+    'मीटिंग': 'meeting',
+    'मिटिंग': 'meeting',
+    'इनवॉइस': 'invoice',
+    'इनवॉयस': 'invoice',
+    'बिल': 'bill',
+    'पेमेंट': 'payment',
+    'रिपोर्ट': 'report',
+    'प्रोजेक्ट': 'project',
+    'ऑफर': 'offer',
+    'ऑर्डर': 'order',
+    'कैलेंडर': 'calendar',
+    'इंटरव्यू': 'interview',
+    'टिकट': 'ticket',
+    'बुकिंग': 'booking',
+    'डिलीवरी': 'delivery',
+    'सैलरी': 'salary',
+    'बैंक': 'bank',
+    'अपडेट': 'update',
+    'रिमाइंडर': 'reminder',
+    'ऑफिस': 'office',
+}
+
+
+def normalize_token(token: str) -> str:
+    if token in DEVANAGARI_ALIASES:
+        return DEVANAGARI_ALIASES[token]
+    # Light English stemming so "invoices" finds "invoice"
+    if token.isascii() and len(token) > 4 and token.endswith('es') and token[-3] in 'sxz':
+        return token[:-2]
+    if token.isascii() and len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str):
+    """Split mixed Hindi/English text into normalized search tokens."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFC', text).lower()
+    return [normalize_token(token) for token in TOKEN_PATTERN.findall(text)]
+
+
+def query_tokens(query: str):
+    return [token for token in tokenize(query) if token not in STOPWORDS]
+
+
+class EmailIndex:
+    """Inverted index of message id -> field term frequencies, ranked with BM25."""
+
+    def __init__(self):
+        self._postings = defaultdict(dict)  # token -> {message id: weighted term frequency}
+        self._documents = {}  # message id -> (tokens set, weighted length)
+        self._total_length = 0.0
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, message_id: str, sender: str = '', subject: str = '', text: str = ''):
+        """Index (or re-index) one message."""
+        self.remove(message_id)
+
+        frequencies = defaultdict(float)
+        length = 0.0
+        for field, value in (('sender', sender), ('subject', subject), ('text', text)):
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(value):
+                frequencies[token] += weight
+                length += weight
+
+        for token, frequency in frequencies.items():
+            self._postings[token][message_id] = frequency
+        self._documents[message_id] = (set(frequencies), length)
+        self._total_length += length
+
+    def remove(self, message_id: str):
+        document = self._documents.pop(message_id, None)
+        if document is None:
+            return
+        tokens, length = document
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(message_id, None)
+                if not postings:
+                    del self._postings[token]
+        self._total_length -= length
+
+    def clear(self):
+        self._postings.clear()
+        self._documents.clear()
+        self._total_length = 0.0
+
+    def search(self, query: str, limit: int = 25, candidates=None):
+        """Return message ids ranked by relevance to the query.
+
+        `candidates` optionally restricts results to a set of message ids, e.g.
+        the recent window the caller knows is fully cached. Every query token
+        must match for a message to be returned.
+        """
+        tokens = query_tokens(query)
+        if not tokens or not self._documents:
+            return []
+
+        document_count = len(self._documents)
+        average_length = self._total_length / document_count or 1.0
+        scores = None
+
+        for token in dict.fromkeys(tokens):
+            postings = self._postings.get(token, {})
+            if not postings:
+                return []
+            idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            token_scores = {}
+            for message_id, frequency in postings.items():
+                if candidates is not None and message_id not in candidates:
+                    continue
+                length = self._documents[message_id][1]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                token_scores[message_id] = idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {
+                    message_id: score + token_scores[message_id]
+                    for message_id, score in scores.items()
+                    if message_id in token_scores
+                }
+            if not scores:
+                return []
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [message_id for message_id, _ in ranked[:limit]]
@@ -0,0 +1,188 @@
+# email_state.py
+
+import os
+import threading
+from collections import OrderedDict
+
+######################################
+# PER-SESSION EMAIL STATE
+######################################
+# The numbered listing from the last email summary ("read email number 2")
+# lives as long as the session. Each email is a slotted record holding only
+# what is spoken or needed for a reply, and its body is capped to what fits a
+# spoken answer: the first EMAIL_BODY_MAX_BYTES are kept, the rest is fetched
+# again if the user asks for it and read on from where they left off, one
+# stretch of the same size at a time. A new summary replaces the listing, and the
+# bodies of the least recently read emails are dropped once the session is
+# over its byte cap, so sessions that run many searches stay flat in memory.
+#
+# Configuration (environment):
+#   EMAIL_BODY_MAX_BYTES     body bytes kept per email for speech (default 4 KB)
+#   EMAIL_SESSION_MAX_BYTES  bytes of email state kept per session (default 64 KB)
+
+DEFAULT_BODY_MAX_BYTES = 4 * 1024
+DEFAULT_SESSION_MAX_BYTES = 64 * 1024
+
+
+def truncate_for_speech(body: str, max_bytes: int):
+    """Return (head, truncated): at most `max_bytes` of UTF-8, cut at a word boundary."""
+    encoded = body.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return body, False
+    head = encoded[:max_bytes].decode('utf-8', errors='ignore')
+    cut = head.rfind(' ')
+    if cut > len(head) // 2:
+        head = head[:cut]
+    return head.rstrip(), True
+
+
+class EmailRecord:
+    """One listed email: headers for speech and replies, plus a capped body once read."""
+
+    __slots__ = (
+        'id', 'number', 'sender_name', 'sender_email', 'subject', 'snippet', 'body', 'body_truncated', 'read_to',
+    )
+
+    def __init__(self, message_id: str, number: int, entry):
+        self.id = message_id
+        self.number = number
+        self.sender_name = entry['sender_name']
+        self.sender_email = entry['sender_email']
+        self.subject = entry['subject']
+        self.snippet = entry.get('snippet', '')
+        self.body = None  # Loaded lazily by get_email_details
+        self.body_truncated = False
+        self.read_to = 0  # Characters of the full body text read aloud so far
+
+    @property
+    def nbytes(self) -> int:
+        size = len(self.sender_name) + len(self.sender_email) + len(self.subject) + len(self.snippet)
+        return size + (len(self.body) if self.body else 0)
+
+
+class SessionEmails:
+    """Numbered email listing of one session with O(1) lookup by number or id and a byte cap."""
+
+    def __init__(self, body_max_bytes: int = None, max_bytes: int = None):
+        self.body_max_bytes = body_max_bytes or int(os.environ.get('EMAIL_BODY_MAX_BYTES', DEFAULT_BODY_MAX_BYTES))
+        self.max_bytes = max_bytes or int(os.environ.get('EMAIL_SESSION_MAX_BYTES', DEFAULT_SESSION_MAX_BYTES))
+
+        self._records = []  # records[number - 1]
+        self._by_id = {}
+        self._bodies = OrderedDict()  # ids with a loaded body, least recently read first
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.evicted_bodies = 0
+
+    def replace(self, listing):
+        """Install a new listing from (message id, cached entry) pairs, numbered from 1."""
+        records = [EmailRecord(message_id, number, entry) for number, (message_id, entry) in enumerate(listing, start=1)]
+        with self._lock:
+            self._records = records
+            self._by_id = {record.id: record for record in records}
+            self._bodies.clear()
+            self._bytes = sum(record.nbytes for record in records)
+
+    def clear(self):
+        self.replace([])
+
+    def by_number(self, number):
+        """Record for a spoken number ('2' or 2), or None."""
+        try:
+            index = int(number) - 1
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            return self._records[index] if 0 <= index < len(self._records) else None
+
+    def by_id(self, message_id: str):
+        with self._lock:
+            return self._by_id.get(message_id)
+
+    def find_sender(self, name: str):
+        """First listed email whose sender name contains `name`."""
+        name = name.lower()
+        with self._lock:
+            return next((record for record in self._records if name in record.sender_name.lower()), None)
+
+    def first(self, count: int):
+        with self._lock:
+            return self._records[:count]
+
+    def set_body(self, record: EmailRecord, body: str) -> str:
+        """Keep the speakable head of a body, evicting older bodies past the session cap; returns the head."""
+        head, truncated = truncate_for_speech(body, self.body_max_bytes)
+        with self._lock:
+            if self._by_id.get(record.id) is not record:
+                # Listing was replaced meanwhile; the caller still gets its text
+                record.body, record.body_truncated, record.read_to = head, truncated, len(head)
+                return head
+            if record.body is not None:
+                self._bytes -= len(record.body)
+            record.body, record.body_truncated, record.read_to = head, truncated, len(head)
+            self._bytes += len(head)
+            self._bodies[record.id] = None
+            self._bodies.move_to_end(record.id)
+            while self._bytes > self.max_bytes and len(self._bodies) > 1:
+                old_id, _ = self._bodies.popitem(last=False)
+                old = self._by_id[old_id]
+                self._bytes -= len(old.body)
+                old.body, old.body_truncated = None, False
+                self.evicted_bodies += 1
+        return head
+
+    def next_part(self, record: EmailRecord, text: str):
+        """Next stretch of a long email's full text after what was already read; returns (part, more_left)."""
+        with self._lock:
+            start = record.read_to or len(record.body or '')
+        rest = text[start:]
+        skipped = len(rest) - len(rest.lstrip())
+        part, more = truncate_for_speech(rest[skipped:], self.body_max_bytes)
+        with self._lock:
+            record.read_to = start + skipped + len(part)
+        return part, more
+
+    def export(self, bodies: bool = True):
+        """The listing as JSON-friendly dicts, in number order, e.g. to resume a session."""
+        skipped = {'number'} if bodies else {'number', 'body', 'body_truncated', 'read_to'}
+        with self._lock:
+            return [
+                {slot: getattr(record, slot) for slot in EmailRecord.__slots__ if slot not in skipped}
+                for record in self._records
+            ]
+
+    def restore(self, exported):
+        """Reinstall a listing saved with export(), bodies included."""
+        self.replace((item['id'], item) for item in exported)
+        with self._lock:
+            for record, item in zip(self._records, exported):
+                if item.get('body') is not None:
+                    record.body, record.body_truncated = item['body'], item.get('body_truncated', False)
+                    record.read_to = item.get('read_to') or len(record.body)
+                    self._bytes += len(record.body)
+                    self._bodies[record.id] = None
+
+    def touch(self, record: EmailRecord):
+        with self._lock:
+            if record.id in self._bodies:
+                self._bodies.move_to_end(record.id)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __bool__(self):
+        return bool(self._records)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def stats(self):
+        with self._lock:
+            return {
+                'listed': len(self._records),
+                'bodies': len(self._bodies),
+                'bytes': self._bytes,
+                'evicted_bodies': self.evicted_bodies,
+            }
@@ -0,0 +1,185 @@
+# google_clients.py
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import google_auth_httplib2
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+from quota_scheduler import QuotaScheduler
+from tool_executor import check_cancelled
+
+logger = logging.getLogger("voice-assistant-tools")
+
+######################################
+# POOLED GOOGLE API CLIENTS
+######################################
+# Building a googleapiclient service means reading token.json, parsing a large
+# discovery document and opening a new httplib2 connection. The pool does the
+# first two once per job process (in prewarm) and keeps one keep-alive HTTP
+# transport per thread, because httplib2.Http is not thread-safe. Tools running
+# on the executor borrow a ready client with `gmail()` / `calendar()`. Every
+# request those clients send is paced by the pool's QuotaScheduler.
+
+GOOGLE_SCOPES = [
+    'https://mail.google.com/',
+    'https://www.googleapis.com/auth/gmail.readonly',
+    'https://www.googleapis.com/auth/gmail.modify',
+    'https://www.googleapis.com/auth/gmail.labels',
+    'https://www.googleapis.com/auth/calendar',
+    'https://www.googleapis.com/auth/calendar.readonly',
+]
+
+GOOGLE_SERVICES = [('gmail', 'v1'), ('calendar', 'v3')]
+
+DEFAULT_HTTP_TIMEOUT = 10
+
+
+class CancellableHttp(google_auth_httplib2.AuthorizedHttp):
+    """Authorized transport that won't start a request for a turn the user interrupted.
+
+    With a scheduler, each request also waits for the user's quota and is
+    retried when Google rate-limits it.
+    """
+
+    def __init__(self, credentials, http=None, scheduler: QuotaScheduler = None, user_key: str = None):
+        super().__init__(credentials, http=http)
+        self._scheduler = scheduler
+        self._user_key = user_key
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        check_cancelled()
+        send = super().request
+        if self._scheduler is None:
+            return send(uri, method, body=body, headers=headers, **kwargs)
+        return self._scheduler.call(
+            self._user_key, uri, method, body,
+            lambda: send(uri, method, body=body, headers=headers, **kwargs)
+        )
+
+
+class GoogleClientPool:
+    """Process-wide Google credentials, discovery documents and per-thread clients."""
+
+    def __init__(self, token_file: str = None, scopes=None, http_timeout: float = None, root_url: str = None,
+                 scheduler: QuotaScheduler = None):
+        self.token_file = token_file or os.environ.get('GOOGLE_TOKEN_FILE', 'token.json')
+        self.scopes = scopes or GOOGLE_SCOPES
+        self.http_timeout = http_timeout or float(os.environ.get('GOOGLE_HTTP_TIMEOUT', DEFAULT_HTTP_TIMEOUT))
+        # Lets the whole pool point at a stand-in server instead of googleapis.com
+        self.root_url = root_url or os.environ.get('GOOGLE_API_ROOT_URL')
+        self.scheduler = scheduler or QuotaScheduler()
+
+        self._credentials = None
+        self._credentials_lock = threading.Lock()
+        self._documents = {}
+        self._local = threading.local()
+
+    def warm(self):
+        """Load credentials and discovery documents up front so the first turn doesn't pay for them."""
+        self.get_credentials()
+        for api, version in GOOGLE_SERVICES:
+            self._document(api, version)
+        logger.info(f"Google client pool ready for {', '.join(api for api, _ in GOOGLE_SERVICES)}")
+
+    ######################################
+    # CREDENTIALS
+    ######################################
+    def get_credentials(self) -> Credentials:
+        """Return shared credentials, refreshing them in one place when they expire."""
+        with self._credentials_lock:
+            self._load_credentials()
+            if not self._credentials.valid and self._credentials.refresh_token:
+                logger.info("Refreshing Google credentials")
+                self._credentials.refresh(Request())
+
+            return self._credentials
+
+    def _load_credentials(self) -> Credentials:
+        if self._credentials is None:
+            self._credentials = Credentials.from_authorized_user_file(self.token_file, self.scopes)
+        return self._credentials
+
+    def set_credentials(self, credentials: Credentials):
+        """Install credentials directly, e.g. for a stand-in server that needs no token file."""
+        with self._credentials_lock:
+            self._credentials = credentials
+
+    @property
+    def user_key(self) -> str:
+        """Stable, non-secret key identifying the account behind these credentials."""
+        # Only reads the token file; never refreshes, so it is safe on the event loop
+        try:
+            with self._credentials_lock:
+                credentials = self._load_credentials()
+            identity = credentials.refresh_token or credentials.client_id or self.token_file
+        except (OSError, ValueError) as e:
+            # No usable token.json yet: key by the file, so stats and caches still work
+            logger.debug(f"No Google credentials for a user key: {e}")
+            identity = self.token_file
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16]
+
+    ######################################
+    # CLIENTS
+    ######################################
+    def _document(self, api: str, version: str) -> str:
+        key = (api, version)
+        if key not in self._documents:
+            document = get_static_doc(api, version)
+            if document is None:
+                raise RuntimeError(f"No static discovery document bundled for {api} {version}")
+            if self.root_url:
+                parsed = json.loads(document)
+                parsed['rootUrl'] = self.root_url.rstrip('/') + '/'
+                document = json.dumps(parsed)
+            self._documents[key] = document
+        return self._documents[key]
+
+    def _http(self):
+        """Keep-alive transport owned by the calling thread."""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = CancellableHttp(
+                self.get_credentials(),
+                http=httplib2.Http(timeout=self.http_timeout),
+                scheduler=self.scheduler,
+                user_key=self.user_key,
+            )
+            self._local.http = http
+            self._local.services = {}
+        return http
+
+    def service(self, api: str, version: str):
+        """Borrow a ready service client for the calling thread."""
+        # Refresh shared credentials before the request rather than on a 401 mid-turn
+        self.get_credentials()
+        http = self._http()
+        services = self._local.services
+        key = (api, version)
+        if key not in services:
+            services[key] = build_from_document(self._document(api, version), http=http)
+        return services[key]
+
+    def gmail(self):
+        return self.service('gmail', 'v1')
+
+    def calendar(self):
+        return self.service('calendar', 'v3')
+
+
+_default_pool = None
+
+
+def get_default_pool() -> GoogleClientPool:
+    """Process-wide pool used when a session isn't handed one explicitly."""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = GoogleClientPool()
+    return _default_pool
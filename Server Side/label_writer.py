@@ -0,0 +1,118 @@
+# label_writer.py
+
+import asyncio
+import logging
+import os
+import threading
+
+from quota_scheduler import BACKGROUND, with_priority
+
+logger = logging.getLogger("voice-assistant-tools")
+
+######################################
+# DEFERRED "SEEN-BY-LISA" LABELLING
+######################################
+# Reading an email aloud used to cost a labels.list and a messages.modify
+# inside the spoken turn. The label id is now resolved once per user (and the
+# label created if it doesn't exist yet), and discussed emails are queued and
+# labelled together with a single messages.batchModify after a short debounce,
+# or when the session shuts down.
+#
+# Configuration (environment):
+#   LABEL_FLUSH_DEBOUNCE  seconds to wait for more discussed emails (default 5)
+
+LISA_LABEL_NAME = 'seen-by-lisa'
+DEFAULT_DEBOUNCE_SECONDS = 5.0
+BATCH_MODIFY_LIMIT = 1000  # Gmail's maximum ids per batchModify
+
+
+class LabelWriter:
+    """Per-session queue of emails to label, flushed off the critical path."""
+
+    def __init__(self, executor, get_service, get_mailbox, debounce: float = None):
+        self._executor = executor
+        self._get_service = get_service
+        self._get_mailbox = get_mailbox
+        self.debounce = debounce if debounce is not None else float(
+            os.environ.get('LABEL_FLUSH_DEBOUNCE', DEFAULT_DEBOUNCE_SECONDS))
+
+        self._pending = []
+        self._labelled = set()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def queue(self, message_id: str):
+        """Remember that an email was discussed; safe to call from executor threads."""
+        with self._lock:
+            if message_id not in self._labelled and message_id not in self._pending:
+                self._pending.append(message_id)
+
+    def schedule_flush(self):
+        """(Re)arm the debounce timer on the event loop."""
+        loop = asyncio.get_running_loop()
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_later(self.debounce, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        """Label everything queued so far, off the event loop."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await asyncio.wrap_future(self._executor.submit(with_priority(BACKGROUND, self._flush)))
+
+    def resolve_label_id(self, service) -> str:
+        """Label id for 'seen-by-lisa', cached per user and created on first use."""
+        mailbox = self._get_mailbox()
+        label_id = mailbox.label_id(LISA_LABEL_NAME)
+        if label_id:
+            return label_id
+
+        labels = service.users().labels().list(userId='me', fields='labels(id,name)').execute()
+        label_id = next(
+            (label['id'] for label in labels.get('labels', []) if label['name'] == LISA_LABEL_NAME),
+            None
+        )
+        if label_id is None:
+            created = service.users().labels().create(
+                userId='me',
+                body={
+                    'name': LISA_LABEL_NAME,
+                    'labelListVisibility': 'labelShow',
+                    'messageListVisibility': 'show'
+                },
+                fields='id'
+            ).execute()
+            label_id = created['id']
+            logger.info(f"Created Gmail label {LISA_LABEL_NAME}")
+
+        mailbox.set_label_id(LISA_LABEL_NAME, label_id)
+        return label_id
+
+    def _flush(self):
+        with self._lock:
+            message_ids, self._pending = self._pending, []
+        if not message_ids:
+            return
+
+        try:
+            service = self._get_service()
+            label_id = self.resolve_label_id(service)
+            for start in range(0, len(message_ids), BATCH_MODIFY_LIMIT):
+                service.users().messages().batchModify(
+                    userId='me',
+                    body={
+                        'ids': message_ids[start:start + BATCH_MODIFY_LIMIT],
+                        'addLabelIds': [label_id]
+                    }
+                ).execute()
+            with self._lock:
+                self._labelled.update(message_ids)
+            logger.info(f"Labelled {len(message_ids)} discussed emails as {LISA_LABEL_NAME}")
+        except Exception as e:
+            logger.error(f"Error labelling discussed emails: {e}")
+            # The cached id may belong to a label that was deleted since
+            self._get_mailbox().forget_label_id(LISA_LABEL_NAME)
+            # Keep them queued so the next flush (or shutdown) retries
+            with self._lock:
+                self._pending = message_ids + [m for m in self._pending if m not in message_ids]
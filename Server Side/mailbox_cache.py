@@ -0,0 +1,356 @@
+# mailbox_cache.py
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from googleapiclient.errors import HttpError
+
+from email_index import EmailIndex
+
+logger = logging.getLogger("voice-assistant-tools")
+
+######################################
+# PER-USER MAILBOX CACHE
+######################################
+# Gmail messages are immutable apart from their labels, so once we have a
+# message's headers (and, after it is read aloud, its body) there is no reason
+# to download it again. The cache keeps those per user, keyed by message id,
+# with LRU eviction bounded by both entry count and approximate bytes.
+#
+# Freshness comes from history.list: starting at the last seen historyId we
+# learn which messages were added, deleted or relabelled since the previous
+# check. When nothing changed, the last listing for a query is answered
+# entirely from memory; otherwise only new ids are fetched. Every entry keeps
+# its message's historyId, so entries served from the cache (including the
+# shared tier) start the history too. Until a historyId is known, nothing
+# cached about the mailbox as a whole (the unread count) is trusted.
+#
+# Every cached message is also kept in an EmailIndex, so searches over the
+# recent window can be answered locally.
+#
+# With a SharedCache, message headers and label ids are also written through
+# to the host-wide tier under "mailbox:<user>", so another job process for
+# the same user finds them without asking Gmail. Bodies never leave the
+# process: the shared tier is a plain file on disk, so only metadata goes
+# there. Listings and history ids stay per process as well.
+#
+# Configuration (environment):
+#   MAILBOX_CACHE_MAX_MESSAGES  entries kept per user (default 500)
+#   MAILBOX_CACHE_MAX_BYTES     approximate bytes kept per user (default 8 MB)
+
+DEFAULT_MAX_MESSAGES = 500
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+HISTORY_FIELDS = (
+    'history(messagesAdded/message/id,messagesDeleted/message/id,'
+    'labelsAdded/message/id,labelsRemoved/message/id),historyId,nextPageToken'
+)
+
+
+def entry_size(entry) -> int:
+    """Approximate in-memory/wire size of a cached message."""
+    return sum(len(value) for value in entry.values() if isinstance(value, str))
+
+
+class MailboxCache:
+    """Cached message headers/bodies and query listings for one Gmail user."""
+
+    def __init__(self, max_messages: int = None, max_bytes: int = None, shared=None, namespace: str = 'mailbox'):
+        self.max_messages = max_messages or int(os.environ.get('MAILBOX_CACHE_MAX_MESSAGES', DEFAULT_MAX_MESSAGES))
+        self.max_bytes = max_bytes or int(os.environ.get('MAILBOX_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+
+        self.history_id = None
+        self.label_ids = {}  # label name -> id, e.g. 'seen-by-lisa'
+        self.unread_count = None  # INBOX messagesUnread, valid until history shows a change
+        self._entries = OrderedDict()  # message id -> entry dict
+        self._sizes = {}
+        self._listings = {}  # query -> ordered list of message ids
+        self._total_bytes = 0
+        self._index = EmailIndex()
+        self._lock = threading.RLock()
+        self._shared = shared
+        self._namespace = namespace
+
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.bytes_saved = 0
+
+    ######################################
+    # ENTRIES
+    ######################################
+    def get(self, message_id: str):
+        """Return a cached entry (a copy) or None, counting the lookup."""
+        with self._lock:
+            entry = self._entries.get(message_id)
+            if entry is not None:
+                self._entries.move_to_end(message_id)
+                self.hits += 1
+                self.bytes_saved += self._sizes[message_id]
+                self.observe_history_id(entry.get('history_id'))
+                return dict(entry)
+        entry = self._shared_entry(message_id)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._store(message_id, entry)
+            self.shared_hits += 1
+            self.bytes_saved += self._sizes[message_id]
+            return dict(entry)
+
+    def _shared_entry(self, message_id: str):
+        if self._shared is None:
+            return None
+        return self._shared.get(self._namespace, f"message:{message_id}")
+
+    def _share(self, message_id: str, entry):
+        if self._shared is not None:
+            # Metadata only; the body stays in this process's memory
+            metadata = {field: value for field, value in entry.items() if field not in ('body', 'body_cut_off')}
+            self._shared.set(self._namespace, f"message:{message_id}", metadata)
+
+    def contains(self, message_id: str) -> bool:
+        with self._lock:
+            return message_id in self._entries
+
+    def put(self, message_id: str, entry):
+        with self._lock:
+            existing = self._entries.get(message_id)
+            if existing is not None and existing.get('body') is not None and entry.get('body') is None:
+                # Never lose a body we already paid for when refreshing headers
+                entry = {**entry, 'body': existing['body'], 'body_cut_off': existing.get('body_cut_off', False)}
+            self._store(message_id, entry)
+        self._share(message_id, entry)
+
+    def get_body(self, message_id: str):
+        """Return the body of a message fetched by this process, or None."""
+        with self._lock:
+            entry = self._entries.get(message_id)
+            if entry is not None and entry.get('body') is not None:
+                self._entries.move_to_end(message_id)
+                self.hits += 1
+                self.bytes_saved += len(entry['body'])
+                return entry['body']
+            self.misses += 1
+            return None
+
+    def body_cut_off(self, message_id: str) -> bool:
+        """True when the cached body stops at the extraction cap rather than at the end of the email."""
+        with self._lock:
+            entry = self._entries.get(message_id)
+            return bool(entry and entry.get('body_cut_off'))
+
+    def set_body(self, message_id: str, body: str, cut_off: bool = False):
+        with self._lock:
+            entry = self._entries.get(message_id)
+            if entry is None:
+                return
+            entry = {**entry, 'body': body, 'body_cut_off': cut_off}
+            self._store(message_id, entry)
+        self._share(message_id, entry)
+
+    def discard(self, message_id: str):
+        with self._lock:
+            if message_id in self._entries:
+                del self._entries[message_id]
+                self._total_bytes -= self._sizes.pop(message_id)
+                self._index.remove(message_id)
+        if self._shared is not None:
+            self._shared.delete(self._namespace, f"message:{message_id}")
+
+    def _store(self, message_id: str, entry):
+        if message_id in self._entries:
+            self._total_bytes -= self._sizes[message_id]
+        size = entry_size(entry)
+        self._entries[message_id] = entry
+        self._entries.move_to_end(message_id)
+        self._sizes[message_id] = size
+        self._total_bytes += size
+        self.observe_history_id(entry.get('history_id'))
+        self._index.add(
+            message_id,
+            sender=f"{entry.get('sender_name', '')} {entry.get('sender_email', '')}",
+            subject=entry.get('subject', ''),
+            text=f"{entry.get('snippet') or ''} {entry.get('body') or ''}",
+        )
+        self._evict()
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_messages or self._total_bytes > self.max_bytes):
+            message_id, _ = self._entries.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(message_id)
+            self._index.remove(message_id)
+
+    ######################################
+    # LABELS
+    ######################################
+    def label_id(self, name: str):
+        """Cached Gmail label id for a label name, or None."""
+        with self._lock:
+            label_id = self.label_ids.get(name)
+        if label_id is None and self._shared is not None:
+            label_id = self._shared.get(self._namespace, f"label:{name}")
+            if label_id is not None:
+                with self._lock:
+                    self.label_ids[name] = label_id
+        return label_id
+
+    def set_label_id(self, name: str, label_id: str):
+        with self._lock:
+            self.label_ids[name] = label_id
+        if self._shared is not None:
+            self._shared.set(self._namespace, f"label:{name}", label_id)
+
+    def forget_label_id(self, name: str):
+        with self._lock:
+            self.label_ids.pop(name, None)
+        if self._shared is not None:
+            self._shared.delete(self._namespace, f"label:{name}")
+
+    ######################################
+    # LISTINGS & SYNC
+    ######################################
+    def listing(self, query: str):
+        with self._lock:
+            listing = self._listings.get(query)
+            return list(listing) if listing is not None else None
+
+    def set_listing(self, query: str, message_ids):
+        with self._lock:
+            self._listings[query] = list(message_ids)
+
+    def covers_listing(self, query: str) -> bool:
+        """True when the listing for `query` is known and every message in it is cached."""
+        with self._lock:
+            listing = self._listings.get(query)
+            return listing is not None and all(message_id in self._entries for message_id in listing)
+
+    def search(self, query: str, limit: int = 25, within_query: str = ''):
+        """Rank cached messages of the `within_query` listing against a free-text query.
+
+        Returns None when that listing isn't fully cached, so the caller knows to
+        ask Gmail instead of trusting a partial answer.
+        """
+        with self._lock:
+            if not self.covers_listing(within_query):
+                return None
+            return self._index.search(query, limit=limit, candidates=set(self._listings[within_query]))
+
+    def observe_history_id(self, history_id):
+        """Track the newest historyId seen on any cached message."""
+        if not history_id:
+            return
+        with self._lock:
+            if self.history_id is None or int(history_id) > int(self.history_id):
+                self.history_id = str(history_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._listings.clear()
+            self._index.clear()
+            self._total_bytes = 0
+            self.history_id = None
+            self.unread_count = None
+
+    def sync(self, service) -> bool:
+        """Apply mailbox changes since the last historyId.
+
+        Returns True when the mailbox is unchanged, meaning cached listings can be
+        served as-is. Deleted messages are dropped and any change invalidates
+        listings, whose ids are then re-listed while cached headers are reused.
+        """
+        with self._lock:
+            start_history_id = self.history_id
+            if start_history_id is None:
+                # Nothing to sync from, so nothing mailbox-wide can be vouched for either
+                self.unread_count = None
+                return False
+
+        changed = False
+        deleted = set()
+        page_token = None
+        try:
+            while True:
+                response = service.users().history().list(
+                    userId='me',
+                    startHistoryId=start_history_id,
+                    fields=HISTORY_FIELDS,
+                    pageToken=page_token
+                ).execute()
+                for record in response.get('history', []):
+                    changed = True
+                    for item in record.get('messagesDeleted', []):
+                        deleted.add(item['message']['id'])
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    break
+        except HttpError as e:
+            if e.resp.status == 404:
+                # historyId is too old to sync from; start over with a full listing
+                logger.info("Mailbox history expired, resyncing from scratch")
+                self.clear()
+                return False
+            raise
+
+        with self._lock:
+            for message_id in deleted:
+                self.discard(message_id)
+            if changed:
+                self._listings.clear()
+                self.unread_count = None
+            self.observe_history_id(response.get('historyId'))
+        return not changed
+
+    ######################################
+    # METRICS
+    ######################################
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'messages': len(self._entries),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'shared_hits': self.shared_hits,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'bytes_saved': self.bytes_saved,
+            }
+
+
+class MailboxCacheRegistry:
+    """Process-wide map of user key -> MailboxCache, shared by every session in the process."""
+
+    def __init__(self, shared=None, **cache_options):
+        self._shared = shared
+        self._cache_options = cache_options
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def for_user(self, user_key: str) -> MailboxCache:
+        with self._lock:
+            if user_key not in self._caches:
+                self._caches[user_key] = MailboxCache(
+                    shared=self._shared, namespace=f"mailbox:{user_key}", **self._cache_options)
+            return self._caches[user_key]
+
+    def stats(self):
+        with self._lock:
+            caches = dict(self._caches)
+        return {user_key: cache.stats() for user_key, cache in caches.items()}
+
+
+_default_registry = None
+
+
+def get_default_registry() -> MailboxCacheRegistry:
+    """Process-wide registry used when a session isn't handed one explicitly."""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = MailboxCacheRegistry()
+    return _default_registry
@@ -18,104 +18,114 @@ from livekit.plugins.elevenlabs import TTS as ElevenLabsTTS
 from livekit.plugins.elevenlabs import Voice, VoiceSettings
 from livekit.plugins.openai import LLM as OpenAILLM
 from tools import AssistantTools
+from prefetch import detect_intent
+from prompts import PromptCacheStats, PromptLayout
+from context_budget import ContextBudget
+from chat_queue import ChatInbox
+from tool_executor import BargeInMonitor, ToolExecutor
+from google_clients import GoogleClientPool
+from mailbox_cache import MailboxCacheRegistry
+from weather_cache import WeatherCache
+from calendar_cache import CalendarCacheRegistry
+from shared_cache import open_shared_cache
+from session_store import SessionStore, resumable_messages
+from phrase_cache import CachedTTS, PhraseCache
+from turn_timeline import LatencyRegistry, TurnLogAggregator, TurnTimeline
 import os
 
 load_dotenv()
 logger = logging.getLogger("voice-assistant")
 
+GREETING = "Hi, Welcome! How can I help you today?"
+RESUME_GREETING = "Welcome back! We can pick up where we left off."
+
 def prewarm(proc: JobProcess):
     proc.userdata["vad"] = silero.VAD.load()
+    # One bounded pool per job process so blocking tool I/O never runs on the event loop
+    proc.userdata["tool_executor"] = ToolExecutor()
+
+    # Credentials and discovery docs are loaded once here, not on every tool call
+    google_clients = GoogleClientPool()
+    try:
+        google_clients.warm()
+    except Exception as e:
+        logger.error(f"Could not prewarm Google clients, they will load on first use: {e}")
+    proc.userdata["google_clients"] = google_clients
+
+    # Every job process on this host reads and fills the same on-disk tier behind its own caches
+    shared_cache = open_shared_cache()
+    proc.userdata["shared_cache"] = shared_cache
+
+    # Mailbox state outlives a single call, so repeat checks only fetch what changed
+    proc.userdata["mailbox_caches"] = MailboxCacheRegistry(shared=shared_cache)
+    proc.userdata["weather_cache"] = WeatherCache(shared=shared_cache)
+    proc.userdata["calendar_caches"] = CalendarCacheRegistry(shared=shared_cache)
+
+    # Finished sessions wait here briefly so a participant who rejoins resumes warm
+    proc.userdata["sessions"] = SessionStore(shared=shared_cache)
+
+    # Static prompt variants are built once so their bytes never change within the process
+    proc.userdata["prompts"] = PromptLayout()
+
+    # Fixed phrases are synthesized once per voice and replayed from disk
+    proc.userdata["phrase_cache"] = PhraseCache(phrases={GREETING, RESUME_GREETING})
+
+    # Per-stage turn latencies of the sessions in this process; /metrics is served by the main process
+    proc.userdata["latency"] = LatencyRegistry()
 
 async def entrypoint(ctx: JobContext):
-    fnc_ctx = AssistantTools()
+    fnc_ctx = AssistantTools(
+        executor=ctx.proc.userdata.get("tool_executor"),
+        google_clients=ctx.proc.userdata.get("google_clients"),
+        mailbox_caches=ctx.proc.userdata.get("mailbox_caches"),
+        weather_cache=ctx.proc.userdata.get("weather_cache"),
+        calendar_caches=ctx.proc.userdata.get("calendar_caches"),
+    )
     current_date = await fnc_ctx.get_current_date()
     
-    # Base system prompt with core personality
-    base_context = llm.ChatContext().append(
-        role="system",
-        text=(
-            f"""
-    You are a multilingual real-time voice-to-voice AI Agent, and your name is Lisa.
-    Today's date is {current_date}.
-
-    Persona:
-    - Similar to Tony Stark's AI assistant EDITH
-    - Professional yet witty and tech-savvy
-    - Created by Humate AI 
-
-    Core Capabilities:
-    - Weather Information
-    - Time & Date Information
-    - Calendar Management
-    - Email Management
-
-    Language and Style:
-    - Default to Hindi (Use Simple Native hindi script but add maximum english words in the native script)
-    - Avoid complex Hindi words, prefer English alternatives
-    - Keep responses under 80 words
-    - No code discussions (voice-only interaction)
-
-    Interaction Guidelines:
-    - Remember this is a voice call - no visual elements
-    - Ask for clarification when needed
-    - Maintain EDITH-like personality traits
-    - Address creator as Humate AI
-    - Be attentive and responsive
-    - Show personality while staying professional
-    """
-        ),
-    )
-
-    # Separate capability contexts
-    email_context = """
-    Email Management Capabilities:
-    - Can read recent and unread emails
-    - Creates draft emails (saved to Gmail drafts)
-    - Labels emails as "seen-by-lisa" only when their content is specifically discussed
-    - Maintains context of which emails have been read in conversation
-    - Can search through last 25 emails but shows only top 5 results
-    - For drafts, needs:
-      * Valid email address (with @)
-      * Subject line
-      * Email content
-    - Example commands:
-      * "Check my emails"
-      * "Read email number 2"
-      * "Find emails about meeting"
-      * "Search for emails from John"
-      * "Write an email to person@example.com"
-    - All drafts saved for review in Gmail
-    """
-
-    calendar_context = """
-    Calendar Management:
-    - Can check calendar events for today, tomorrow, or specific dates
-    - Can create new calendar events
-    - For creating events, needs: event title, start time, and end time
-    - Uses 12-hour time format (e.g., 2:30 PM)
-    - Example commands:
-      * "What's on my calendar today/tomorrow?"
-      * "Schedule a meeting called [title] from [start time] to [end time]"
-    """
+    # Static prompt prefix is shared by every session; only the date is per session
+    prompts = ctx.proc.userdata.get("prompts") or PromptLayout()
+    volatile_facts = prompts.volatile_facts(current_date)
+    base_context = prompts.session_context(volatile_facts)
 
     # Function to get appropriate context based on user input
     def get_context_for_input(user_input: str) -> llm.ChatContext:
-        context = base_context.copy()
-        
-        # Email-related keywords
-        email_keywords = {'email', 'mail', 'inbox', 'draft', 'send', 'write to', 'message'}
-        # Calendar-related keywords
-        calendar_keywords = {'calendar', 'schedule', 'meeting', 'event', 'appointment'}
-        
-        user_input = user_input.lower()
-        
-        # Add relevant context based on user input
-        if any(keyword in user_input for keyword in email_keywords):
-            context.append(role="system", text=email_context)
-        elif any(keyword in user_input for keyword in calendar_keywords):
-            context.append(role="system", text=calendar_context)
-            
-        return context
+        # Add relevant capability context based on user input, ahead of the volatile facts
+        return prompts.context_for(detect_intent(user_input), base_context, volatile_facts)
+
+    def before_llm(agent: VoicePipelineAgent, chat_ctx: llm.ChatContext):
+        # Start warming the likely tool's data while the LLM is still on its first pass
+        last_message = chat_ctx.messages[-1] if chat_ctx.messages else None
+        if last_message is not None and last_message.role == "user" and isinstance(last_message.content, str):
+            fnc_ctx.prefetch_for_input(last_message.content)
+
+        # Fit this request to the token budget, and drop the same folded turns from
+        # the agent's own history so it stays bounded too
+        context_budget.apply(chat_ctx)
+        context_budget.apply(agent.chat_ctx, allow_fold=False)
+        # Returning None keeps the default LLM call
+        return None
+
+    # Use ElevenLabs TTS
+    voice_id = os.environ.get("ELEVEN_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
+    tts_model = os.environ.get("ELEVENLABS_MODEL_ID", "eleven_multilingual_v2")
+    voice_settings = VoiceSettings(stability=0.9, similarity_boost=0.9)
+    elevenlabs_tts = ElevenLabsTTS(
+        voice=Voice(
+            id=voice_id,
+            name="Rachel",
+            category="professional",
+            settings=voice_settings,
+        ),
+        model=tts_model,
+    )
+    # Cached phrase audio is only valid for the exact voice, model and settings it was made with
+    voice_key = f"elevenlabs:{voice_id}:{tts_model}:{voice_settings.stability}:{voice_settings.similarity_boost}"
+    phrase_cache = ctx.proc.userdata.get("phrase_cache") or PhraseCache(phrases={GREETING, RESUME_GREETING})
+    cached_tts = CachedTTS(elevenlabs_tts, phrase_cache, voice_key)
+    # Synthesize the greetings (if this voice hasn't cached them yet) while we wait for someone to join
+    cached_tts.warm(GREETING)
+    cached_tts.warm(RESUME_GREETING)
 
     logger.info(f"connecting to room {ctx.room.name}")
     await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
@@ -124,21 +134,26 @@ async def entrypoint(ctx: JobContext):
     participant = await ctx.wait_for_participant()
     logger.info(f"starting voice assistant for participant {participant.identity}")
 
+    # A participant rejoining within the grace period gets their listing, summary and recent turns back.
+    # Saved state belongs to the Google account, not to the identity the client picked.
+    sessions = ctx.proc.userdata.get("sessions") or SessionStore()
+    session_key = fnc_ctx.user_key
+    resumed = await fnc_ctx.run_blocking(sessions.take, session_key)
+    if resumed is not None and fnc_ctx.restore_state(resumed.get('tools', {})):
+        for message in resumed.get('messages', []):
+            base_context.append(role=message['role'], text=message['text'])
+    else:
+        resumed = None
+
     # Use Azure OpenAI LLM
     azure_llm = OpenAILLM.with_azure(
         azure_deployment=os.environ.get("AZURE_OPENAI_DEPLOYMENT"),
     )
 
-    # Use ElevenLabs TTS
-    elevenlabs_tts = ElevenLabsTTS(
-        voice=Voice(
-            id=os.environ.get("ELEVEN_VOICE_ID", "21m00Tcm4TlvDq8ikWAM"),
-            name="Rachel",
-            category="professional",
-            settings=VoiceSettings(stability=0.9, similarity_boost=0.9),
-        ),
-        model=os.environ.get("ELEVENLABS_MODEL_ID", "eleven_multilingual_v2"),
-    )
+    # Bounds prompt size over long calls; summaries are written by the same LLM in the background
+    context_budget = ContextBudget(summarizer=azure_llm)
+    if resumed is not None and resumed.get('summary'):
+        context_budget.resume(resumed['summary'])
 
     agent = VoicePipelineAgent(
         vad=ctx.proc.userdata["vad"],
@@ -146,25 +161,95 @@ async def entrypoint(ctx: JobContext):
             model="nova-2", language="hi", smart_format=True, no_delay=True
         ),
         llm=azure_llm,
-        tts=elevenlabs_tts,
+        tts=cached_tts,
         chat_ctx=base_context,
         fnc_ctx=fnc_ctx,
+        before_llm_cb=before_llm,
     )
 
     agent.start(ctx.room, participant)
 
+    # Where each turn's time goes: end of speech -> transcript -> LLM -> tools -> TTS -> playout
+    latency = ctx.proc.userdata.get("latency") or LatencyRegistry()
+    timeline = TurnTimeline(latency, ctx.room.name)
+    fnc_ctx.on_tool_finished = timeline.tool_finished
+
+    # In write-behind mode a draft or event is confirmed before Google has it; say so if it never lands
+    fnc_ctx.on_write_failed = lambda notice: asyncio.ensure_future(agent.say(notice, allow_interruptions=True))
+    fnc_ctx.resume_writes()
+
+    @agent.on("user_stopped_speaking")
+    def _on_user_stopped_speaking(*_):
+        timeline.start_turn()
+
+    @agent.on("agent_started_speaking")
+    def _on_agent_started_speaking(*_):
+        timeline.playout_started()
+
+    # An interrupted answer means whatever was prefetched for it won't be asked for
+    @agent.on("agent_speech_interrupted")
+    def _on_agent_speech_interrupted(*_):
+        fnc_ctx.settle_prefetches()
+
+    # Tool calls still fetching while the user talks over them would only be thrown away
+    BargeInMonitor(fnc_ctx.cancel_turn, fnc_ctx.tools_in_flight).attach(agent)
+
+    # Several calls in one response run side by side; the agent then claims each result
+    @agent.on("function_calls_collected")
+    def _on_function_calls_collected(function_calls):
+        fnc_ctx.dispatch_calls(function_calls)
+
     usage_collector = metrics.UsageCollector()
+    prompt_cache_stats = PromptCacheStats()
+    prompt_cache_stats.attach(azure_llm)
 
     @agent.on("metrics_collected")
     def _on_metrics_collected(mtrcs: metrics.AgentMetrics):
         metrics.log_metrics(mtrcs)
         usage_collector.collect(mtrcs)
+        prompt_cache_stats.collect(mtrcs)
+        timeline.collect(mtrcs)
 
     async def log_usage():
         summary = usage_collector.get_summary()
         logger.info(f"Usage: ${summary}")
+        logger.info(f"Mailbox cache: {fnc_ctx.get_mailbox().stats()}")
+        logger.info(f"Weather cache: {fnc_ctx.weather_stats()}")
+        logger.info(f"Calendar cache: {fnc_ctx.get_calendar_cache().stats()}")
+        shared_cache = ctx.proc.userdata.get("shared_cache")
+        if shared_cache is not None:
+            logger.info(f"Shared tool cache: {shared_cache.stats()}")
+        fnc_ctx.settle_prefetches()
+        logger.info(f"Prefetch: {fnc_ctx.prefetch_stats()}")
+        logger.info(f"Tool cancellations: {fnc_ctx.cancellation_stats()}")
+        logger.info(f"Tool dispatch: {fnc_ctx.dispatch_stats()}")
+        logger.info(f"Write-behind: {fnc_ctx.write_stats()}")
+        logger.info(f"Google quota: {fnc_ctx.quota_stats()}")
+        logger.info(f"Phrase cache: {cached_tts.stats()}")
+        logger.info(f"Prompt cache: {prompt_cache_stats.stats()}")
+        timeline.close()
+        logger.info(f"Turn latency: {timeline.turns} turns, {latency.summary()}")
+        fnc_ctx.dump_quota_counters(timeline.log_dir)
+        logger.info(f"Chat queue: {chat_inbox.stats()}")
+        logger.info(f"Resumable sessions: {sessions.stats()}")
 
+    async def save_session():
+        try:
+            await fnc_ctx.run_blocking(sessions.save, session_key, {
+                'tools': fnc_ctx.export_state(),
+                'summary': context_budget.snapshot(),
+                'messages': resumable_messages(agent.chat_ctx),
+            })
+        except Exception as e:
+            logger.error(f"Could not save session state for {participant.identity}: {e}")
+
+    ctx.add_shutdown_callback(save_session)
+    # Queued drafts and events get a last chance to land; the rest stay journalled
+    ctx.add_shutdown_callback(fnc_ctx.drain_writes)
     ctx.add_shutdown_callback(log_usage)
+    # Discussed emails are labelled in one batchModify; make sure the last ones land
+    ctx.add_shutdown_callback(fnc_ctx.flush_labels)
+    ctx.add_shutdown_callback(context_budget.aclose)
     
     # Set up data channel for text messages instead of using ChatManager
     CHAT_TOPIC = "chat"
@@ -173,26 +258,40 @@ async def entrypoint(ctx: JobContext):
     @ctx.room.on("data_received")
     def on_data_received(data_packet: rtc.DataPacket):
         if data_packet.topic == CHAT_TOPIC and data_packet.data:
+            identity = data_packet.participant.identity if data_packet.participant else "unknown"
             try:
                 # Try to decode as JSON for compatibility with ChatManager format
                 data = json.loads(data_packet.data)
                 message = data.get("message")
                 if message:
-                    asyncio.create_task(answer_from_text(message))
+                    chat_inbox.put(identity, message)
             except json.JSONDecodeError:
                 # If not JSON, use the raw data as text
-                asyncio.create_task(answer_from_text(data_packet.data.decode('utf-8')))
+                chat_inbox.put(identity, data_packet.data.decode('utf-8'))
 
     # Modify the answer_from_text function to use dynamic context
     async def answer_from_text(txt: str):
+        timeline.start_turn(source="chat")
+        fnc_ctx.prefetch_for_input(txt)
         chat_ctx = get_context_for_input(txt)
         chat_ctx.append(role="user", text=txt)
-        stream = agent.llm.chat(chat_ctx=chat_ctx)
-        await agent.say(stream)
+        context_budget.apply(chat_ctx)
+        # The agent runs the tools the answer calls, which claim the prefetch above
+        stream = agent.llm.chat(chat_ctx=chat_ctx, fnc_ctx=fnc_ctx)
+        return await agent.say(stream)
+
+    # Bursts of typed messages are answered in order, merged, and never pile up
+    chat_inbox = ChatInbox(answer_from_text)
+    ctx.add_shutdown_callback(chat_inbox.aclose)
 
-    await agent.say("Hi, Welcome! How can I help you today?", allow_interruptions=True)
+    await agent.say(RESUME_GREETING if resumed is not None else GREETING, allow_interruptions=True)
 
 if __name__ == "__main__":
+    # One host-wide /metrics, fed by the turn logs and counters the job processes write
+    try:
+        TurnLogAggregator().serve()
+    except Exception as e:
+        logger.error(f"Could not start the latency metrics endpoint: {e}")
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
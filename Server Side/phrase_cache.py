@@ -0,0 +1,311 @@
+# phrase_cache.py
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from livekit import rtc
+from livekit.agents import tts, utils
+
+logger = logging.getLogger("voice-assistant")
+
+######################################
+# PRE-SYNTHESIZED PHRASE AUDIO
+######################################
+# Fixed phrases (the greeting) used to be sent to ElevenLabs on every call.
+# CachedTTS wraps the real TTS: when `agent.say` synthesizes a registered
+# phrase, the PCM is served from a disk cache keyed by voice, model, settings
+# and output format; the first time, the real TTS is used and its frames are
+# stored.
+#
+# The agent always synthesizes through tts.stream(), even for a plain string,
+# so the cache sits in the stream: pushed text is held back only while it is
+# still the beginning of a registered phrase. A segment that completes a
+# phrase is replayed from the cache; anything else (LLM answers) is handed to
+# the real TTS stream as soon as it stops matching.
+#
+# The cache directory is shared by the job processes on a host and is kept
+# under a size cap by evicting the least recently played phrases.
+#
+# Configuration (environment):
+#   PHRASE_CACHE_DIR        where the PCM files live (default .phrase_cache)
+#   PHRASE_CACHE_MAX_BYTES  total size of the directory (default 32 MB)
+
+DEFAULT_CACHE_DIR = '.phrase_cache'
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+FRAME_MS = 50  # Cached audio is replayed in frames of this length
+
+
+class PhraseCache:
+    """Size-capped disk cache of synthesized PCM for a fixed set of phrases."""
+
+    def __init__(self, phrases=(), directory: str = None, max_bytes: int = None):
+        self.phrases = set(phrases)
+        self.directory = directory or os.environ.get('PHRASE_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes or int(os.environ.get('PHRASE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+
+        self._files = OrderedDict()  # key -> size, least recently played first
+        self._memory = {}  # key -> PCM of phrases already read this process
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pcm'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._files[key] = size
+
+    def key(self, voice_key: str, sample_rate: int, num_channels: int, text: str) -> str:
+        raw = f"{voice_key}|{sample_rate}|{num_channels}|{text}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._memory or key in self._files
+
+    def get(self, key: str):
+        """PCM bytes for a key, or None."""
+        with self._lock:
+            pcm = self._memory.get(key)
+            if pcm is None and key in self._files:
+                try:
+                    with open(self._path(key), 'rb') as f:
+                        pcm = f.read()
+                    self._memory[key] = pcm
+                except OSError:
+                    # Evicted by another process on this host
+                    self._files.pop(key, None)
+            if pcm is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._files[key] = len(pcm)
+            self._files.move_to_end(key)
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+        return pcm
+
+    def put(self, key: str, pcm: bytes):
+        if not pcm:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(pcm)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._memory[key] = pcm
+            self._files[key] = len(pcm)
+            self._files.move_to_end(key)
+            while sum(self._files.values()) > self.max_bytes and len(self._files) > 1:
+                old_key, _ = self._files.popitem(last=False)
+                self._memory.pop(old_key, None)
+                self.evictions += 1
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'phrases': len(self._files),
+                'bytes': sum(self._files.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class CachedTTS(tts.TTS):
+    """TTS that plays registered phrases from the phrase cache and delegates everything else."""
+
+    def __init__(self, wrapped: tts.TTS, cache: PhraseCache, voice_key: str):
+        super().__init__(
+            capabilities=wrapped.capabilities,
+            sample_rate=wrapped.sample_rate,
+            num_channels=wrapped.num_channels,
+        )
+        self._wrapped = wrapped
+        self._cache = cache
+        self._voice_key = voice_key
+        self._warming = {}  # key -> task synthesizing a missing phrase
+
+        # The agent listens for TTS metrics on this object, not the wrapped one
+        self._wrapped.on("metrics_collected", lambda m: self.emit("metrics_collected", m))
+
+    def _key(self, text: str) -> str:
+        return self._cache.key(self._voice_key, self.sample_rate, self.num_channels, text)
+
+    def synthesize(self, text: str, *, conn_options=None) -> tts.ChunkedStream:
+        if text not in self._cache.phrases:
+            return self._wrapped.synthesize(text, conn_options=conn_options)
+        return _CachedChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+    def stream(self, *, conn_options=None) -> tts.SynthesizeStream:
+        if not self._cache.phrases:
+            return self._wrapped.stream(conn_options=conn_options)
+        return _CachedSynthesizeStream(tts=self, conn_options=conn_options)
+
+    def warm(self, text: str):
+        """Synthesize a phrase in the background if it isn't cached yet, e.g. while waiting for a participant.
+
+        Once a voice has the phrase on disk (from any session on the host) this costs nothing.
+        """
+        key = self._key(text)
+        if key in self._warming or key in self._cache:
+            return
+        task = self._warming[key] = asyncio.create_task(self._load(key, text))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _load(self, key: str, text: str, on_frame=None) -> bytes:
+        try:
+            chunks = []
+            stream = self._wrapped.synthesize(text)
+            try:
+                async for audio in stream:
+                    chunks.append(audio.frame.data.tobytes())
+                    if on_frame is not None:
+                        on_frame(audio.frame)
+            finally:
+                await stream.aclose()
+            pcm = b"".join(chunks)
+            self._cache.put(key, pcm)
+            logger.info(f"Cached synthesized phrase: {text[:40]!r}")
+            return pcm
+        finally:
+            self._warming.pop(key, None)
+
+    async def replay(self, text: str, send):
+        """Pass the frames of a registered phrase to `send`, synthesizing and caching it on first use."""
+        key = self._key(text)
+        warming = self._warming.get(key)
+        if warming is not None:
+            # A background warm-up is already synthesizing this phrase
+            try:
+                await asyncio.shield(warming)
+            except Exception as e:
+                logger.warning(f"Phrase warm-up failed, synthesizing now: {e}")
+
+        pcm = self._cache.get(key)
+        if pcm is None:
+            # First use: play the real synthesis as it arrives and keep it
+            await self._load(key, text, on_frame=send)
+            return
+        for frame in self.frames(pcm):
+            send(frame)
+
+    def frames(self, pcm: bytes):
+        samples_per_frame = self.sample_rate * FRAME_MS // 1000
+        frame_bytes = samples_per_frame * self.num_channels * 2  # 16-bit PCM
+        for start in range(0, len(pcm), frame_bytes):
+            chunk = pcm[start:start + frame_bytes]
+            yield rtc.AudioFrame(
+                data=chunk,
+                sample_rate=self.sample_rate,
+                num_channels=self.num_channels,
+                samples_per_channel=len(chunk) // (2 * self.num_channels),
+            )
+
+    def stats(self):
+        return self._cache.stats()
+
+    async def aclose(self):
+        for task in list(self._warming.values()):
+            task.cancel()
+        await self._wrapped.aclose()
+
+
+class _CachedChunkedStream(tts.ChunkedStream):
+    def __init__(self, *, tts: CachedTTS, input_text: str, conn_options=None):
+        super().__init__(tts=tts, input_text=input_text, conn_options=conn_options)
+        self._cached_tts = tts
+        self._phrase = input_text
+
+    async def _run(self):
+        request_id = utils.shortuuid()
+
+        def send(frame):
+            self._event_ch.send_nowait(tts.SynthesizedAudio(request_id=request_id, frame=frame))
+        await self._cached_tts.replay(self._phrase, send)
+
+
+class _CachedSynthesizeStream(tts.SynthesizeStream):
+    """Replays segments that are exactly a registered phrase; passes everything else to the real stream."""
+
+    def __init__(self, *, tts: CachedTTS, conn_options=None):
+        super().__init__(tts=tts, conn_options=conn_options)
+        self._cached_tts = tts
+
+    async def _run(self):
+        phrases = self._cached_tts._cache.phrases
+        pending = ""  # Text of the current segment, while it still matches the start of a phrase
+        wrapped = None
+        relay = None
+        try:
+            async for data in self._input_ch:
+                flush = isinstance(data, self._FlushSentinel)
+                if wrapped is not None:
+                    if flush:
+                        wrapped.flush()
+                    else:
+                        wrapped.push_text(data)
+                    continue
+
+                if flush:
+                    if pending in phrases:
+                        await self._replay(pending)
+                        pending = ""
+                        continue
+                    if not pending:
+                        continue
+                else:
+                    pending += data
+                    if any(phrase.startswith(pending) for phrase in phrases):
+                        continue
+
+                # Not a registered phrase: from here on the real TTS speaks, in order
+                wrapped = self._cached_tts._wrapped.stream(conn_options=self._conn_options)
+                relay = asyncio.create_task(self._relay(wrapped))
+                wrapped.push_text(pending)
+                pending = ""
+                if flush:
+                    wrapped.flush()
+
+            if wrapped is not None:
+                wrapped.end_input()
+                await relay
+        finally:
+            if wrapped is not None:
+                await utils.aio.gracefully_cancel(relay)
+                await wrapped.aclose()
+
+    async def _replay(self, phrase: str):
+        request_id = utils.shortuuid()
+        self._mark_started()
+
+        def send(frame):
+            self._event_ch.send_nowait(tts.SynthesizedAudio(request_id=request_id, frame=frame))
+        await self._cached_tts.replay(phrase, send)
+
+    async def _relay(self, wrapped: tts.SynthesizeStream):
+        async for audio in wrapped:
+            self._event_ch.send_nowait(audio)
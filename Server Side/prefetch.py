@@ -0,0 +1,109 @@
+# prefetch.py
+
+import logging
+import threading
+
+from quota_scheduler import PREFETCH, PriorityTicket, request_priority
+
+logger = logging.getLogger("voice-assistant-tools")
+
+######################################
+# INTENT ROUTING & SPECULATIVE PREFETCH
+######################################
+# The same keyword routing that picks which capability text goes into the
+# prompt also tells us which tool the LLM is likely to call. As soon as a user
+# turn arrives we start warming that tool's data (inbox metadata, today's
+# calendar window) on the tool executor, in parallel with the LLM's first
+# pass. The tool then claims the prefetch: it waits for one that is already
+# running instead of issuing the same requests again.
+#
+# A prefetch nobody claims by the next user turn (or an interruption) is
+# settled as wasted. Queued ones are cancelled; ones already talking to Google
+# finish in the background and simply leave the shared caches warm.
+
+# Email-related keywords
+EMAIL_KEYWORDS = {'email', 'mail', 'inbox', 'draft', 'send', 'write to', 'message', 'ईमेल', 'मेल', 'इनबॉक्स', 'ड्राफ्ट', 'मैसेज'}
+# Calendar-related keywords
+CALENDAR_KEYWORDS = {'calendar', 'schedule', 'meeting', 'event', 'appointment', 'कैलेंडर', 'शेड्यूल', 'मीटिंग', 'इवेंट'}
+
+
+def detect_intent(user_input: str):
+    """Return 'email', 'calendar' or None for a user turn."""
+    user_input = (user_input or '').lower()
+    if any(keyword in user_input for keyword in EMAIL_KEYWORDS):
+        return 'email'
+    if any(keyword in user_input for keyword in CALENDAR_KEYWORDS):
+        return 'calendar'
+    return None
+
+
+class SpeculativePrefetcher:
+    """Starts intent-driven warm-ups and lets tools claim them."""
+
+    def __init__(self, executor, warmers):
+        self._executor = executor
+        self._warmers = warmers  # intent -> blocking warm-up callable
+        self._inflight = {}  # intent -> (future, its priority ticket)
+        self._lock = threading.Lock()
+
+        self.started = 0
+        self.used = 0
+        self.wasted = 0
+        self.cancelled = 0
+
+    def start(self, user_input: str):
+        """Settle the previous turn's leftovers and warm data for this turn's intent."""
+        self.settle()
+        intent = detect_intent(user_input)
+        if intent is None or intent not in self._warmers:
+            return None
+
+        with self._lock:
+            if intent not in self._inflight:
+                ticket = PriorityTicket(PREFETCH)
+                future = self._executor.submit(self._warm, intent, ticket)
+                self._inflight[intent] = (future, ticket)
+                self.started += 1
+        logger.debug(f"Prefetching {intent} data for the upcoming turn")
+        return intent
+
+    def _warm(self, intent: str, ticket: PriorityTicket):
+        try:
+            # Speculative: Google quota goes to requests someone is waiting for first
+            with request_priority(ticket):
+                self._warmers[intent]()
+        except Exception as e:
+            logger.warning(f"{intent} prefetch failed: {e}")
+
+    def claim(self, intent: str):
+        """Called by a tool before it fetches: wait for a running prefetch of its data."""
+        with self._lock:
+            prefetch = self._inflight.pop(intent, None)
+            if prefetch is None:
+                return
+            self.used += 1
+        future, ticket = prefetch
+        # Not started yet: the tool is about to do the same work itself
+        if not future.cancel():
+            # Someone is waiting for it now, so it no longer yields quota
+            ticket.escalate()
+            future.result()
+
+    def settle(self):
+        """Count unclaimed prefetches as wasted and cancel any that haven't started."""
+        with self._lock:
+            leftovers, self._inflight = self._inflight, {}
+            for future, _ in leftovers.values():
+                self.wasted += 1
+                if future.cancel():
+                    self.cancelled += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'started': self.started,
+                'used': self.used,
+                'wasted': self.wasted,
+                'cancelled': self.cancelled,
+                'waste_ratio': round(self.wasted / self.started, 3) if self.started else 0.0,
+            }
@@ -0,0 +1,200 @@
+# prompts.py
+
+import logging
+
+from livekit.agents import llm, metrics
+
+logger = logging.getLogger("voice-assistant")
+
+######################################
+# PROMPT LAYOUT
+######################################
+# Azure OpenAI reuses a cached prompt prefix only when it is byte-identical,
+# so everything that changes between sessions (today's date) goes after the
+# static instructions, never inside them:
+#
+#   [static persona] [static capability, text chat only] [volatile facts] [history]
+#
+# The static variants (base, base+email, base+calendar) are built once per job
+# process; each session only adds its volatile facts message.
+
+BASE_PROMPT = """
+    You are a multilingual real-time voice-to-voice AI Agent, and your name is Lisa.
+
+    Persona:
+    - Similar to Tony Stark's AI assistant EDITH
+    - Professional yet witty and tech-savvy
+    - Created by Humate AI
+
+    Core Capabilities:
+    - Weather Information
+    - Time & Date Information
+    - Calendar Management
+    - Email Management
+
+    Language and Style:
+    - Default to Hindi (Use Simple Native hindi script but add maximum english words in the native script)
+    - Avoid complex Hindi words, prefer English alternatives
+    - Keep responses under 80 words
+    - No code discussions (voice-only interaction)
+
+    Interaction Guidelines:
+    - Remember this is a voice call - no visual elements
+    - Ask for clarification when needed
+    - Maintain EDITH-like personality traits
+    - Address creator as Humate AI
+    - Be attentive and responsive
+    - Show personality while staying professional
+    """
+
+# Separate capability contexts
+EMAIL_CONTEXT = """
+    Email Management Capabilities:
+    - Can read recent and unread emails
+    - Creates draft emails (saved to Gmail drafts)
+    - Labels emails as "seen-by-lisa" only when their content is specifically discussed
+    - Maintains context of which emails have been read in conversation
+    - Can search through last 25 emails but shows only top 5 results
+    - For drafts, needs:
+      * Valid email address (with @)
+      * Subject line
+      * Email content
+    - Example commands:
+      * "Check my emails"
+      * "Read email number 2"
+      * "Find emails about meeting"
+      * "Search for emails from John"
+      * "Write an email to person@example.com"
+    - All drafts saved for review in Gmail
+    """
+
+CALENDAR_CONTEXT = """
+    Calendar Management:
+    - Can check calendar events for today, tomorrow, or specific dates
+    - Can create new calendar events
+    - For creating events, needs: event title, start time, and end time
+    - Uses 12-hour time format (e.g., 2:30 PM)
+    - Example commands:
+      * "What's on my calendar today/tomorrow?"
+      * "Schedule a meeting called [title] from [start time] to [end time]"
+    """
+
+
+class PromptLayout:
+    """Precomputed static prompt variants plus per-session volatile facts."""
+
+    def __init__(self):
+        base = llm.ChatMessage.create(text=BASE_PROMPT, role="system")
+        self._variants = {
+            None: (base,),
+            'email': (base, llm.ChatMessage.create(text=EMAIL_CONTEXT, role="system")),
+            'calendar': (base, llm.ChatMessage.create(text=CALENDAR_CONTEXT, role="system")),
+        }
+
+    def volatile_facts(self, current_date: str) -> llm.ChatMessage:
+        """Facts that change between sessions; always placed after the static prefix."""
+        return llm.ChatMessage.create(text=f"Today's date is {current_date}.", role="system")
+
+    def session_context(self, facts: llm.ChatMessage) -> llm.ChatContext:
+        """Initial chat context for the voice pipeline."""
+        return llm.ChatContext(messages=[*self._variants[None], facts])
+
+    def context_for(self, intent, chat_ctx: llm.ChatContext, facts: llm.ChatMessage) -> llm.ChatContext:
+        """Conversation so far, re-prefixed with the static variant for an intent.
+
+        Leading system messages of `chat_ctx` are the session's own prefix and are
+        replaced; messages are shared, not deep-copied.
+        """
+        history = chat_ctx.messages
+        start = 0
+        while start < len(history) and history[start].role == "system":
+            start += 1
+        variant = self._variants.get(intent, self._variants[None])
+        return llm.ChatContext(messages=[*variant, facts, *history[start:]])
+
+
+class PromptCacheStats:
+    """Running cached-token ratio of the session's LLM requests, to confirm the prefix is being reused.
+
+    LLMMetrics has no cached-token field and the OpenAI plugin drops
+    usage.prompt_tokens_details, so attach() taps the plugin's OpenAI client
+    stream for it; collect() then matches it to each LLMMetrics by request id.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self._cached = {}  # Completion id -> cached prompt tokens, until its metrics arrive
+
+    def attach(self, chat_llm):
+        """Record cached-token counts from the usage chunks of `chat_llm`'s streamed completions."""
+        completions = getattr(getattr(getattr(chat_llm, '_client', None), 'chat', None), 'completions', None)
+        if completions is None:
+            logger.info("LLM has no OpenAI client to read cached tokens from; prompt cache ratio unavailable")
+            return
+        create = completions.create
+
+        async def create_and_tap(*args, **kwargs):
+            return _UsageTap(await create(*args, **kwargs), self._record_usage)
+
+        completions.create = create_and_tap
+
+    def _record_usage(self, completion_id: str, usage):
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = getattr(details, 'cached_tokens', None)
+        if cached is not None:
+            self._cached[completion_id] = cached
+            while len(self._cached) > 64:
+                # Metrics never came (cancelled request)
+                self._cached.pop(next(iter(self._cached)))
+
+    def collect(self, mtrcs):
+        if not isinstance(mtrcs, metrics.LLMMetrics):
+            return
+        cached = self._cached.pop(mtrcs.request_id, None)
+        if cached is None or not mtrcs.prompt_tokens:
+            return
+
+        self.requests += 1
+        self.prompt_tokens += mtrcs.prompt_tokens
+        self.cached_tokens += cached
+        logger.info(
+            f"Prompt cache: {cached}/{mtrcs.prompt_tokens} tokens cached ({cached / mtrcs.prompt_tokens:.0%}), "
+            f"session {self.ratio():.0%}, ttft {mtrcs.ttft:.3f}s"
+        )
+
+    def ratio(self) -> float:
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'prompt_tokens': self.prompt_tokens,
+            'cached_tokens': self.cached_tokens,
+            'ratio': round(self.ratio(), 3),
+        }
+
+
+class _UsageTap:
+    """Passes an OpenAI chat completion stream through, handing its usage chunk to `record`."""
+
+    def __init__(self, stream, record):
+        self._stream = stream
+        self._record = record
+
+    async def __aenter__(self):
+        await self._stream.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._stream.__aexit__(*exc_info)
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        async for chunk in self._stream:
+            if getattr(chunk, 'usage', None) is not None:
+                self._record(chunk.id, chunk.usage)
+            yield chunk
@@ -0,0 +1,350 @@
+# quota_scheduler.py
+
+import atexit
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from tool_executor import check_cancelled
+
+logger = logging.getLogger("voice-assistant-tools")
+
+######################################
+# GOOGLE API QUOTA SCHEDULER
+######################################
+# Gmail meters each user in quota units per second (messages.get costs 5,
+# drafts.create 10, batchModify 50, ...) and Calendar in queries. A single
+# email summary can spend well over a hundred units, and several sessions of
+# the same account together run into 429 / rateLimitExceeded, at which point
+# every tool fails at once. Every Google request therefore passes through
+# this scheduler (from the pooled HTTP transport):
+#
+#   - one token bucket per (user, API), refilled at the configured rate and
+#     charged with the method's quota cost; a batch is charged for its parts,
+#   - requests on the spoken critical path go first; prefetches and
+#     background work (labelling, write-behind) wait while any more urgent
+#     request for the same bucket is waiting. Work started with a
+#     PriorityTicket is escalated in place when a tool starts waiting for it,
+#     so a prefetch the user now needs stops queueing behind other requests,
+#   - a rate-limit response pauses the bucket for a jittered exponential
+#     backoff (or the server's Retry-After), halves its rate and retries the
+#     request; successes then restore the rate step by step.
+#
+# Rates are per job process; lower them when many processes share an account.
+#
+# Configuration (environment):
+#   GMAIL_QUOTA_UNITS_PER_SEC   Gmail units per second per user (default 200)
+#   CALENDAR_QUOTA_PER_SEC      Calendar queries per second per user (default 5)
+#   QUOTA_MAX_RETRIES           retries of a rate-limited request (default 3)
+#   QUOTA_BACKOFF_BASE          seconds of the first backoff, doubled per retry (default 0.5)
+
+DEFAULT_GMAIL_RATE = 200.0
+DEFAULT_CALENDAR_RATE = 5.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_BASE = 0.5
+MAX_BACKOFF = 16.0
+MIN_RATE_FRACTION = 0.1  # Throttling never slows a bucket below this share of its rate
+RECOVERY_STEPS = 20  # Successes needed to climb back from the floor to the full rate
+
+CRITICAL = 0  # A tool answering the user right now
+PREFETCH = 1  # Speculative warm-ups and body prefetches
+BACKGROUND = 2  # Labelling, write-behind and other work nobody is waiting for
+PRIORITY_NAMES = {CRITICAL: 'critical', PREFETCH: 'prefetch', BACKGROUND: 'background'}
+
+# Gmail quota units per method, matched on the path after /gmail/v1/users/<id>/
+GMAIL_COSTS = [
+    ('POST', re.compile(r'^messages/batchModify$'), 50),
+    ('POST', re.compile(r'^drafts(/send)?$'), 10),
+    ('GET', re.compile(r'^messages$'), 5),
+    ('GET', re.compile(r'^messages/[^/]+$'), 5),
+    ('GET', re.compile(r'^history$'), 2),
+    ('POST', re.compile(r'^labels$'), 5),
+    ('GET', re.compile(r'^labels(/[^/]+)?$'), 1),
+]
+DEFAULT_GMAIL_COST = 5
+
+BATCH_PART = re.compile(rb'^(GET|POST|PUT|PATCH|DELETE) (\S+)', re.MULTILINE)
+RATE_LIMITED = (b'rateLimitExceeded', b'userRateLimitExceeded', b'RESOURCE_EXHAUSTED')
+
+# Counters exported to /metrics: attribute -> (metric, label, help)
+COUNTER_NAMES = {
+    'throttled': ('lisa_google_throttled_total', 'api', 'Google API responses that were rate limited.'),
+    'retries': ('lisa_google_retries_total', 'api', 'Rate-limited Google API requests sent again.'),
+    'units': ('lisa_google_quota_units_total', 'api', 'Quota units spent per Google API.'),
+    'delayed': ('lisa_google_delayed_total', 'priority', 'Google API requests held back by the scheduler.'),
+}
+
+_current = threading.local()
+
+
+class PriorityTicket:
+    """Priority of one piece of background work, raised in place once someone waits for its result."""
+
+    def __init__(self, priority: int):
+        self.priority = priority
+        self.scheduler = None  # Set by the scheduler the work queues in
+
+    def escalate(self, priority: int = CRITICAL):
+        """Serve this work's requests, queued and future ones, at `priority` from now on."""
+        scheduler = self.scheduler
+        if scheduler is None:
+            self.priority = min(self.priority, priority)
+            return
+        with scheduler._cond:
+            if priority < self.priority:
+                self.priority = priority
+                scheduler.escalated += 1
+                scheduler._cond.notify_all()
+
+
+def _level(setting) -> int:
+    return setting.priority if isinstance(setting, PriorityTicket) else setting
+
+
+def current_priority() -> int:
+    return _level(getattr(_current, 'priority', CRITICAL))
+
+
+@contextmanager
+def request_priority(priority):
+    """Run the Google requests made inside this block on the calling thread at `priority` (or a ticket's)."""
+    previous = getattr(_current, 'priority', CRITICAL)
+    _current.priority = priority
+    try:
+        yield
+    finally:
+        _current.priority = previous
+
+
+def with_priority(priority, func):
+    """Wrap a callable handed to the executor so its Google requests run at `priority`."""
+    def run(*args, **kwargs):
+        with request_priority(priority):
+            return func(*args, **kwargs)
+    return run
+
+
+def request_cost(uri: str, method: str, body=None):
+    """(api, quota cost) of one HTTP request to a Google API."""
+    path = urlparse(uri).path
+    if '/batch/' in path:
+        parts = BATCH_PART.findall(body.encode('utf-8') if isinstance(body, str) else body or b'')
+        api = 'gmail' if '/gmail/' in path else 'calendar'
+        return api, sum(request_cost(part_path.decode('utf-8'), part_method.decode('ascii'))[1]
+                        for part_method, part_path in parts) or 1
+    if '/gmail/' in path:
+        method_path = re.sub(r'^.*/gmail/v1/users/[^/]+/', '', path)
+        cost = next((units for verb, pattern, units in GMAIL_COSTS
+                     if verb == method and pattern.match(method_path)), DEFAULT_GMAIL_COST)
+        return 'gmail', cost
+    return 'calendar', 1
+
+
+def is_rate_limited(response, content) -> bool:
+    if response.status == 429:
+        return True
+    return response.status == 403 and any(reason in (content or b'') for reason in RATE_LIMITED)
+
+
+class TokenBucket:
+    """Quota units for one user and API, with a rate that adapts to throttling."""
+
+    def __init__(self, rate: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = rate  # One second of burst
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0  # Consecutive rate-limited responses
+        self.waiting = Counter()  # priority -> requests waiting for this bucket
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def penalize(self, now: float, pause: float):
+        self.failures += 1
+        self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+        self.blocked_until = max(self.blocked_until, now + pause)
+        self.tokens = 0.0
+
+    def reward(self):
+        self.failures = 0
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / RECOVERY_STEPS)
+
+
+class QuotaScheduler:
+    """Paces every Google request of this process by per-user quota, priority and throttling feedback."""
+
+    def __init__(self, gmail_rate: float = None, calendar_rate: float = None,
+                 max_retries: int = None, backoff_base: float = None):
+        self.rates = {
+            'gmail': gmail_rate or float(os.environ.get('GMAIL_QUOTA_UNITS_PER_SEC', DEFAULT_GMAIL_RATE)),
+            'calendar': calendar_rate or float(os.environ.get('CALENDAR_QUOTA_PER_SEC', DEFAULT_CALENDAR_RATE)),
+        }
+        self.max_retries = max_retries if max_retries is not None else int(
+            os.environ.get('QUOTA_MAX_RETRIES', DEFAULT_MAX_RETRIES))
+        self.backoff_base = backoff_base if backoff_base is not None else float(
+            os.environ.get('QUOTA_BACKOFF_BASE', DEFAULT_BACKOFF_BASE))
+
+        self._buckets = {}  # (user key, api) -> TokenBucket
+        self._cond = threading.Condition()
+        self._dump_path = None  # Counters file written by dump()
+
+        self.requests = Counter()  # api -> requests sent
+        self.units = Counter()  # api -> quota units spent
+        self.delayed = Counter()  # priority name -> requests that had to wait
+        self.wait_seconds = Counter()  # priority name -> total time spent waiting
+        self.throttled = Counter()  # api -> rate-limited responses
+        self.retries = Counter()  # api -> rate-limited requests sent again
+        self.escalated = 0  # Background work raised to a higher priority while queued
+
+    def _bucket(self, user_key: str, api: str) -> TokenBucket:
+        bucket = self._buckets.get((user_key, api))
+        if bucket is None:
+            bucket = self._buckets[(user_key, api)] = TokenBucket(self.rates[api])
+        return bucket
+
+    def acquire(self, user_key: str, api: str, cost: float, priority=None):
+        """Block until the bucket can pay for `cost` and no more urgent request is waiting for it."""
+        setting = getattr(_current, 'priority', CRITICAL) if priority is None else priority
+        started = time.monotonic()
+        with self._cond:
+            if isinstance(setting, PriorityTicket):
+                setting.scheduler = self
+            priority = _level(setting)
+            bucket = self._bucket(user_key, api)
+            # A batch bigger than one second of quota still goes out, just alone
+            cost = min(cost, bucket.capacity)
+            bucket.waiting[priority] += 1
+            try:
+                while True:
+                    if _level(setting) != priority:
+                        # Escalated while waiting: queue at the new priority
+                        bucket.waiting[priority] -= 1
+                        priority = _level(setting)
+                        bucket.waiting[priority] += 1
+                    now = time.monotonic()
+                    bucket.refill(now)
+                    ahead = any(bucket.waiting[p] for p in range(priority))
+                    if not ahead and now >= bucket.blocked_until and bucket.tokens >= cost:
+                        bucket.tokens -= cost
+                        break
+                    if ahead:
+                        delay = 0.05
+                    elif now < bucket.blocked_until:
+                        delay = bucket.blocked_until - now
+                    else:
+                        delay = (cost - bucket.tokens) / bucket.rate
+                    self._cond.wait(timeout=max(0.005, delay))
+                    # A barge-in shouldn't leave a cancelled call queued for quota
+                    check_cancelled()
+            finally:
+                bucket.waiting[priority] -= 1
+                self._cond.notify_all()
+
+            waited = time.monotonic() - started
+            self.requests[api] += 1
+            self.units[api] += cost
+            if waited > 0.001:
+                self.delayed[PRIORITY_NAMES[priority]] += 1
+                self.wait_seconds[PRIORITY_NAMES[priority]] += waited
+
+    def backoff(self, failures: int, retry_after=None) -> float:
+        if retry_after:
+            try:
+                return min(MAX_BACKOFF, float(retry_after))
+            except ValueError:
+                pass
+        return min(MAX_BACKOFF, self.backoff_base * 2 ** (failures - 1)) * random.uniform(0.5, 1.5)
+
+    def call(self, user_key: str, uri: str, method: str, body, send):
+        """Send one request through the scheduler; `send()` performs it and returns (response, content)."""
+        api, cost = request_cost(uri, method, body)
+        for attempt in range(self.max_retries + 1):
+            self.acquire(user_key, api, cost)
+            response, content = send()
+            with self._cond:
+                bucket = self._bucket(user_key, api)
+                if not is_rate_limited(response, content):
+                    if '/batch/' in uri and b'HTTP/1.1 429' in (content or b''):
+                        # Parts of a batch were throttled; slow down, their callbacks report the errors
+                        self.throttled[api] += 1
+                        bucket.penalize(time.monotonic(), self.backoff(bucket.failures + 1))
+                    else:
+                        bucket.reward()
+                    return response, content
+                self.throttled[api] += 1
+                pause = self.backoff(bucket.failures + 1, response.get('retry-after'))
+                bucket.penalize(time.monotonic(), pause)
+                self._cond.notify_all()
+                if attempt == self.max_retries:
+                    break
+                self.retries[api] += 1
+            logger.warning(f"Google {api} rate limit hit, backing off {pause:.1f}s (retry {attempt + 1})")
+        logger.error(f"Google {api} request still rate limited after {self.max_retries} retries")
+        return response, content
+
+    def stats(self):
+        with self._cond:
+            return {
+                'requests': dict(self.requests),
+                'units': dict(self.units),
+                'delayed': dict(self.delayed),
+                'wait_seconds': {name: round(seconds, 3) for name, seconds in self.wait_seconds.items()},
+                'throttled': dict(self.throttled),
+                'retries': dict(self.retries),
+                'escalated': self.escalated,
+                'rates': {f"{user_key}/{api}": round(bucket.rate, 1) for (user_key, api), bucket in self._buckets.items()},
+            }
+
+    def counters(self):
+        """The monotonic counters behind /metrics."""
+        with self._cond:
+            return {name: dict(getattr(self, name)) for name in COUNTER_NAMES}
+
+    def render(self) -> str:
+        return render_counters(self.counters())
+
+    def dump(self, directory: str):
+        """Leave this process's counters where the host-wide /metrics endpoint sums them."""
+        path = os.path.join(directory, f"google-{os.getpid()}.json")
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.counters(), f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logger.warning(f"Could not write Google quota counters: {e}")
+            return
+        if self._dump_path is None:
+            # The file speaks for a live process only; it goes when the process does
+            atexit.register(self.remove_dump)
+        self._dump_path = path
+
+    def remove_dump(self):
+        """Delete the counters file dump() wrote, e.g. as the process exits."""
+        path, self._dump_path = self._dump_path, None
+        if path is None:
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def render_counters(counters) -> str:
+    """Prometheus counters for quota pacing and throttling."""
+    lines = []
+    for name, (metric, label, help_text) in COUNTER_NAMES.items():
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        lines += [f'{metric}{{{label}="{key}"}} {n}' for key, n in sorted(counters.get(name, {}).items())]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,111 @@
+# session_store.py
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("voice-assistant")
+
+######################################
+# RESUMABLE SESSIONS
+######################################
+# A participant whose connection drops and who rejoins gets a brand-new job,
+# and with it a fresh AssistantTools: the numbered email listing, what was
+# already discussed and the conversation so far were gone, so "read email
+# number 2" meant listing the inbox again. When a session ends its state is
+# saved here for a grace period under the user key of the Google account it
+# acted for (never the participant identity, which the client chooses); a new
+# job for the same account takes it and starts warm. The store is blocking
+# (SQLite), so sessions call it from the tool pool.
+#
+# The saved state is plain JSON (tool state, conversation summary and recent
+# turns). It is kept in this process and, when the host-wide SharedCache is
+# available, there too, so a rejoin handled by another job process on the
+# host resumes as well. Mailbox and calendar data themselves are not copied:
+# they live in the process and shared caches already, and email bodies are
+# left out of the saved listing. The recent turns can still quote an email, so
+# the shared copy is deleted when taken, and every save purges the sessions
+# whose grace period ran out from the file.
+#
+# Configuration (environment):
+#   SESSION_RESUME_TTL  seconds a finished session can be resumed (default 300)
+
+DEFAULT_RESUME_TTL = 300
+MAX_SESSIONS = 256
+MAX_MESSAGES = 40  # Most recent user/assistant turns carried over
+NAMESPACE = 'session'
+
+
+def resumable_messages(chat_ctx, limit: int = MAX_MESSAGES):
+    """Spoken user/assistant turns of a chat context as JSON, without prompts or tool traffic."""
+    messages = [
+        {'role': message.role, 'text': message.content}
+        for message in chat_ctx.messages
+        if message.role in ("user", "assistant") and isinstance(message.content, str) and message.content
+    ]
+    return messages[-limit:]
+
+
+class SessionStore:
+    """Process-level map of Google user key -> state of its last session, for a grace TTL."""
+
+    def __init__(self, ttl: float = None, shared=None, max_sessions: int = MAX_SESSIONS):
+        self.ttl = ttl or float(os.environ.get('SESSION_RESUME_TTL', DEFAULT_RESUME_TTL))
+        self.max_sessions = max_sessions
+        self._shared = shared
+        self._sessions = OrderedDict()  # user key -> (expires_at, state)
+        self._lock = threading.Lock()
+
+        self.saved = 0
+        self.resumed = 0
+        self.expired = 0
+
+    def save(self, user_key: str, state):
+        """Keep a finished session's state so a rejoin within the TTL can resume it."""
+        state = dict(state, saved_at=time.time())
+        with self._lock:
+            self._sessions[user_key] = (time.monotonic() + self.ttl, state)
+            self._sessions.move_to_end(user_key)
+            self._evict()
+            self.saved += 1
+        if self._shared is not None:
+            self._shared.set(NAMESPACE, user_key, state, ttl=self.ttl)
+            self._shared.purge_expired()
+
+    def take(self, user_key: str):
+        """State of this account's last session, or None; it can be taken only once."""
+        with self._lock:
+            cached = self._sessions.pop(user_key, None)
+        state = None
+        if cached is not None and cached[0] > time.monotonic():
+            state = cached[1]
+        elif self._shared is not None:
+            state = self._shared.get(NAMESPACE, user_key)
+        if self._shared is not None:
+            # Two jobs for one account must not both attach to the same state
+            self._shared.delete(NAMESPACE, user_key)
+        if state is not None:
+            with self._lock:
+                self.resumed += 1
+            logger.info(f"Resuming session of {user_key} saved {time.time() - state['saved_at']:.0f}s ago")
+        return state
+
+    def _evict(self):
+        now = time.monotonic()
+        for user_key in [k for k, (expires_at, _) in self._sessions.items() if expires_at <= now]:
+            del self._sessions[user_key]
+            self.expired += 1
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.expired += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'held': len(self._sessions),
+                'saved': self.saved,
+                'resumed': self.resumed,
+                'expired': self.expired,
+            }
@@ -0,0 +1,246 @@
+# shared_cache.py
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("voice-assistant-tools")
+
+######################################
+# HOST-WIDE SHARED TOOL CACHE
+######################################
+# Every LiveKit job runs in its own process, so the in-memory caches (weather,
+# mailbox headers, label ids, calendar windows) are private to one job and
+# every new process starts cold. This is a second tier shared by all job
+# processes on the host: one SQLite database in WAL mode, so readers never
+# block and concurrent writers from different processes serialize on
+# SQLite's own lock (with a busy timeout) instead of corrupting anything.
+#
+# Values are JSON, stored under (namespace, key) with a per-entry expiry.
+# Namespaces separate kinds of data and users, e.g. "weather" or
+# "mailbox:<user>". When the file grows past its byte budget, expired
+# entries go first and then the least recently used ones.
+#
+# The file is not encrypted, so callers keep what they put here to metadata
+# (headers, label ids, calendar windows, session summaries) and leave email
+# bodies in process memory. Expired entries are deleted by the periodic
+# eviction pass (or purge_expired()), and deleted rows are overwritten on
+# disk (secure_delete).
+#
+# The shared tier is an optimization only: any SQLite error is logged and
+# treated as a miss, so a locked or broken file never fails a tool call.
+#
+# Configuration (environment):
+#   SHARED_CACHE_PATH       database file, "" disables the shared tier (default .tool_cache/cache.sqlite3)
+#   SHARED_CACHE_MAX_BYTES  approximate bytes of values kept (default 64 MB)
+#   SHARED_CACHE_TTL        default seconds an entry lives (default 86400)
+
+DEFAULT_PATH = os.path.join('.tool_cache', 'cache.sqlite3')
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 24 * 3600
+
+BUSY_TIMEOUT = 2.0  # Seconds a writer waits for another process's write lock
+ACCESS_RESOLUTION = 30.0  # Reads refresh an entry's LRU time at most this often
+EVICT_EVERY = 64  # Writes between eviction passes in this process
+EVICT_TARGET = 0.9  # Fraction of max_bytes an eviction pass shrinks to
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires_at);
+"""
+
+
+class SharedCache:
+    """TTL key-value store in one SQLite file, safe to use from many processes and threads."""
+
+    def __init__(self, path: str = None, max_bytes: int = None, default_ttl: float = None):
+        self.path = path if path is not None else os.environ.get('SHARED_CACHE_PATH', DEFAULT_PATH)
+        self.max_bytes = max_bytes or int(os.environ.get('SHARED_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+        self.default_ttl = default_ttl or float(os.environ.get('SHARED_CACHE_TTL', DEFAULT_TTL))
+
+        self._local = threading.local()  # One connection per thread
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Autocommit; each statement is its own short transaction
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA secure_delete=ON")
+            self._local.connection = connection
+        return connection
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def get(self, namespace: str, key: str):
+        """Cached value, or None when missing, expired or unreadable."""
+        now = time.time()
+        try:
+            connection = self._connection()
+            row = connection.execute(
+                "SELECT value, expires_at, accessed_at FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                self._count('misses')
+                return None
+            if now - row[2] > ACCESS_RESOLUTION:
+                connection.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (now, namespace, key)
+                )
+            value = json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            self._count('errors')
+            logger.warning(f"Shared cache read failed for {namespace}/{key}: {e}")
+            return None
+        self._count('hits')
+        return value
+
+    def set(self, namespace: str, key: str, value, ttl: float = None):
+        """Store a JSON-serializable value for `ttl` seconds (default SHARED_CACHE_TTL)."""
+        now = time.time()
+        try:
+            data = json.dumps(value, separators=(',', ':'))
+            self._connection().execute(
+                "INSERT INTO entries (namespace, key, value, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET "
+                "value = excluded.value, size = excluded.size, "
+                "expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+                (namespace, key, data, len(data), now + (ttl or self.default_ttl), now)
+            )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self._count('errors')
+            logger.warning(f"Shared cache write failed for {namespace}/{key}: {e}")
+            return
+        with self._lock:
+            self.writes += 1
+            self._writes += 1
+            due = self._writes >= EVICT_EVERY
+            if due:
+                self._writes = 0
+        if due:
+            self.evict()
+
+    def delete(self, namespace: str, key: str):
+        try:
+            self._connection().execute(
+                "DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            )
+        except sqlite3.Error as e:
+            self._count('errors')
+            logger.warning(f"Shared cache delete failed for {namespace}/{key}: {e}")
+
+    def clear_namespace(self, namespace: str):
+        try:
+            self._connection().execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+        except sqlite3.Error as e:
+            self._count('errors')
+            logger.warning(f"Shared cache clear failed for {namespace}: {e}")
+
+    def purge_expired(self) -> int:
+        """Delete every expired entry from the file; returns how many went."""
+        try:
+            expired = self._connection().execute(
+                "DELETE FROM entries WHERE expires_at <= ?", (time.time(),)).rowcount
+        except sqlite3.Error as e:
+            self._count('errors')
+            logger.warning(f"Shared cache purge failed: {e}")
+            return 0
+        if expired:
+            self._count('evictions', expired)
+        return expired
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under the byte budget."""
+        try:
+            connection = self._connection()
+            expired = connection.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),)).rowcount
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            excess = total - int(self.max_bytes * EVICT_TARGET)
+            dropped = 0
+            if total > self.max_bytes:
+                victims = []
+                cursor = connection.execute("SELECT namespace, key, size FROM entries ORDER BY accessed_at")
+                for namespace, key, size in cursor:
+                    victims.append((namespace, key))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                # Finish the read before taking the write lock
+                cursor.close()
+                connection.execute("BEGIN IMMEDIATE")
+                try:
+                    connection.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", victims)
+                    connection.execute("COMMIT")
+                except sqlite3.Error:
+                    connection.execute("ROLLBACK")
+                    raise
+                dropped = len(victims)
+        except sqlite3.Error as e:
+            self._count('errors')
+            logger.warning(f"Shared cache eviction failed: {e}")
+            return
+        if expired or dropped:
+            self._count('evictions', expired + dropped)
+            logger.info(f"Shared cache evicted {expired} expired and {dropped} least recently used entries")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'errors': self.errors,
+            }
+
+    def close(self):
+        """Close this thread's connection; other threads' connections close with the process."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def open_shared_cache():
+    """The host-wide cache for this process, or None when disabled or unavailable."""
+    if os.environ.get('SHARED_CACHE_PATH', DEFAULT_PATH) == '':
+        return None
+    try:
+        return SharedCache()
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Shared tool cache unavailable, using per-process caches only: {e}")
+        return None
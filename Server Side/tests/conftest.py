@@ -0,0 +1,7 @@
+# conftest.py
+
+import os
+import sys
+
+# The server modules are flat files next to this directory, imported by name as main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,195 @@
+# fake_gmail.py
+
+import base64
+from collections import Counter
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from quota_scheduler import QuotaScheduler
+
+
+def http_error(status: int) -> HttpError:
+    return HttpError(httplib2.Response({'status': status}), b'{"error": "fake"}')
+
+
+class _Request:
+    def __init__(self, gmail, method: str, run):
+        self._gmail = gmail
+        self._method = method
+        self._run = run
+
+    def execute(self):
+        self._gmail.calls[self._method] += 1
+        failure = self._gmail.failures.get(self._method)
+        if failure:
+            self._gmail.failures[self._method] = failure[1:]
+            raise failure[0]
+        return self._run()
+
+
+class _Batch:
+    def __init__(self, gmail, callback):
+        self._gmail = gmail
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        self._gmail.calls['batch'] += 1
+        for request_id, request in self._requests:
+            try:
+                self._callback(request_id, request.execute(), None)
+            except HttpError as e:
+                self._callback(request_id, None, e)
+
+
+class FakeGmail:
+    """In-memory stand-in for the googleapiclient Gmail service the tools use.
+
+    Every change bumps the mailbox historyId and is recorded for history.list.
+    `failures[method]` holds exceptions raised by the next calls of that method.
+    """
+
+    def __init__(self, count: int = 5, unread: int = 3):
+        self.history_id = 100
+        self.mailbox = {}  # id -> message, newest first
+        self.changes = []  # (history id, history record)
+        self.unread = unread
+        self.user_labels = [{'id': 'INBOX', 'name': 'INBOX'}]
+        self.modified = []  # batchModify bodies
+        self.calls = Counter()
+        self.failures = {}
+        self.history_expired = False
+        for i in range(count):
+            self.deliver(f"Sender {i}", f"Subject {i}", f"Body of message {i}.", record=False)
+
+    ######################################
+    # CHANGES
+    ######################################
+    def deliver(self, sender: str, subject: str, body: str, record: bool = True) -> str:
+        self.history_id += 1
+        message_id = f"m{self.history_id:03d}"
+        self.mailbox = {message_id: {
+            'id': message_id,
+            'historyId': str(self.history_id),
+            'from': f"{sender} <{sender.lower().replace(' ', '.')}@example.com>",
+            'subject': subject,
+            'body': body,
+        }, **self.mailbox}
+        if record:
+            self.changes.append((self.history_id, {'messagesAdded': [{'message': {'id': message_id}}]}))
+        return message_id
+
+    def delete(self, message_id: str):
+        self.history_id += 1
+        del self.mailbox[message_id]
+        self.changes.append((self.history_id, {'messagesDeleted': [{'message': {'id': message_id}}]}))
+
+    ######################################
+    # SERVICE
+    ######################################
+    def users(self):
+        return self
+
+    def new_batch_http_request(self, callback):
+        return _Batch(self, callback)
+
+    def messages(self):
+        return _Messages(self)
+
+    def history(self):
+        return _History(self)
+
+    def labels(self):
+        return _Labels(self)
+
+
+class _Messages:
+    def __init__(self, gmail: FakeGmail):
+        self._gmail = gmail
+
+    def list(self, userId, maxResults=100, q='', fields=None, pageToken=None):
+        gmail = self._gmail
+
+        def run():
+            matches = [m for m in gmail.mailbox.values() if q.lower() in f"{m['from']} {m['subject']}".lower()]
+            return {'messages': [{'id': m['id']} for m in matches[:maxResults]]}
+        return _Request(gmail, 'messages.list', run)
+
+    def get(self, userId, id, format='full', metadataHeaders=None, fields=None):
+        gmail = self._gmail
+
+        def run():
+            gmail.calls[f"messages.get:{format}"] += 1
+            message = gmail.mailbox.get(id)
+            if message is None:
+                raise http_error(404)
+            headers = [{'name': 'From', 'value': message['from']}, {'name': 'Subject', 'value': message['subject']}]
+            if format == 'metadata':
+                return {'id': id, 'historyId': message['historyId'], 'snippet': message['body'][:20],
+                        'payload': {'headers': headers}}
+            data = base64.urlsafe_b64encode(message['body'].encode('utf-8')).decode('ascii')
+            return {'payload': {'mimeType': 'text/plain', 'headers': headers,
+                                'body': {'size': len(message['body']), 'data': data}}}
+        return _Request(gmail, 'messages.get', run)
+
+    def batchModify(self, userId, body):
+        gmail = self._gmail
+
+        def run():
+            gmail.modified.append(body)
+            return {}
+        return _Request(gmail, 'messages.batchModify', run)
+
+
+class _History:
+    def __init__(self, gmail: FakeGmail):
+        self._gmail = gmail
+
+    def list(self, userId, startHistoryId, fields=None, pageToken=None):
+        gmail = self._gmail
+
+        def run():
+            start = int(startHistoryId)
+            if gmail.history_expired:
+                raise http_error(404)
+            records = [record for history_id, record in gmail.changes if history_id > start]
+            return {'history': records, 'historyId': str(gmail.history_id)}
+        return _Request(gmail, 'history.list', run)
+
+
+class _Labels:
+    def __init__(self, gmail: FakeGmail):
+        self._gmail = gmail
+
+    def get(self, userId, id, fields=None):
+        gmail = self._gmail
+        return _Request(gmail, 'labels.get', lambda: {'messagesUnread': gmail.unread})
+
+    def list(self, userId, fields=None):
+        gmail = self._gmail
+        return _Request(gmail, 'labels.list', lambda: {'labels': list(gmail.user_labels)})
+
+    def create(self, userId, body, fields=None):
+        gmail = self._gmail
+
+        def run():
+            label = {'id': f"Label_{len(gmail.user_labels)}", 'name': body['name']}
+            gmail.user_labels.append(label)
+            return label
+        return _Request(gmail, 'labels.create', run)
+
+
+class FakePool:
+    """The parts of GoogleClientPool AssistantTools uses, serving a FakeGmail."""
+
+    def __init__(self, gmail: FakeGmail, user_key: str = 'user-1'):
+        self._gmail = gmail
+        self.user_key = user_key
+        self.scheduler = QuotaScheduler()
+
+    def gmail(self):
+        return self._gmail
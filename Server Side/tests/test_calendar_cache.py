@@ -0,0 +1,162 @@
+# test_calendar_cache.py
+
+import threading
+import time
+from datetime import timedelta
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from calendar_cache import CalendarCache
+
+
+def _event(event_id: str, start, hours: int = 1, status: str = 'confirmed'):
+    return {
+        'id': event_id,
+        'status': status,
+        'summary': event_id,
+        'start': {'dateTime': start.isoformat()},
+        'end': {'dateTime': (start + timedelta(hours=hours)).isoformat()},
+    }
+
+
+class FakeEvents:
+    """events().list(...).execute() answering from queued responses, recording each request."""
+
+    def __init__(self, responses, gate=None):
+        self.responses = list(responses)
+        self.requests = []
+        self.gate = gate
+
+    def events(self):
+        return self
+
+    def list(self, **kwargs):
+        self.requests.append(kwargs)
+        return self
+
+    def execute(self):
+        if self.gate is not None:
+            self.gate.wait(5)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def _cache(**options):
+    return CalendarCache(days=7, sync_interval=0, **options)
+
+
+def test_deltas_outside_the_window_are_dropped():
+    cache = _cache()
+    today = cache._today()
+    inside = _event('inside', today + timedelta(days=1, hours=10))
+    service = FakeEvents([
+        {'items': [inside], 'nextSyncToken': 't1'},
+        {'items': [
+            _event('far', today + timedelta(days=40)),
+            _event('past', today - timedelta(days=3)),
+            _event('new', today + timedelta(days=2, hours=9)),
+            dict(_event('inside', today + timedelta(days=60)), summary='moved'),
+        ], 'nextSyncToken': 't2'},
+    ])
+
+    cache.refresh(service)
+    cache.refresh(service)
+
+    ids = [event['id'] for event in cache.events_between(today, today + timedelta(days=8))]
+    assert ids == ['new']
+    assert 'timeMin' not in service.requests[1] and service.requests[1]['syncToken'] == 't1'
+    assert cache.stats()['incremental_syncs'] == 1
+
+
+def test_missing_sync_token_reloads_the_window():
+    cache = _cache()
+    today = cache._today()
+    service = FakeEvents([
+        {'items': [_event('a', today + timedelta(hours=10))]},
+        {'items': [_event('b', today + timedelta(hours=11))], 'nextSyncToken': 't1'},
+    ])
+
+    cache.refresh(service)
+    cache.refresh(service)
+
+    assert all('syncToken' not in request for request in service.requests)
+    assert cache.stats()['full_syncs'] == 2
+    assert [e['id'] for e in cache.events_between(today, today + timedelta(days=1))] == ['b']
+
+
+def test_expired_sync_token_falls_back_to_a_full_sync():
+    cache = _cache()
+    today = cache._today()
+    gone = HttpError(httplib2.Response({'status': 410}), b'{"error": "gone"}')
+    service = FakeEvents([
+        {'items': [_event('a', today + timedelta(hours=10))], 'nextSyncToken': 't1'},
+        gone,
+        {'items': [_event('b', today + timedelta(hours=12))], 'nextSyncToken': 't2'},
+    ])
+
+    cache.refresh(service)
+    cache.refresh(service)
+
+    assert 'timeMin' in service.requests[2]
+    assert cache._sync_token == 't2'
+    assert [e['id'] for e in cache.events_between(today, today + timedelta(days=1))] == ['b']
+
+
+def test_concurrent_refreshes_share_one_sync_without_holding_the_lock():
+    cache = _cache()
+    today = cache._today()
+    gate = threading.Event()
+    service = FakeEvents([{'items': [_event('a', today + timedelta(hours=10))], 'nextSyncToken': 't1'}], gate)
+
+    threads = [threading.Thread(target=cache.refresh, args=(service,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    # Reads are served while the sync is still waiting on Google
+    assert cache.events_between(today, today + timedelta(days=1)) == []
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(service.requests) == 1
+    assert cache.stats()['full_syncs'] == 1
+
+
+def test_event_written_during_a_full_load_survives_it():
+    cache = _cache()
+    today = cache._today()
+    service = FakeEvents([
+        {'items': [], 'nextSyncToken': 't1'},
+        {'items': [_event('a', today + timedelta(hours=10))]},
+    ], threading.Event())
+    service.gate.set()
+    cache.refresh(service)
+    service.gate.clear()
+
+    # Force a reload and add an event while it waits on Google
+    cache._sync_token = None
+    worker = threading.Thread(target=cache.refresh, args=(service,))
+    worker.start()
+    time.sleep(0.1)
+    cache.add(_event('created', today + timedelta(hours=15)))
+    service.gate.set()
+    worker.join(5)
+
+    ids = [e['id'] for e in cache.events_between(today, today + timedelta(days=1))]
+    assert ids == ['a', 'created']
+
+
+def test_window_without_a_sync_token_is_reloaded_at_most_once_per_interval():
+    cache = CalendarCache(days=7, sync_interval=60)
+    today = cache._today()
+    service = FakeEvents([{'items': [_event('a', today + timedelta(hours=10))]}])
+
+    for _ in range(5):
+        cache.refresh(service)
+
+    assert len(service.requests) == 1
+    assert cache.stats()['full_syncs'] == 1
+    assert [e['id'] for e in cache.events_between(today, today + timedelta(days=1))] == ['a']
@@ -0,0 +1,198 @@
+# test_chat_queue.py
+
+import asyncio
+
+from chat_queue import ChatInbox
+
+
+class FakeSpeech:
+    def __init__(self, allow_interruptions: bool = True):
+        self.allow_interruptions = allow_interruptions
+        self.interrupted = False
+        self.done = asyncio.get_running_loop().create_future()
+        self.interrupts = 0
+
+    def join(self):
+        return self.done
+
+    def interrupt(self):
+        if not self.allow_interruptions:
+            raise RuntimeError("interruptions are not allowed")
+        self.interrupts += 1
+        self.interrupted = True
+
+
+class Answers:
+    """Chat handler recording what it was asked, answering after `delay`."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.started = []
+        self.finished = []
+        self.speeches = []
+
+    async def __call__(self, text: str):
+        self.started.append(text)
+        await asyncio.sleep(self.delay)
+        if text == 'boom':
+            raise ValueError("handler failed")
+        self.finished.append(text)
+        speech = FakeSpeech()
+        self.speeches.append(speech)
+        return speech
+
+
+def _run(scenario):
+    return asyncio.run(scenario())
+
+
+def test_burst_is_answered_as_one_turn_in_order():
+    answers = Answers()
+
+    async def scenario():
+        inbox = ChatInbox(answers, merge_window=0.05)
+        for text in ('hi', 'what is on my calendar', 'tomorrow'):
+            inbox.put('alice', text)
+        await asyncio.sleep(0.2)
+        return inbox.stats()
+
+    stats = _run(scenario)
+    assert answers.finished == ["hi\nwhat is on my calendar\ntomorrow"]
+    assert stats['merged'] == 2 and stats['depth'] == 0
+
+
+def test_new_message_supersedes_the_answer_in_progress():
+    answers = Answers(delay=0.2)
+
+    async def scenario():
+        inbox = ChatInbox(answers, merge_window=0.01)
+        inbox.put('alice', 'weather in delhi')
+        await asyncio.sleep(0.05)
+        inbox.put('alice', 'actually mumbai')
+        await asyncio.sleep(0.4)
+        return inbox.stats()
+
+    stats = _run(scenario)
+    assert answers.started == ['weather in delhi', 'actually mumbai']
+    assert answers.finished == ['actually mumbai']
+    assert stats['superseded'] == 1
+
+
+def test_new_message_interrupts_the_answer_being_spoken():
+    answers = Answers()
+
+    async def scenario():
+        inbox = ChatInbox(answers, merge_window=0.01)
+        inbox.put('alice', 'read my emails')
+        await asyncio.sleep(0.05)
+        inbox.put('alice', 'stop')
+        await asyncio.sleep(0.05)
+
+    _run(scenario)
+    assert answers.speeches[0].interrupted and not answers.speeches[1].interrupted
+
+
+def test_full_queue_drops_the_oldest_message():
+    answers = Answers()
+
+    async def scenario():
+        inbox = ChatInbox(answers, max_depth=2, merge_window=0.05)
+        for text in ('one', 'two', 'three'):
+            inbox.put('alice', text)
+        await asyncio.sleep(0.15)
+        return inbox.stats()
+
+    assert _run(scenario)['dropped'] == 1
+    assert answers.finished == ["two\nthree"]
+
+
+def test_participants_are_queued_separately_and_errors_dont_stop_the_worker():
+    answers = Answers()
+
+    async def scenario():
+        inbox = ChatInbox(answers, merge_window=0.02)
+        inbox.put('alice', 'boom')
+        inbox.put('bob', 'hello')
+        await asyncio.sleep(0.1)
+        inbox.put('alice', 'again')
+        await asyncio.sleep(0.1)
+        await inbox.aclose()
+
+    _run(scenario)
+    assert sorted(answers.finished) == ['again', 'hello']
+
+
+def test_aclose_cancels_pending_work():
+    answers = Answers(delay=1.0)
+
+    async def scenario():
+        inbox = ChatInbox(answers, merge_window=0.01)
+        inbox.put('alice', 'slow question')
+        await asyncio.sleep(0.05)
+        await inbox.aclose()
+        await asyncio.sleep(0.05)
+        return inbox.depth()
+
+    assert _run(scenario) == 0
+    assert answers.finished == []
+
+
+def test_single_message_is_answered_without_waiting_for_the_window():
+    answers = Answers()
+
+    async def scenario():
+        inbox = ChatInbox(answers, merge_window=5.0)
+        inbox.put('alice', 'hi')
+        await asyncio.sleep(0.05)
+
+    _run(scenario)
+    assert answers.finished == ['hi']
+
+
+def test_quick_follow_up_is_merged_into_the_answer_in_progress():
+    answers = Answers(delay=0.1)
+
+    async def scenario():
+        inbox = ChatInbox(answers, merge_window=0.5)
+        inbox.put('alice', 'remind me')
+        await asyncio.sleep(0.02)
+        inbox.put('alice', 'about the dentist')
+        await asyncio.sleep(0.3)
+        return inbox.stats()
+
+    stats = _run(scenario)
+    assert answers.started == ['remind me', "remind me\nabout the dentist"]
+    assert answers.finished == ["remind me\nabout the dentist"]
+    assert stats['merged'] == 1 and stats['superseded'] == 0
+
+
+def test_finished_speech_is_not_interrupted_or_counted():
+    answers = Answers()
+
+    async def scenario():
+        inbox = ChatInbox(answers, merge_window=0.01)
+        inbox.put('alice', 'what time is it')
+        await asyncio.sleep(0.05)
+        answers.speeches[0].done.set_result(None)
+        inbox.put('alice', 'thanks')
+        await asyncio.sleep(0.05)
+        return inbox.stats()
+
+    stats = _run(scenario)
+    assert answers.speeches[0].interrupts == 0
+    assert stats['superseded'] == 0
+
+
+def test_follow_up_during_the_first_moments_of_speech_is_merged():
+    answers = Answers()
+
+    async def scenario():
+        inbox = ChatInbox(answers, merge_window=0.5)
+        inbox.put('alice', 'call mom')
+        await asyncio.sleep(0.02)
+        inbox.put('alice', 'at 6')
+        await asyncio.sleep(0.05)
+
+    _run(scenario)
+    assert answers.speeches[0].interrupted
+    assert answers.finished == ['call mom', "call mom\nat 6"]
@@ -0,0 +1,117 @@
+# test_context_budget.py
+
+import asyncio
+from types import SimpleNamespace
+
+from livekit.agents import llm
+
+from context_budget import SUMMARY_HEADER, ContextBudget, estimate_tokens
+
+
+class FakeStream:
+    def __init__(self, text: str, fail: bool):
+        self._chunks = [text[i:i + 8] for i in range(0, len(text), 8)]
+        self._fail = fail
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._fail:
+            raise ConnectionError("summarizer unavailable")
+        if not self._chunks:
+            raise StopAsyncIteration
+        delta = SimpleNamespace(content=self._chunks.pop(0))
+        return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeSummarizer:
+    def __init__(self, text: str = "Priya asked about her meetings.", fail: bool = False):
+        self.text = text
+        self.fail = fail
+        self.requests = []
+
+    def chat(self, chat_ctx):
+        self.requests.append(chat_ctx)
+        return FakeStream(self.text, self.fail)
+
+
+def _conversation(turns: int):
+    ctx = llm.ChatContext().append(role="system", text="You are Lisa.")
+    for i in range(turns):
+        ctx.append(role="user", text=f"question {i} " + "words " * 40)
+        ctx.append(role="assistant", text=f"answer {i} " + "words " * 40)
+    return ctx
+
+
+def _texts(ctx):
+    return [m.content for m in ctx.messages]
+
+
+def test_devanagari_counts_more_tokens_per_character():
+    assert estimate_tokens("a" * 400) < estimate_tokens("क" * 400)
+    assert estimate_tokens(None) == 0
+
+
+def test_spoken_tool_results_are_compacted_and_the_latest_is_kept():
+    budget = ContextBudget(FakeSummarizer(), budget_tokens=100_000, tool_result_max_chars=50)
+    ctx = _conversation(1)
+    ctx.messages.append(llm.ChatMessage(role="tool", name="get_email_summary", content="x" * 500, tool_call_id="1"))
+    ctx.append(role="assistant", text="You have five emails.")
+    ctx.messages.append(llm.ChatMessage(role="tool", name="get_weather", content="y" * 500, tool_call_id="2"))
+
+    budget.apply(ctx)
+    spoken, latest = ctx.messages[-3], ctx.messages[-1]
+    assert spoken.content.startswith("[get_email_summary result already spoken")
+    assert latest.content == "y" * 500
+
+
+def test_over_budget_history_is_folded_into_a_summary_after_the_prefix():
+    summarizer = FakeSummarizer()
+
+    async def scenario():
+        budget = ContextBudget(summarizer, budget_tokens=400, keep_turns=2)
+        ctx = _conversation(6)
+        history = list(ctx.messages)
+        budget.apply(ctx)
+        digest = _texts(ctx)
+        await budget._task
+
+        # The agent keeps appending to its full history; folded turns stay out
+        ctx = llm.ChatContext(messages=history)
+        ctx.append(role="user", text="and tomorrow?")
+        budget.apply(ctx)
+        return digest, _texts(ctx), budget.snapshot()
+
+    digest, folded, snapshot = asyncio.run(scenario())
+    assert digest[0] == "You are Lisa." and digest[1].startswith(SUMMARY_HEADER)
+    assert "User: question 0" in digest[1]
+    assert digest[2].startswith("question 4")
+    assert folded[1] == f"{SUMMARY_HEADER}\nPriya asked about her meetings."
+    assert not any(text.startswith("question 0") for text in folded)
+    assert snapshot == "Priya asked about her meetings."
+    assert len(summarizer.requests) == 1
+
+
+def test_failed_summary_keeps_the_digest():
+    async def scenario():
+        budget = ContextBudget(FakeSummarizer(fail=True), budget_tokens=200, keep_turns=2)
+        ctx = _conversation(6)
+        budget.apply(ctx)
+        await budget._task
+        return budget.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot.startswith("User: question 0") and "Lisa: answer 3" in snapshot
+
+
+def test_history_under_budget_is_left_alone():
+    budget = ContextBudget(FakeSummarizer(), budget_tokens=100_000, keep_turns=2)
+    ctx = _conversation(6)
+    before = _texts(ctx)
+    budget.apply(ctx)
+    assert _texts(ctx) == before and budget.snapshot() == ""
@@ -0,0 +1,110 @@
+# test_email_body.py
+
+import base64
+
+import pytest
+
+from email_body import BODY_FIELDS, extract_speakable_body, extract_speakable_text, select_text_part
+
+
+def _b64(text: str, charset: str = 'utf-8') -> str:
+    return base64.urlsafe_b64encode(text.encode(charset)).decode('ascii')
+
+
+def _part(mime_type: str, text: str = None, charset: str = 'utf-8', **extra):
+    part = {
+        'mimeType': mime_type,
+        'headers': [{'name': 'Content-Type', 'value': f'{mime_type}; charset="{charset}"'}],
+        'body': {'size': len(text.encode(charset)) if text else 0},
+    }
+    if text is not None:
+        part['body']['data'] = _b64(text, charset)
+    part.update(extra)
+    return part
+
+
+def _multipart(mime_type: str, *parts):
+    return {'mimeType': mime_type, 'headers': [], 'body': {'size': 0}, 'parts': list(parts)}
+
+
+def test_plain_is_preferred_over_html_and_attachments_are_skipped():
+    payload = _multipart(
+        'multipart/mixed',
+        _part('text/plain', 'notes.txt contents', filename='notes.txt'),
+        _multipart('multipart/alternative', _part('text/html', '<p>Hello</p>'), _part('text/plain', 'Hello there')),
+    )
+    assert extract_speakable_text(payload) == 'Hello there'
+
+
+def test_html_is_reduced_to_visible_text():
+    html = (
+        '<html><head><title>x</title><style>p {color: red}</style></head>'
+        '<body><p>Hi&nbsp;Priya,</p><div>The meeting\nmoved to <b>3pm</b>.</div><script>track()</script></body></html>'
+    )
+    assert extract_speakable_text(_part('text/html', html)) == 'Hi Priya,\n\nThe meeting moved to 3pm.'
+
+
+def test_declared_charset_is_honoured():
+    assert extract_speakable_text(_part('text/plain', 'Grüße aus Köln', charset='iso-8859-1')) == 'Grüße aus Köln'
+
+
+def test_unknown_charset_falls_back_to_utf8():
+    part = _part('text/plain', 'नमस्ते')
+    part['headers'] = [{'name': 'Content-Type', 'value': 'text/plain; charset=x-made-up'}]
+    assert extract_speakable_text(part) == 'नमस्ते'
+
+
+def test_speech_cap_stops_decoding_early():
+    text = extract_speakable_text(_part('text/plain', 'word ' * 100_000), max_chars=50)
+    assert len(text) <= 50 and text.startswith('word word')
+
+
+def test_caps_report_that_the_text_was_cut_off():
+    assert extract_speakable_body(_part('text/plain', 'word ' * 1000), max_chars=50)[1]
+    assert extract_speakable_body(_part('text/plain', 'word ' * 1000), max_part_bytes=100)[1]
+    assert extract_speakable_body(_part('text/plain', 'Short note.')) == ('Short note.', False)
+
+
+def test_oversized_part_is_read_from_its_beginning_not_skipped():
+    body = 'Long report. ' + 'x' * 5000
+    payload = _multipart('multipart/alternative', _part('text/plain', body), _part('text/html', '<p>Short</p>'))
+    text = extract_speakable_text(payload, max_part_bytes=100)
+    assert text.startswith('Long report.')
+    assert len(text) <= 100
+
+
+def test_byte_cap_never_speaks_half_a_character():
+    text = extract_speakable_text(_part('text/plain', 'नमस्ते ' * 100), max_part_bytes=40)
+    assert '�' not in text and text.startswith('नमस्ते')
+
+
+def test_body_sent_by_attachment_id_is_fetched_only_when_chosen():
+    fetched = []
+
+    def fetch(attachment_id):
+        fetched.append(attachment_id)
+        return _b64('The full quarterly report')
+
+    big_plain = _part('text/plain')
+    big_plain['body']['attachmentId'] = 'att-1'
+    payload = _multipart(
+        'multipart/mixed',
+        _multipart('multipart/alternative', big_plain, _part('text/html', '<p>Report</p>')),
+        _part('application/pdf', filename='report.pdf', body={'size': 10, 'attachmentId': 'att-2'}),
+    )
+    assert extract_speakable_text(payload, fetch_data=fetch) == 'The full quarterly report'
+    assert fetched == ['att-1']
+    # Without a fetcher the part can't be read
+    assert extract_speakable_text(payload) == ''
+
+
+def test_no_text_part():
+    payload = _multipart('multipart/mixed', _part('image/png', filename='a.png', body={'size': 10, 'attachmentId': 'a'}))
+    assert select_text_part(payload) is None
+    assert extract_speakable_text(payload) == ''
+
+
+@pytest.mark.parametrize('field', ['partId', 'labelIds', 'raw'])
+def test_field_mask_leaves_out_what_the_walk_never_reads(field):
+    assert field not in BODY_FIELDS
+    assert 'attachmentId' in BODY_FIELDS
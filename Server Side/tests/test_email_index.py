@@ -0,0 +1,48 @@
+# test_email_index.py
+
+from email_index import EmailIndex, query_tokens, tokenize
+
+
+def _index():
+    index = EmailIndex()
+    index.add('m1', sender='Priya Sharma', subject='Team meeting on Monday', text='Agenda attached')
+    index.add('m2', sender='Accounts', subject='Invoice for March', text='Please find the invoices attached')
+    index.add('m3', sender='Rahul', subject='Lunch', text='Can we move the meeting to lunch?')
+    return index
+
+
+def test_devanagari_words_stay_whole_and_loanwords_fold_to_english():
+    assert tokenize("मीटिंग कल है") == ['meeting', 'कल', 'है']
+    # Vowel signs and viramas belong to the word they are in
+    assert tokenize("प्रोजेक्ट रिपोर्ट") == ['project', 'report']
+    assert query_tokens("मीटिंग वाली ईमेल") == ['meeting']
+
+
+def test_plurals_are_stemmed_lightly():
+    assert tokenize("invoices boxes meetings class") == ['invoice', 'box', 'meeting', 'class']
+
+
+def test_hindi_query_finds_english_email():
+    assert set(_index().search("मीटिंग वाला मेल")) == {'m1', 'm3'}
+
+
+def test_sender_and_subject_matches_rank_above_body_matches():
+    assert _index().search("meeting") == ['m1', 'm3']
+    assert _index().search("invoices") == ['m2']
+
+
+def test_every_query_token_must_match():
+    index = _index()
+    assert index.search("meeting lunch") == ['m3']
+    assert index.search("meeting invoice") == []
+    assert index.search("the emails about") == []
+
+
+def test_candidates_restrict_results_and_removed_messages_disappear():
+    index = _index()
+    assert index.search("meeting", candidates={'m3'}) == ['m3']
+    index.remove('m1')
+    assert index.search("meeting") == ['m3']
+    index.add('m3', sender='Rahul', subject='Lunch', text='Pizza?')
+    assert index.search("meeting") == []
+    assert len(index) == 2
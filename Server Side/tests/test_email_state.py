@@ -0,0 +1,125 @@
+# test_email_state.py
+
+from email_state import SessionEmails, truncate_for_speech
+
+WORDS = " ".join(f"word{i}" for i in range(400))  # About 3 KB
+
+
+def _entry(name: str):
+    return {'sender_name': name, 'sender_email': f"{name.lower()}@example.com", 'subject': f"From {name}"}
+
+
+def _listing(*names):
+    emails = SessionEmails(body_max_bytes=1000, max_bytes=10_000)
+    emails.replace([(f"id-{name}", _entry(name)) for name in names])
+    return emails
+
+
+def test_truncation_cuts_at_a_word_and_keeps_a_prefix():
+    head, truncated = truncate_for_speech(WORDS, 100)
+    assert truncated
+    assert len(head.encode('utf-8')) <= 100
+    assert WORDS.startswith(head) and head.endswith(head.split()[-1])
+    assert truncate_for_speech("short", 100) == ("short", False)
+
+
+def test_multibyte_text_is_not_split_mid_character():
+    head, truncated = truncate_for_speech("नमस्ते " * 100, 50)
+    assert truncated
+    head.encode('utf-8')
+
+
+def test_rest_continues_after_the_head_without_repeating_it():
+    emails = _listing("Priya")
+    record = emails.by_number(1)
+    head = emails.set_body(record, WORDS)
+    assert record.body_truncated
+
+    parts = [head]
+    more = True
+    while more:
+        part, more = emails.next_part(record, WORDS)
+        assert part
+        parts.append(part)
+    assert " ".join(parts).split() == WORDS.split()
+    assert emails.next_part(record, WORDS) == ("", False)
+
+
+def test_session_cap_drops_least_recently_read_bodies():
+    emails = _listing("A", "B", "C")
+    a, b, c = (emails.by_number(n) for n in (1, 2, 3))
+    emails.max_bytes = emails.nbytes + 2100
+    emails.set_body(a, WORDS)
+    emails.set_body(b, WORDS)
+    emails.touch(a)
+    emails.set_body(c, WORDS)
+    assert b.body is None and a.body is not None and c.body is not None
+    assert emails.stats()['evicted_bodies'] == 1
+
+
+def test_lookup_by_number_id_and_sender():
+    emails = _listing("Priya Sharma", "Rahul")
+    assert emails.by_number("2").sender_name == "Rahul"
+    assert emails.by_number("three") is None and emails.by_number(0) is None
+    assert emails.by_id("id-Priya Sharma").number == 1
+    assert emails.find_sender("priya").number == 1
+
+
+def test_export_restore_keeps_bodies_and_reading_position():
+    emails = _listing("Priya", "Rahul")
+    record = emails.by_number(1)
+    emails.set_body(record, WORDS)
+    emails.next_part(record, WORDS)
+
+    restored = SessionEmails(body_max_bytes=1000, max_bytes=10_000)
+    restored.restore(emails.export())
+    again = restored.by_number(1)
+    assert again.body == record.body and again.read_to == record.read_to
+    assert restored.nbytes == emails.nbytes
+    assert restored.next_part(again, WORDS) == emails.next_part(record, WORDS)
+
+
+def test_read_rest_tool_speaks_only_the_remainder():
+    from tools import AssistantTools
+
+    tools = AssistantTools()
+    tools.current_emails = _listing("Priya")
+    tools.fetch_email_body = lambda message_id: (WORDS, False)
+
+    first = tools._get_email_details("1")
+    assert "word0 " in first and "There is more to this email" in first
+
+    heard = first.split("Content:\n")[1].split("\n\n")[0].split()
+    while "There is more" in first:
+        first = tools._get_email_details("1", read_rest=True)
+        part = first.split("Content:\n")[1].split("\n\n")[0].split()
+        assert part[0] == f"word{len(heard)}"
+        heard += part
+    assert heard == WORDS.split()
+    assert "nothing more to read" in tools._get_email_details("1", read_rest=True)
+
+
+def test_read_rest_says_when_the_email_was_cut_off():
+    from tools import AssistantTools
+
+    tools = AssistantTools()
+    tools.current_emails = _listing("Priya")
+    tools.fetch_email_body = lambda message_id: (WORDS, True)
+
+    reply = tools._get_email_details("1")
+    while "There is more" in reply:
+        reply = tools._get_email_details("1", read_rest=True)
+    assert "cut off" in reply
+    reply = tools._get_email_details("1", read_rest=True)
+    assert "cut off" in reply and "end of the email" not in reply
+
+
+def test_export_without_bodies_keeps_only_the_listing():
+    emails = _listing("Priya")
+    emails.set_body(emails.by_number(1), WORDS)
+    exported = emails.export(bodies=False)
+    assert 'body' not in exported[0] and exported[0]['subject'] == "From Priya"
+
+    restored = SessionEmails(body_max_bytes=1000, max_bytes=10_000)
+    restored.restore(exported)
+    assert restored.by_number(1).body is None and restored.nbytes == emails.nbytes - len(emails.by_number(1).body)
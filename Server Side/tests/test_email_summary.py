@@ -0,0 +1,47 @@
+# test_email_summary.py
+
+from fake_gmail import FakeGmail, FakePool
+from mailbox_cache import MailboxCacheRegistry
+from tools import AssistantTools
+
+
+def _tools(gmail):
+    return AssistantTools(google_clients=FakePool(gmail), mailbox_caches=MailboxCacheRegistry())
+
+
+def test_unread_count_comes_from_the_inbox_label():
+    gmail = FakeGmail(count=5, unread=2)
+    summary = _tools(gmail)._get_email_summary(3)
+    assert summary.startswith("You have 2 unread emails. Here are your 3 most recent messages:")
+    assert gmail.calls['labels.get'] == 1
+
+
+def test_unchanged_mailbox_reuses_the_unread_count():
+    gmail = FakeGmail(count=5, unread=2)
+    tools = _tools(gmail)
+    tools._get_email_summary(3)
+    tools._get_email_summary(3)
+    assert gmail.calls['labels.get'] == 1
+    assert gmail.calls['messages.list'] == 1 and gmail.calls['history.list'] == 1
+
+
+def test_mailbox_change_refreshes_the_unread_count():
+    gmail = FakeGmail(count=5, unread=2)
+    tools = _tools(gmail)
+    tools._get_email_summary(3)
+
+    gmail.deliver("Priya", "Offsite", "Friday.")
+    gmail.unread = 3
+    assert "3 unread" in tools._get_email_summary(3)
+    assert gmail.calls['labels.get'] == 2
+
+
+def test_expired_history_starts_over():
+    gmail = FakeGmail(count=5, unread=2)
+    tools = _tools(gmail)
+    tools._get_email_summary(3)
+
+    gmail.history_expired = True
+    gmail.unread = 7
+    assert "7 unread" in tools._get_email_summary(3)
+    assert gmail.calls['messages.list'] == 2
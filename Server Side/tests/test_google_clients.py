@@ -0,0 +1,26 @@
+# test_google_clients.py
+
+from google_clients import GoogleClientPool
+
+
+def test_user_key_without_a_token_file_falls_back(tmp_path):
+    missing = GoogleClientPool(token_file=str(tmp_path / 'token.json'))
+    key = missing.user_key
+    assert len(key) == 16
+    assert key == GoogleClientPool(token_file=str(tmp_path / 'token.json')).user_key
+
+
+def test_user_key_with_an_unreadable_token_file_falls_back(tmp_path):
+    token_file = tmp_path / 'token.json'
+    token_file.write_text('{"not": "a token"}')
+    assert len(GoogleClientPool(token_file=str(token_file)).user_key) == 16
+
+
+def test_user_key_follows_the_account(tmp_path):
+    keys = set()
+    for refresh_token in ('first', 'second'):
+        token_file = tmp_path / f"{refresh_token}.json"
+        token_file.write_text(
+            '{"refresh_token": "%s", "client_id": "id", "client_secret": "secret"}' % refresh_token)
+        keys.add(GoogleClientPool(token_file=str(token_file)).user_key)
+    assert len(keys) == 2
@@ -0,0 +1,53 @@
+# test_label_writer.py
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_gmail import FakeGmail, http_error
+from label_writer import LISA_LABEL_NAME, LabelWriter
+from mailbox_cache import MailboxCache
+
+
+def _writer(gmail, mailbox):
+    return LabelWriter(ThreadPoolExecutor(max_workers=1), lambda: gmail, lambda: mailbox, debounce=0.01)
+
+
+def test_discussed_emails_are_labelled_in_one_batch():
+    gmail, mailbox = FakeGmail(count=3), MailboxCache()
+    writer = _writer(gmail, mailbox)
+
+    async def scenario():
+        for message_id in gmail.mailbox:
+            writer.queue(message_id)
+        writer.queue(next(iter(gmail.mailbox)))
+        writer.schedule_flush()
+        await asyncio.sleep(0.2)
+
+    asyncio.run(scenario())
+    label_id = mailbox.label_id(LISA_LABEL_NAME)
+    assert gmail.modified == [{'ids': list(gmail.mailbox), 'addLabelIds': [label_id]}]
+    assert gmail.calls['labels.create'] == 1
+
+    # Labelled once: reading the same email again costs nothing
+    writer.queue(next(iter(gmail.mailbox)))
+    asyncio.run(writer.flush())
+    assert gmail.calls['messages.batchModify'] == 1
+
+
+def test_failed_flush_keeps_the_emails_for_the_next_one():
+    gmail, mailbox = FakeGmail(count=2), MailboxCache()
+    mailbox.set_label_id(LISA_LABEL_NAME, 'Label_deleted')
+    gmail.user_labels.append({'id': 'Label_7', 'name': LISA_LABEL_NAME})
+    gmail.failures['messages.batchModify'] = [http_error(400)]
+    writer = _writer(gmail, mailbox)
+    first, second = gmail.mailbox
+
+    writer.queue(first)
+    asyncio.run(writer.flush())
+    # The cached label id may be stale, so it is looked up again on retry
+    assert gmail.modified == [] and mailbox.label_id(LISA_LABEL_NAME) is None
+
+    writer.queue(second)
+    asyncio.run(writer.flush())
+    assert gmail.modified == [{'ids': [first, second], 'addLabelIds': ['Label_7']}]
+    assert gmail.calls['labels.list'] == 1 and gmail.calls['labels.create'] == 0
@@ -0,0 +1,131 @@
+# test_mailbox_cache.py
+
+import sqlite3
+import time
+
+from fake_gmail import FakeGmail, FakePool
+from mailbox_cache import MailboxCache, entry_size
+from session_store import SessionStore
+from shared_cache import SharedCache
+
+BODY = "The quarterly numbers are confidential until Friday."
+
+
+def _entry(subject: str):
+    return {'sender_name': 'Priya', 'sender_email': 'priya@example.com', 'subject': subject,
+            'snippet': 'numbers', 'body': None}
+
+
+def _file_contents(path) -> str:
+    with sqlite3.connect(path) as connection:
+        return " ".join(row[0] for row in connection.execute("SELECT value FROM entries"))
+
+
+def test_bodies_stay_in_memory_and_headers_are_shared(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    shared = SharedCache(path=path)
+    mailbox = MailboxCache(shared=shared, namespace='mailbox:u')
+    mailbox.put('m1', _entry('Q3'))
+    mailbox.set_body('m1', BODY)
+    assert mailbox.get_body('m1') == BODY
+
+    other = MailboxCache(shared=SharedCache(path=path), namespace='mailbox:u')
+    assert other.get('m1')['subject'] == 'Q3'
+    assert other.get_body('m1') is None
+    assert 'confidential' not in _file_contents(path)
+
+
+def test_saved_sessions_are_purged_from_the_file_once_expired(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    shared = SharedCache(path=path)
+    store = SessionStore(ttl=0.05, shared=shared)
+    store.save('alice', {'messages': [{'role': 'assistant', 'text': 'secret agenda'}]})
+    time.sleep(0.1)
+    store.save('bob', {'messages': []})
+
+    assert 'secret agenda' not in _file_contents(path)
+    assert store.take('bob') is not None
+    assert _file_contents(path) == ''
+
+
+def _tools(gmail, path):
+    from mailbox_cache import MailboxCacheRegistry
+    from tools import AssistantTools
+    shared = SharedCache(path=path) if path else None
+    return AssistantTools(google_clients=FakePool(gmail), mailbox_caches=MailboxCacheRegistry(shared=shared))
+
+
+def test_listing_served_from_the_shared_tier_still_tracks_history(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    gmail = FakeGmail(count=5, unread=3)
+    _tools(gmail, path)._get_email_summary(5)
+
+    # Another job process: every header comes from the shared tier
+    other = _tools(gmail, path)
+    assert "3 unread" in other._get_email_summary(5)
+    assert other.get_mailbox().history_id is not None
+
+    gmail.deliver("Priya", "New budget", "Numbers attached.")
+    gmail.unread = 4
+    listed = gmail.calls['messages.list']
+    summary = other._get_email_summary(5)
+    assert "4 unread" in summary and "New budget" in summary
+    assert gmail.calls['messages.list'] == listed + 1
+
+
+def test_unread_count_is_not_trusted_without_a_history_id():
+    mailbox = MailboxCache()
+    mailbox.unread_count = 67
+    assert mailbox.sync(FakeGmail()) is False
+    assert mailbox.unread_count is None
+
+
+def _synced_mailbox(gmail):
+    mailbox = MailboxCache()
+    for message_id, message in gmail.mailbox.items():
+        mailbox.put(message_id, dict(_entry(message['subject']), history_id=message['historyId']))
+    mailbox.set_listing('', list(gmail.mailbox))
+    return mailbox
+
+
+def test_sync_keeps_listings_until_history_shows_a_change():
+    gmail = FakeGmail(count=3)
+    mailbox = _synced_mailbox(gmail)
+
+    assert mailbox.sync(gmail) is True
+    assert mailbox.listing('') == list(gmail.mailbox)
+
+    gone = list(gmail.mailbox)[1]
+    gmail.delete(gone)
+    assert mailbox.sync(gmail) is False
+    assert mailbox.listing('') is None
+    assert not mailbox.contains(gone) and mailbox.contains(list(gmail.mailbox)[0])
+    assert mailbox.history_id == str(gmail.history_id)
+    # Caught up: the next check starts after the deletion
+    assert mailbox.sync(gmail) is True
+
+
+def test_changed_mailbox_refetches_only_new_messages():
+    gmail = FakeGmail(count=5)
+    tools = _tools(gmail, None)
+    tools._get_email_summary(5)
+    fetched = gmail.calls['messages.get:metadata']
+
+    gmail.deliver("Priya", "Offsite", "Friday.")
+    assert "Offsite" in tools._get_email_summary(5)
+    assert gmail.calls['messages.list'] == 2
+    assert gmail.calls['messages.get:metadata'] == fetched + 1
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    mailbox = MailboxCache(max_messages=2)
+    mailbox.put('m1', _entry('one'))
+    mailbox.put('m2', _entry('two'))
+    mailbox.get('m1')
+    mailbox.put('m3', _entry('three'))
+    assert [mailbox.contains(m) for m in ('m1', 'm2', 'm3')] == [True, False, True]
+
+    by_bytes = MailboxCache(max_bytes=3 * entry_size(_entry('x')))
+    for i in range(4):
+        by_bytes.put(f"m{i}", _entry('x'))
+    assert by_bytes.stats()['messages'] == 3 and not by_bytes.contains('m0')
@@ -0,0 +1,134 @@
+# test_phrase_cache.py
+
+import asyncio
+
+from livekit import rtc
+from livekit.agents import tts
+
+from phrase_cache import CachedTTS, PhraseCache
+
+GREETING = "Hi, Welcome! How can I help you today?"
+SAMPLE_RATE = 16000
+
+
+def _frame(samples: int = 800) -> rtc.AudioFrame:
+    return rtc.AudioFrame(
+        data=b"\x01\x00" * samples, sample_rate=SAMPLE_RATE, num_channels=1, samples_per_channel=samples
+    )
+
+
+class FakeTTS(tts.TTS):
+    """Stands in for ElevenLabs and counts round trips."""
+
+    def __init__(self):
+        super().__init__(capabilities=tts.TTSCapabilities(streaming=True), sample_rate=SAMPLE_RATE, num_channels=1)
+        self.synthesized = []  # Texts sent through synthesize()
+        self.streamed = []  # Segments sent through stream()
+
+    def synthesize(self, text, *, conn_options=None):
+        self.synthesized.append(text)
+        return _FakeChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+    def stream(self, *, conn_options=None):
+        return _FakeStream(tts=self, conn_options=conn_options)
+
+
+class _FakeChunkedStream(tts.ChunkedStream):
+    async def _run(self):
+        for _ in range(3):
+            self._event_ch.send_nowait(tts.SynthesizedAudio(request_id="r", frame=_frame()))
+
+
+class _FakeStream(tts.SynthesizeStream):
+    async def _run(self):
+        segment = ""
+        async for data in self._input_ch:
+            if isinstance(data, self._FlushSentinel):
+                if segment:
+                    self._tts.streamed.append(segment)
+                    self._event_ch.send_nowait(tts.SynthesizedAudio(request_id="r", frame=_frame(), is_final=True))
+                segment = ""
+            else:
+                segment += data
+
+
+async def _speak(engine: tts.TTS, pieces):
+    """What the agent does for agent.say(): one stream, text pushed, input ended, audio read back."""
+    stream = engine.stream()
+    for piece in pieces:
+        stream.push_text(piece)
+    stream.end_input()
+    frames = [audio.frame async for audio in stream]
+    await stream.aclose()
+    return frames
+
+
+def _cached_tts(tmp_path, fake):
+    cache = PhraseCache(phrases={GREETING}, directory=str(tmp_path))
+    return cache, CachedTTS(fake, cache, "fake:voice")
+
+
+def test_greeting_is_synthesized_once_then_replayed_without_a_round_trip(tmp_path):
+    async def scenario():
+        fake = FakeTTS()
+        cache, cached_tts = _cached_tts(tmp_path, fake)
+        first = await _speak(cached_tts, [GREETING])
+        second = await _speak(cached_tts, [GREETING])
+        return fake, cache, first, second
+
+    fake, cache, first, second = asyncio.run(scenario())
+    assert fake.synthesized == [GREETING]
+    assert fake.streamed == []
+    assert sum(f.samples_per_channel for f in first) == sum(f.samples_per_channel for f in second) == 2400
+    assert cache.stats()['hits'] == 1
+
+
+def test_cached_audio_survives_a_new_process(tmp_path):
+    async def scenario():
+        await _speak(_cached_tts(tmp_path, FakeTTS())[1], [GREETING])
+        fake = FakeTTS()
+        _, cached_tts = _cached_tts(tmp_path, fake)
+        # Warming a phrase another session already cached costs nothing
+        cached_tts.warm(GREETING)
+        frames = await _speak(cached_tts, [GREETING])
+        return fake, frames
+
+    fake, frames = asyncio.run(scenario())
+    assert fake.synthesized == [] and fake.streamed == []
+    assert frames
+
+
+def test_llm_text_goes_to_the_real_stream_even_when_it_starts_like_a_phrase(tmp_path):
+    async def scenario():
+        fake = FakeTTS()
+        _, cached_tts = _cached_tts(tmp_path, fake)
+        frames = await _speak(cached_tts, ["Hi", ", ", "Priya", "! You have two meetings today."])
+        return fake, frames
+
+    fake, frames = asyncio.run(scenario())
+    assert fake.streamed == ["Hi, Priya! You have two meetings today."]
+    assert fake.synthesized == []
+    assert len(frames) == 1
+
+
+def test_prefix_of_a_phrase_is_not_replayed(tmp_path):
+    async def scenario():
+        fake = FakeTTS()
+        _, cached_tts = _cached_tts(tmp_path, fake)
+        await _speak(cached_tts, ["Hi, Welcome!"])
+        return fake
+
+    fake = asyncio.run(scenario())
+    assert fake.streamed == ["Hi, Welcome!"]
+
+
+def test_size_cap_evicts_least_recently_played(tmp_path):
+    cache = PhraseCache(phrases={"a", "b", "c"}, directory=str(tmp_path), max_bytes=250)
+    for key in ("a", "b"):
+        cache.put(key, b"x" * 100)
+    cache.get("a")
+    cache.put("c", b"x" * 100)
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.stats()['evictions'] == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.pcm", "c.pcm"]
+
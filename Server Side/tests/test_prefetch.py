@@ -0,0 +1,99 @@
+# test_prefetch.py
+
+import threading
+from concurrent.futures import Future
+
+from prefetch import SpeculativePrefetcher
+from quota_scheduler import CRITICAL, PREFETCH
+
+
+class StubExecutor:
+    """Queues submitted work; each piece starts only when the test says so."""
+
+    def __init__(self):
+        self.queued = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.queued.append((future, fn, args))
+        return future
+
+    def start(self, index: int = 0):
+        """Run one queued piece on its own thread, as a pool worker would pick it up."""
+        future, fn, args = self.queued[index]
+        if not future.set_running_or_notify_cancel():
+            return None
+
+        def work():
+            future.set_result(fn(*args))
+        thread = threading.Thread(target=work)
+        thread.start()
+        return thread
+
+
+class Warmer:
+    def __init__(self, gate=None):
+        self.calls = 0
+        self.running = threading.Event()
+        self.gate = gate
+
+    def __call__(self):
+        self.calls += 1
+        self.running.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+
+
+def test_claim_before_the_warm_up_starts_cancels_it():
+    executor, warmer = StubExecutor(), Warmer()
+    prefetcher = SpeculativePrefetcher(executor, {'email': warmer})
+
+    assert prefetcher.start("check my email") == 'email'
+    prefetcher.claim('email')
+
+    assert executor.start() is None
+    assert warmer.calls == 0
+    assert executor.queued[0][0].cancelled()
+    assert prefetcher.stats()['used'] == 1
+
+
+def test_claim_while_running_waits_for_it_and_escalates():
+    executor, warmer = StubExecutor(), Warmer(gate=threading.Event())
+    prefetcher = SpeculativePrefetcher(executor, {'calendar': warmer})
+    prefetcher.start("what's on my calendar")
+    ticket = executor.queued[0][2][1]
+    worker = executor.start()
+    assert warmer.running.wait(5)
+    assert ticket.priority == PREFETCH
+
+    claimed = threading.Event()
+    claimer = threading.Thread(target=lambda: (prefetcher.claim('calendar'), claimed.set()))
+    claimer.start()
+    # The tool waits for the running warm-up instead of fetching the same data again
+    assert not claimed.wait(0.1)
+    assert ticket.priority == CRITICAL
+
+    warmer.gate.set()
+    assert claimed.wait(5)
+    claimer.join(5)
+    worker.join(5)
+    assert warmer.calls == 1
+    assert prefetcher.stats()['used'] == 1 and prefetcher.stats()['wasted'] == 0
+
+
+def test_unclaimed_prefetches_are_settled_as_wasted_on_the_next_turn():
+    executor = StubExecutor()
+    email, calendar = Warmer(), Warmer()
+    prefetcher = SpeculativePrefetcher(executor, {'email': email, 'calendar': calendar})
+
+    prefetcher.start("read my inbox")
+    executor.start().join(5)
+    prefetcher.start("any meetings today?")
+    # Next turn: the calendar warm-up never started, so it is cancelled as well
+    prefetcher.start("thanks, that's all")
+
+    assert executor.queued[1][0].cancelled()
+    assert calendar.calls == 0
+    assert prefetcher.stats() == {
+        'started': 2, 'used': 0, 'wasted': 2, 'cancelled': 1, 'waste_ratio': 1.0,
+    }
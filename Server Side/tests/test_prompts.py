@@ -0,0 +1,95 @@
+# test_prompts.py
+
+import asyncio
+from types import SimpleNamespace
+
+from livekit.agents import llm
+from livekit.plugins.openai import LLM as OpenAILLM
+
+from prompts import PromptCacheStats, PromptLayout
+
+
+class FakeCompletionStream:
+    """What openai's AsyncStream looks like to the plugin."""
+
+    def __init__(self, completion_id: str, prompt_tokens: int, cached_tokens):
+        details = None if cached_tokens is None else SimpleNamespace(cached_tokens=cached_tokens)
+        delta = SimpleNamespace(content="Namaste!", tool_calls=None)
+        self._chunks = [
+            SimpleNamespace(id=completion_id, usage=None,
+                            choices=[SimpleNamespace(delta=delta, index=0, finish_reason=None)]),
+            SimpleNamespace(id=completion_id, choices=[], usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens, completion_tokens=3, total_tokens=prompt_tokens + 3,
+                prompt_tokens_details=details,
+            )),
+        ]
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            yield chunk
+
+
+class FakeOpenAIClient:
+    def __init__(self, responses):
+        self._responses = iter(responses)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        return FakeCompletionStream(*next(self._responses))
+
+
+def _run_completions(responses):
+    async def scenario():
+        chat_llm = OpenAILLM(client=FakeOpenAIClient(responses))
+        stats = PromptCacheStats()
+        stats.attach(chat_llm)
+        chat_llm.on("metrics_collected", stats.collect)
+        for _ in responses:
+            stream = chat_llm.chat(chat_ctx=llm.ChatContext().append(role="user", text="hi"))
+            text = "".join([chunk.choices[0].delta.content async for chunk in stream if chunk.choices])
+            assert text == "Namaste!"
+            await stream.aclose()
+        return stats
+
+    return asyncio.run(scenario())
+
+
+def test_cached_tokens_reach_the_ratio_through_the_plugin():
+    stats = _run_completions([("c1", 1200, 0), ("c2", 1250, 1024)])
+    assert stats.stats() == {'requests': 2, 'prompt_tokens': 2450, 'cached_tokens': 1024, 'ratio': 0.418}
+
+
+def test_requests_without_a_cached_token_count_are_left_out():
+    stats = _run_completions([("c1", 1200, None), ("c2", 1000, 512)])
+    assert stats.stats()['requests'] == 1
+    assert stats.ratio() == 0.512
+
+
+def test_llm_without_an_openai_client_is_ignored():
+    stats = PromptCacheStats()
+    stats.attach(SimpleNamespace())
+    assert stats.stats()['requests'] == 0
+
+
+def test_static_prefix_is_byte_stable_and_facts_come_last():
+    layout = PromptLayout()
+    monday = layout.session_context(layout.volatile_facts("Monday, 1 June"))
+    tuesday = layout.session_context(layout.volatile_facts("Tuesday, 2 June"))
+    assert [m.content for m in monday.messages[:-1]] == [m.content for m in tuesday.messages[:-1]]
+    assert "Monday" in monday.messages[-1].content
+
+    monday.append(role="user", text="check my email")
+    facts = layout.volatile_facts("Monday, 1 June")
+    email = layout.context_for('email', monday, facts)
+    assert email.messages[-1].content == "check my email"
+    assert email.messages[-2] is facts
+    assert len(email.messages) > len(monday.messages) - 1
+    # The variants themselves are built once and shared
+    assert layout.context_for('email', monday, facts).messages[0] is email.messages[0]
@@ -0,0 +1,102 @@
+# test_quota_scheduler.py
+
+import threading
+import time
+
+import httplib2
+
+from quota_scheduler import (
+    BACKGROUND, CRITICAL, PREFETCH, PriorityTicket, QuotaScheduler, request_cost, request_priority,
+)
+
+GMAIL = 'https://gmail.googleapis.com/gmail/v1/users/me/'
+
+
+def _scheduler(rate: float = 10.0):
+    return QuotaScheduler(gmail_rate=rate, calendar_rate=rate, max_retries=2, backoff_base=0.01)
+
+
+def _in_thread(func, *args):
+    done = {}
+
+    def run():
+        func(*args)
+        done['at'] = time.monotonic()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, done
+
+
+def test_gmail_methods_are_charged_their_quota_units():
+    assert request_cost(GMAIL + 'messages/abc', 'GET') == ('gmail', 5)
+    assert request_cost(GMAIL + 'messages/batchModify', 'POST') == ('gmail', 50)
+    assert request_cost(GMAIL + 'history', 'GET') == ('gmail', 2)
+    batch = b"GET /gmail/v1/users/me/messages/a\nGET /gmail/v1/users/me/messages/b\n"
+    assert request_cost('https://gmail.googleapis.com/batch/gmail/v1', 'POST', batch) == ('gmail', 10)
+    assert request_cost('https://www.googleapis.com/calendar/v3/calendars/primary/events', 'GET') == ('calendar', 1)
+
+
+def test_bucket_paces_requests_to_its_rate():
+    scheduler = _scheduler(rate=20.0)
+    start = time.monotonic()
+    for _ in range(30):
+        scheduler.acquire('u', 'gmail', 1)
+    # One second of burst, then 20 units a second
+    assert 0.4 < time.monotonic() - start < 1.5
+    assert scheduler.stats()['units']['gmail'] == 30
+
+
+def test_background_work_waits_for_critical_requests():
+    scheduler = _scheduler()
+    scheduler.acquire('u', 'gmail', 10)  # Empty the bucket
+    background, background_done = _in_thread(lambda: _at(BACKGROUND, scheduler.acquire, 'u', 'gmail', 1))
+    time.sleep(0.02)
+    critical, critical_done = _in_thread(scheduler.acquire, 'u', 'gmail', 5)
+    for thread in (background, critical):
+        thread.join(5)
+    assert critical_done['at'] < background_done['at']
+
+
+def test_claimed_prefetch_is_escalated_while_queued():
+    scheduler = _scheduler()
+    scheduler.acquire('u', 'gmail', 10)
+    ticket = PriorityTicket(PREFETCH)
+    prefetch, prefetch_done = _in_thread(lambda: _at(ticket, scheduler.acquire, 'u', 'gmail', 1))
+    time.sleep(0.02)
+    # A full second of quota keeps the prefetch parked behind it at PREFETCH
+    critical, critical_done = _in_thread(scheduler.acquire, 'u', 'gmail', 10)
+    time.sleep(0.05)
+    ticket.escalate()
+    for thread in (prefetch, critical):
+        thread.join(5)
+
+    assert ticket.priority == CRITICAL
+    assert prefetch_done['at'] < critical_done['at']
+    assert scheduler.stats()['escalated'] == 1
+
+
+def test_ticket_escalated_before_its_first_request_starts_at_the_new_priority():
+    scheduler = _scheduler()
+    ticket = PriorityTicket(PREFETCH)
+    ticket.escalate()
+    with request_priority(ticket):
+        scheduler.acquire('u', 'gmail', 1)
+    assert ticket.priority == CRITICAL
+    assert scheduler.stats()['escalated'] == 0
+
+
+def test_rate_limited_requests_are_retried_and_slow_the_bucket():
+    scheduler = _scheduler(rate=100.0)
+    responses = [httplib2.Response({'status': 429}), httplib2.Response({'status': 200})]
+
+    response, _ = scheduler.call('u', GMAIL + 'messages/a', 'GET', None, lambda: (responses.pop(0), b''))
+    assert response.status == 200
+    stats = scheduler.stats()
+    assert stats['throttled'] == {'gmail': 1} and stats['retries'] == {'gmail': 1}
+    assert stats['rates']['u/gmail'] < 100.0
+
+
+def _at(priority, func, *args):
+    with request_priority(priority):
+        func(*args)
@@ -0,0 +1,64 @@
+# test_session_store.py
+
+import asyncio
+import time
+
+from fake_gmail import FakeGmail, FakePool
+from mailbox_cache import MailboxCacheRegistry
+from session_store import SessionStore
+from shared_cache import SharedCache
+
+
+def _tools(user_key: str = 'user-1'):
+    from tools import AssistantTools
+    return AssistantTools(google_clients=FakePool(FakeGmail(), user_key=user_key),
+                          mailbox_caches=MailboxCacheRegistry())
+
+
+def _state():
+    return {'tools': {'user_key': 'user-1'}, 'summary': None, 'messages': [{'role': 'user', 'text': 'hi'}]}
+
+
+def test_saved_session_round_trips_once_across_processes(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    SessionStore(shared=SharedCache(path=path)).save('user-1', _state())
+
+    # Another job process on the host picks it up from the shared tier
+    other = SessionStore(shared=SharedCache(path=path))
+    resumed = other.take('user-1')
+    assert resumed['messages'] == [{'role': 'user', 'text': 'hi'}] and 'saved_at' in resumed
+    assert other.take('user-1') is None
+    assert other.stats()['resumed'] == 1
+
+
+def test_expired_sessions_are_not_resumed():
+    store = SessionStore(ttl=0.05)
+    store.save('user-1', _state())
+    time.sleep(0.1)
+    store.save('user-2', _state())
+    assert store.take('user-1') is None
+    assert store.stats()['expired'] == 1
+
+
+def test_restore_state_only_for_the_same_google_account():
+    saved = _tools()
+    saved.current_emails.replace([('m1', {'sender_name': 'Priya', 'sender_email': 'p@example.com', 'subject': 'Q3'})])
+    saved.discussed_emails.add('m1')
+    state = saved.export_state()
+
+    assert not _tools(user_key='someone-else').restore_state(state)
+
+    resumed = _tools()
+    assert resumed.restore_state(state)
+    assert resumed.current_emails.by_number(1).subject == 'Q3'
+    assert resumed.discussed_emails == {'m1'}
+
+
+def test_store_calls_run_off_the_event_loop():
+    tools, store = _tools(), SessionStore()
+
+    async def scenario():
+        await tools.run_blocking(store.save, tools.user_key, _state())
+        return await tools.run_blocking(store.take, tools.user_key)
+
+    assert asyncio.run(scenario())['messages'][0]['text'] == 'hi'
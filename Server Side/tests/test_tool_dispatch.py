@@ -0,0 +1,95 @@
+# test_tool_dispatch.py
+
+import asyncio
+from types import SimpleNamespace
+
+from tool_dispatch import ToolDispatcher
+
+
+def _call(name: str, **arguments):
+    return SimpleNamespace(function_info=SimpleNamespace(name=name), arguments=arguments)
+
+
+class FakeTools:
+    """Tools with the real names and parameters that log when each call starts and ends."""
+
+    def __init__(self):
+        self.log = []
+        self.runs = 0
+
+    async def _work(self, label: str, seconds: float):
+        self.runs += 1
+        self.log.append(f"start {label}")
+        await asyncio.sleep(seconds)
+        self.log.append(f"end {label}")
+        return label
+
+    async def get_weather(self, location: str):
+        return await self._work(f"weather {location}", 0.05)
+
+    async def fetch_calendar_events(self, date_query: str = "today"):
+        return await self._work("calendar read", 0.05)
+
+    async def create_calendar_event(self, summary: str, start_time: str, end_time: str, date: str = "today"):
+        return await self._work("calendar write", 0.01)
+
+
+def _dispatch(tools: FakeTools, calls):
+    dispatcher = ToolDispatcher(tools)
+    dispatcher.dispatch(calls)
+    return dispatcher
+
+
+def test_write_waits_for_reads_of_the_same_resource():
+    async def scenario():
+        tools = FakeTools()
+        dispatcher = _dispatch(tools, [
+            _call('fetch_calendar_events', date_query="today"),
+            _call('fetch_calendar_events', date_query="tomorrow"),
+            _call('create_calendar_event', summary="Dentist", start_time="10 AM", end_time="11 AM"),
+        ])
+        await asyncio.gather(*[task for tasks in dispatcher._started.values() for task in tasks])
+        return tools.log
+
+    log = asyncio.run(scenario())
+    # Both reads run side by side, and the write starts only after they finish
+    assert log[:2] == ["start calendar read", "start calendar read"]
+    assert log[4:] == ["start calendar write", "end calendar write"]
+
+
+def test_independent_resources_run_concurrently():
+    async def scenario():
+        tools = FakeTools()
+        dispatcher = _dispatch(tools, [
+            _call('get_weather', location="Pune"),
+            _call('create_calendar_event', summary="Dentist", start_time="10 AM", end_time="11 AM"),
+        ])
+        await asyncio.sleep(0)
+        return tools.log, dispatcher
+
+    log, dispatcher = asyncio.run(scenario())
+    assert log == ["start weather Pune", "start calendar write"]
+    assert dispatcher.stats() == {'batches': 1, 'dispatched': 2, 'claimed': 0}
+
+
+def test_claim_matches_a_call_that_omits_defaulted_arguments():
+    async def scenario():
+        tools = FakeTools()
+        dispatcher = _dispatch(tools, [
+            _call('get_weather', location="Chennai"),
+            _call('fetch_calendar_events'),
+            _call('create_calendar_event', summary="Dentist", start_time="10 AM", end_time="11 AM"),
+        ])
+        weather = dispatcher.claim('get_weather', location="Chennai")
+        calendar = dispatcher.claim('fetch_calendar_events', date_query="today")
+        event = dispatcher.claim('create_calendar_event', summary="Dentist", start_time="10 AM",
+                                 end_time="11 AM", date="today")
+        results = [await weather, await calendar, await event]
+        # Claimed once: the tool runs itself the next time
+        assert dispatcher.claim('get_weather', location="Chennai") is None
+        return tools, dispatcher, results
+
+    tools, dispatcher, results = asyncio.run(scenario())
+    assert results == ["weather Chennai", "calendar read", "calendar write"]
+    assert tools.runs == 3
+    assert dispatcher.stats()['claimed'] == 3
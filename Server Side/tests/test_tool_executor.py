@@ -0,0 +1,201 @@
+# test_tool_executor.py
+
+import asyncio
+import threading
+import time
+
+from livekit.rtc import EventEmitter
+
+from tool_executor import (
+    CANCELLED_RESULT,
+    BargeInMonitor,
+    CancellationStats,
+    ToolExecutor,
+    TurnCancellation,
+    check_cancelled,
+)
+
+
+class FakeAgent(EventEmitter):
+    """Emits the VAD events VoicePipelineAgent emits, nothing else."""
+
+
+class FakeTools:
+    """The turn bookkeeping of AssistantTools around one slow, two-request upstream call."""
+
+    def __init__(self):
+        self.stats = CancellationStats()
+        self.turn = TurnCancellation(self.stats)
+        self.first_request = threading.Event()
+        self.release = threading.Event()
+        self.second_request_sent = False
+
+    def cancel_turn(self, reason):
+        turn, self.turn = self.turn, TurnCancellation(self.stats)
+        turn.cancel(reason)
+
+    def tools_in_flight(self):
+        return self.turn.active > 0
+
+    def upstream(self):
+        self.first_request.set()
+        self.release.wait(5)
+        check_cancelled()
+        self.second_request_sent = True
+        return "fresh data"
+
+
+def test_talking_over_a_running_tool_abandons_its_upstream_call():
+    async def scenario():
+        tools = FakeTools()
+        agent = FakeAgent()
+        BargeInMonitor(tools.cancel_turn, tools.tools_in_flight, min_speech=0.05).attach(agent)
+        executor = ToolExecutor(max_workers=2)
+
+        call = asyncio.ensure_future(
+            executor.run('get_weather', tools.upstream, fallback="fallback", timeout=5, cancel=tools.turn)
+        )
+        await asyncio.get_running_loop().run_in_executor(None, tools.first_request.wait, 5)
+
+        started = time.perf_counter()
+        agent.emit("user_started_speaking")
+        result = await call
+        answered_after = time.perf_counter() - started
+
+        # The pool thread is still inside the first request; let it reach the next one
+        tools.release.set()
+        executor.shutdown(wait=True)
+        return tools, result, answered_after
+
+    tools, result, answered_after = asyncio.run(scenario())
+    assert result == CANCELLED_RESULT
+    assert answered_after < 1.0
+    assert not tools.second_request_sent
+    stats = tools.stats.stats()
+    assert stats['turns'] == 1 and stats['tools'] == 1
+    assert stats['never_started'] == 0
+
+
+def test_short_noise_does_not_cancel():
+    async def scenario():
+        tools = FakeTools()
+        agent = FakeAgent()
+        BargeInMonitor(tools.cancel_turn, tools.tools_in_flight, min_speech=0.1).attach(agent)
+        executor = ToolExecutor(max_workers=2)
+
+        call = asyncio.ensure_future(
+            executor.run('get_weather', tools.upstream, fallback="fallback", timeout=5, cancel=tools.turn)
+        )
+        await asyncio.get_running_loop().run_in_executor(None, tools.first_request.wait, 5)
+        agent.emit("user_started_speaking")
+        await asyncio.sleep(0.02)
+        agent.emit("user_stopped_speaking")
+        await asyncio.sleep(0.2)
+        tools.release.set()
+        result = await call
+        executor.shutdown(wait=True)
+        return tools, result
+
+    tools, result = asyncio.run(scenario())
+    assert result == "fresh data"
+    assert tools.second_request_sent
+    assert tools.stats.stats()['turns'] == 0
+
+
+def test_speech_without_tools_in_flight_cancels_nothing():
+    async def scenario():
+        tools = FakeTools()
+        agent = FakeAgent()
+        BargeInMonitor(tools.cancel_turn, tools.tools_in_flight, min_speech=0.01).attach(agent)
+        turn = tools.turn
+        agent.emit("user_started_speaking")
+        await asyncio.sleep(0.05)
+        return tools, turn
+
+    tools, turn = asyncio.run(scenario())
+    assert not turn.cancelled
+    assert tools.turn is turn
+
+
+def test_queued_work_is_dropped_when_cancelled():
+    async def scenario():
+        stats = CancellationStats()
+        turn = TurnCancellation(stats)
+        executor = ToolExecutor(max_workers=1)
+        blocker = threading.Event()
+        ran = []
+        busy = executor.submit(blocker.wait, 5)
+
+        call = asyncio.ensure_future(
+            executor.run('get_weather', ran.append, 1, fallback="fallback", timeout=5, cancel=turn)
+        )
+        await asyncio.sleep(0.01)
+        turn.cancel("barge-in")
+        result = await call
+        blocker.set()
+        busy.result()
+        executor.shutdown(wait=True)
+        return stats, result, ran
+
+    stats, result, ran = asyncio.run(scenario())
+    assert result == CANCELLED_RESULT
+    assert ran == []
+    assert stats.stats()['never_started'] == 1
+
+
+def test_deadline_answers_with_fallback():
+    async def scenario():
+        executor = ToolExecutor(max_workers=1)
+        release = threading.Event()
+        result = await executor.run('get_weather', release.wait, 5, fallback="fallback", timeout=0.05)
+        release.set()
+        executor.shutdown(wait=True)
+        return result
+
+    assert asyncio.run(scenario()) == "fallback"
+
+
+def test_timeout_override_from_environment(monkeypatch):
+    executor = ToolExecutor(max_workers=1, default_timeout=3.0)
+    monkeypatch.setenv('TOOL_TIMEOUT_GET_WEATHER', '1.5')
+    assert executor.timeout_for('get_weather') == 1.5
+    monkeypatch.setenv('TOOL_TIMEOUT_GET_WEATHER', 'soon')
+    assert executor.timeout_for('get_weather') == 5.0
+    assert executor.timeout_for('unknown_tool') == 3.0
+    executor.shutdown()
+
+
+def test_barge_in_cancels_a_running_assistant_tool(monkeypatch):
+    from tools import AssistantTools
+    from weather_cache import WeatherCache
+
+    monkeypatch.setenv('OPENWEATHER_API_KEY', 'test')
+    requested = threading.Event()
+    release = threading.Event()
+
+    def slow_openweather(location_key):
+        requested.set()
+        release.wait(5)
+        return 200, None
+
+    async def scenario():
+        executor = ToolExecutor(max_workers=2)
+        tools = AssistantTools(executor=executor, weather_cache=WeatherCache())
+        tools.fetch_weather = slow_openweather
+        agent = FakeAgent()
+        BargeInMonitor(tools.cancel_turn, tools.tools_in_flight, min_speech=0.05).attach(agent)
+
+        call = asyncio.ensure_future(tools.get_weather("Paris"))
+        await asyncio.get_running_loop().run_in_executor(None, requested.wait, 5)
+        assert tools.tools_in_flight()
+        agent.emit("user_started_speaking")
+        result = await asyncio.wait_for(call, 1.0)
+        in_flight_after = tools.tools_in_flight()
+        release.set()
+        executor.shutdown(wait=True)
+        return tools, result, in_flight_after
+
+    tools, result, in_flight_after = asyncio.run(scenario())
+    assert result == CANCELLED_RESULT
+    assert not in_flight_after
+    assert tools.cancellation_stats()['turns'] == 1
@@ -0,0 +1,133 @@
+# test_turn_timeline.py
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import urllib.request
+
+from quota_scheduler import QuotaScheduler
+from turn_timeline import LatencyRegistry, TurnLogAggregator, TurnTimeline
+
+
+def _run_turn(timeline: TurnTimeline, tool_seconds: float):
+    timeline.start_turn()
+    timeline.tool_finished('check_emails', tool_seconds)
+    timeline.playout_started()
+
+
+def test_metrics_cover_every_session_on_the_host(tmp_path):
+    log_dir = str(tmp_path)
+    old = TurnTimeline(LatencyRegistry(), 'before', log_dir=log_dir)
+    _run_turn(old, 9.0)
+
+    aggregator = TurnLogAggregator(log_dir=log_dir)
+    # Two sessions, as two job processes would write them
+    for session, seconds in (('room-a', 0.2), ('room-b', 0.4)):
+        timeline = TurnTimeline(LatencyRegistry(), session, log_dir=log_dir)
+        _run_turn(timeline, seconds)
+        timeline.start_turn()
+        timeline.close()
+
+    text = aggregator.render()
+    assert 'lisa_turn_stage_seconds_count{stage="tool:check_emails"} 2' in text
+    assert 'lisa_turn_stage_seconds_count{stage="playout_start"} 2' in text
+    # Scraping again doesn't count the same turns twice
+    assert 'lisa_turn_stage_seconds_count{stage="tool:check_emails"} 2' in aggregator.render()
+
+
+def test_partial_lines_wait_for_the_next_scrape(tmp_path):
+    aggregator = TurnLogAggregator(log_dir=str(tmp_path))
+    record = json.dumps({'completed': True, 'stages': {'llm_ttft': 0.3}, 'tools': []})
+    path = os.path.join(str(tmp_path), 'room-1.jsonl')
+    with open(path, 'w') as f:
+        f.write(record[:10])
+    aggregator.collect()
+    assert aggregator.latency.quantiles('llm_ttft') == {}
+
+    with open(path, 'a') as f:
+        f.write(record[10:] + "\n")
+    aggregator.collect()
+    assert aggregator.latency.quantiles('llm_ttft')[0.5] == 0.3
+
+
+def test_google_counters_are_summed_across_processes(tmp_path):
+    log_dir = str(tmp_path)
+    scheduler = QuotaScheduler()
+    scheduler.units['gmail'] += 25
+    scheduler.dump(log_dir)
+    with open(os.path.join(log_dir, 'google-1.json'), 'w') as f:
+        json.dump({'units': {'gmail': 10, 'calendar': 1}}, f)
+
+    text = TurnLogAggregator(log_dir=log_dir).render()
+    assert 'lisa_google_quota_units_total{api="gmail"} 35' in text
+    assert 'lisa_google_quota_units_total{api="calendar"} 1' in text
+
+
+def test_endpoint_serves_the_aggregate(tmp_path):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    aggregator = TurnLogAggregator(log_dir=str(tmp_path))
+    assert aggregator.serve(port=port) == port
+    try:
+        _run_turn(TurnTimeline(LatencyRegistry(), 'room', log_dir=str(tmp_path)), 0.1)
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            body = response.read().decode()
+        assert 'stage="playout_start"' in body
+    finally:
+        aggregator.close()
+
+
+def test_session_ids_cannot_leave_the_log_directory(tmp_path):
+    timeline = TurnTimeline(LatencyRegistry(), '../../etc/room name', log_dir=str(tmp_path))
+    assert os.path.dirname(timeline.path) == str(tmp_path)
+    assert os.path.basename(timeline.path).startswith('______etc_room_name-')
+
+
+def test_expired_logs_are_pruned_and_unchanged_ones_not_reread(tmp_path, monkeypatch):
+    log_dir = str(tmp_path)
+    stale = os.path.join(log_dir, 'old-1.jsonl')
+    with open(stale, 'w') as f:
+        f.write("{}\n")
+    os.utime(stale, (0, 0))
+    aggregator = TurnLogAggregator(log_dir=log_dir, retention_days=1)
+    _run_turn(TurnTimeline(LatencyRegistry(), 'room', log_dir=log_dir), 0.1)
+
+    aggregator.collect()
+    assert not os.path.exists(stale) and aggregator.pruned == 1
+    assert aggregator.latency.quantiles('playout_start')
+
+    opened = []
+    real_open = open
+
+    def recording_open(path, *args, **kwargs):
+        opened.append(str(path))
+        return real_open(path, *args, **kwargs)
+    monkeypatch.setattr('builtins.open', recording_open)
+    aggregator.collect()
+    assert not [path for path in opened if path.endswith('.jsonl')]
+
+
+def test_counters_of_exited_or_stale_processes_are_ignored(tmp_path):
+    log_dir = str(tmp_path)
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    for pid, units in ((exited.pid, 7), (os.getpid(), 5), (1, 3)):
+        with open(os.path.join(log_dir, f"google-{pid}.json"), 'w') as f:
+            json.dump({'units': {'gmail': units}}, f)
+    os.utime(os.path.join(log_dir, 'google-1.json'), (0, 0))
+
+    aggregator = TurnLogAggregator(log_dir=log_dir, retention_days=1)
+    assert aggregator.google_counters() == {'units': {'gmail': 5}}
+    aggregator.prune()
+    assert not os.path.exists(os.path.join(log_dir, f"google-{exited.pid}.json"))
+
+
+def test_counters_file_is_removed_when_the_process_exits(tmp_path):
+    scheduler = QuotaScheduler()
+    scheduler.dump(str(tmp_path))
+    assert os.listdir(str(tmp_path)) == [f"google-{os.getpid()}.json"]
+    scheduler.remove_dump()
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,101 @@
+# test_weather_cache.py
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from shared_cache import SharedCache
+from weather_cache import WeatherCache, normalize_location
+
+
+class Upstream:
+    """fetch(key) stand-in counting calls; optionally held until released."""
+
+    def __init__(self, status: int = 200, gate: threading.Event = None):
+        self.status = status
+        self.gate = gate
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, key):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.status == 500:
+            raise OSError("upstream down")
+        return self.status, {'city': key, 'call': call}
+
+
+def test_spoken_locations_share_one_key():
+    assert normalize_location(" New  Delhi ") == 'delhi'
+    assert normalize_location("weather in Bombay?") == 'mumbai'
+    assert normalize_location("दिल्ली का मौसम") == 'delhi'
+    assert normalize_location("Pune, IN") == 'pune,in'
+
+
+def test_concurrent_misses_share_one_upstream_call():
+    cache = WeatherCache(ttl=60, stale_ttl=120)
+    upstream = Upstream(gate=threading.Event())
+    with ThreadPoolExecutor(5) as pool:
+        futures = [pool.submit(cache.get, 'delhi', upstream) for _ in range(5)]
+        time.sleep(0.1)
+        upstream.gate.set()
+        results = [future.result(5) for future in futures]
+
+    assert upstream.calls == 1
+    assert all(result == results[0] for result in results)
+    assert cache.stats()['coalesced'] == 4
+
+
+def test_failure_reaches_every_waiter_and_is_not_cached():
+    cache = WeatherCache(ttl=60, stale_ttl=120)
+    upstream = Upstream(status=500, gate=threading.Event())
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(cache.get, 'delhi', upstream) for _ in range(3)]
+        time.sleep(0.1)
+        upstream.gate.set()
+        for future in futures:
+            with pytest.raises(OSError):
+                future.result(5)
+
+    upstream.status = 200
+    assert cache.get('delhi', upstream)[0] == 200
+    assert upstream.calls == 2
+
+
+def test_stale_answer_is_served_while_one_refresh_runs():
+    cache = WeatherCache(ttl=0.05, stale_ttl=60)
+    upstream = Upstream()
+    first = cache.get('delhi', upstream)
+    time.sleep(0.1)
+
+    upstream.gate = threading.Event()
+    with ThreadPoolExecutor(2) as pool:
+        stale = [cache.get('delhi', upstream, submit=pool.submit) for _ in range(3)]
+        assert stale == [first] * 3
+        upstream.gate.set()
+    assert cache.get('delhi', upstream)[1]['call'] == 2
+    assert cache.stats()['refreshes'] == 1 and cache.stats()['stale_hits'] == 3
+
+
+def test_unknown_locations_are_not_served_stale():
+    cache = WeatherCache(ttl=0.01, stale_ttl=60)
+    upstream = Upstream(status=404)
+    cache.get('atlantis', upstream)
+    # Within NOT_FOUND_TTL the 404 is answered from the cache even past the ttl
+    time.sleep(0.05)
+    cache.get('atlantis', upstream, submit=lambda *args: pytest.fail("404s are never refreshed stale"))
+    assert upstream.calls == 1
+
+
+def test_answers_are_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    upstream = Upstream()
+    WeatherCache(ttl=60, shared=SharedCache(path=path)).get('delhi', upstream)
+    other = WeatherCache(ttl=60, shared=SharedCache(path=path))
+    assert other.get('delhi', upstream)[1]['call'] == 1
+    assert upstream.calls == 1 and other.stats()['shared_hits'] == 1
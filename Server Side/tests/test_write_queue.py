@@ -0,0 +1,98 @@
+# test_write_queue.py
+
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from write_queue import WriteBehindQueue
+
+
+def _abandon(directory, key: str, payload):
+    """A journal entry as a crashed session leaves it, old enough to be adopted."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{key}.json")
+    with open(path, 'w') as f:
+        json.dump({'key': key, 'kind': 'draft', 'payload': payload, 'description': 'a draft',
+                   'attempts': 1, 'created_at': 0}, f)
+    os.utime(path, (0, 0))
+
+
+def test_resume_adopts_only_this_accounts_journal(tmp_path, monkeypatch):
+    monkeypatch.setenv('WRITE_RECOVER_AFTER', '60')
+    _abandon(tmp_path / 'alice', 'a1', {'to': 'x'})
+    _abandon(tmp_path / 'bob', 'b1', {'to': 'y'})
+    written = []
+
+    async def main():
+        with ThreadPoolExecutor(2) as executor:
+            queue = WriteBehindQueue(executor, user_key='alice', enabled=True, directory=str(tmp_path))
+            queue.register('draft', lambda payload, key, attempt: written.append((key, attempt)))
+            queue.resume()
+            await queue.drain(timeout=5)
+            return queue.stats()
+
+    stats = asyncio.run(main())
+    assert written == [('a1', 2)]
+    assert stats['recovered'] == 1 and stats['completed'] == 1
+    assert os.listdir(tmp_path / 'alice') == []
+    assert os.listdir(tmp_path / 'bob') == ['b1.json']
+
+
+def test_recent_journal_entries_are_left_to_their_session(tmp_path):
+    _abandon(tmp_path / 'alice', 'a1', {})
+    os.utime(tmp_path / 'alice' / 'a1.json')  # Touched just now by a live session
+
+    async def main():
+        with ThreadPoolExecutor(1) as executor:
+            queue = WriteBehindQueue(executor, user_key='alice', enabled=True, directory=str(tmp_path))
+            queue.register('draft', lambda payload, key, attempt: None)
+            queue.resume()
+            return queue.stats()
+
+    assert asyncio.run(main())['recovered'] == 0
+
+
+def test_transient_failures_are_retried_with_the_same_key(tmp_path):
+    attempts = []
+
+    def handler(payload, key, attempt):
+        attempts.append((key, attempt))
+        if attempt < 3:
+            raise HttpError(httplib2.Response({'status': 503}), b'busy')
+
+    async def main():
+        with ThreadPoolExecutor(1) as executor:
+            queue = WriteBehindQueue(executor, user_key='alice', enabled=True, directory=str(tmp_path),
+                                     retry_base=0.01)
+            queue.register('draft', handler)
+            key = queue.submit('draft', {'to': 'x'}, 'your draft')
+            await queue.drain(timeout=5)
+            return key, queue.stats()
+
+    key, stats = asyncio.run(main())
+    assert attempts == [(key, 1), (key, 2), (key, 3)]
+    assert stats['retries'] == 2 and stats['completed'] == 1
+
+
+def test_final_failure_is_reported_and_kept_aside(tmp_path):
+    notices = []
+
+    def handler(payload, key, attempt):
+        raise HttpError(httplib2.Response({'status': 400}), b'bad request')
+
+    async def main():
+        with ThreadPoolExecutor(1) as executor:
+            queue = WriteBehindQueue(executor, user_key='alice', enabled=True, directory=str(tmp_path))
+            queue.register('draft', handler)
+            queue.on_failed = notices.append
+            key = queue.submit('draft', {}, 'your draft to Priya')
+            await queue.drain(timeout=5)
+            return key
+
+    key = asyncio.run(main())
+    assert notices and 'your draft to Priya' in notices[0]
+    assert os.listdir(tmp_path / 'alice') == [f"{key}.json.failed"]
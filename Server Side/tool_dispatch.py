@@ -0,0 +1,150 @@
+# tool_dispatch.py
+
+import asyncio
+import contextvars
+import inspect
+import logging
+import time
+
+logger = logging.getLogger("voice-assistant-tools")
+
+######################################
+# CONCURRENT FUNCTION CALL DISPATCH
+######################################
+# VoicePipelineAgent executes the function calls of one LLM response one after
+# another, so "weather and my meetings today?" waits for OpenWeather and then
+# for Google Calendar. When a response carries several calls, the dispatcher
+# starts them all as soon as they are collected; the agent's own sequential
+# execution then just claims each result, so the turn takes as long as the
+# slowest tool instead of the sum.
+#
+# Calls that touch the same resource stay in the order the LLM issued them
+# whenever one of them writes (create_calendar_event before
+# fetch_calendar_events, get_email_summary before get_email_details). Reads of
+# the same resource run side by side. Tools not listed here (time and date)
+# are cheap and left to the agent.
+
+READ = 'read'
+WRITE = 'write'
+
+# Tool name -> resources it touches and how
+TOOL_RESOURCES = {
+    'get_weather': (('weather', READ),),
+    'fetch_calendar_events': (('calendar', READ),),
+    'create_calendar_event': (('calendar', WRITE),),
+    # The summary replaces the numbered listing that details and drafts refer to
+    'get_email_summary': (('email_listing', WRITE),),
+    'get_email_details': (('email_listing', READ),),
+    'create_draft': (('email_listing', READ), ('drafts', WRITE)),
+}
+
+# Set inside dispatched tasks so the tool body runs instead of claiming itself
+_dispatching = contextvars.ContextVar('dispatching', default=False)
+# Set in the caller's context when claim() hands it a task that is already running
+claimed = contextvars.ContextVar('claimed', default=False)
+
+
+class ToolDispatcher:
+    """Starts the independent function calls of one LLM response concurrently."""
+
+    def __init__(self, fnc_ctx):
+        self._fnc_ctx = fnc_ctx
+        self._started = {}  # Call key -> tasks not yet claimed by the agent
+
+        self.batches = 0
+        self.dispatched = 0
+        self.claimed = 0
+
+    def dispatch(self, function_calls):
+        """Start every known call of a response; called from the "function_calls_collected" event."""
+        self._started.clear()
+        calls = [call for call in function_calls if call.function_info.name in TOOL_RESOURCES]
+        if len(calls) < 2:
+            return
+
+        durations = []
+        last_write = {}  # Resource -> task of the latest write
+        reads = {}  # Resource -> read tasks since that write
+        tasks = []
+        for call in calls:
+            name = call.function_info.name
+            method = getattr(self._fnc_ctx, name)
+            key = self._key(name, method, call.arguments)
+            if key is None:
+                continue
+
+            after = []
+            for resource, mode in TOOL_RESOURCES[name]:
+                if resource in last_write:
+                    after.append(last_write[resource])
+                if mode == WRITE:
+                    after.extend(reads.get(resource, []))
+
+            task = asyncio.create_task(self._run(name, method, call.arguments, after, durations))
+            task.add_done_callback(_retrieve)
+            for resource, mode in TOOL_RESOURCES[name]:
+                if mode == WRITE:
+                    last_write[resource] = task
+                    reads[resource] = []
+                else:
+                    reads.setdefault(resource, []).append(task)
+
+            self._started.setdefault(key, []).append(task)
+            tasks.append(task)
+
+        if not tasks:
+            return
+        self.batches += 1
+        self.dispatched += len(tasks)
+        logger.info(f"Dispatching {len(tasks)} tool calls concurrently: {', '.join(c.function_info.name for c in calls)}")
+        asyncio.ensure_future(self._report(tasks, durations, time.perf_counter()))
+
+    def claim(self, name: str, **arguments):
+        """Task already running this exact call, or None if the tool should run itself."""
+        if _dispatching.get():
+            return None
+        started = self._started.get(self._key(name, getattr(self._fnc_ctx, name), arguments))
+        if not started:
+            return None
+        self.claimed += 1
+        claimed.set(True)
+        return started.pop(0)
+
+    async def _run(self, name: str, method, arguments, after, durations):
+        _dispatching.set(True)
+        if after:
+            await asyncio.wait(after)
+        start = time.perf_counter()
+        try:
+            return await method(**arguments)
+        finally:
+            durations.append(time.perf_counter() - start)
+
+    async def _report(self, tasks, durations, start):
+        await asyncio.wait(tasks)
+        logger.info(
+            f"{len(tasks)} dispatched tool calls finished in {time.perf_counter() - start:.3f}s "
+            f"(one after another: {sum(durations):.3f}s)"
+        )
+
+    def _key(self, name: str, method, arguments):
+        # Bind with defaults so the agent's arguments and the tool's own parameters compare equal
+        try:
+            bound = inspect.signature(method).bind(**arguments)
+        except TypeError:
+            return None
+        bound.apply_defaults()
+        return (name, tuple(sorted((k, repr(v)) for k, v in bound.arguments.items())))
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'dispatched': self.dispatched,
+            'claimed': self.claimed,
+        }
+
+
+def _retrieve(task: asyncio.Task):
+    # Unclaimed calls (an interrupted turn) must not log "exception never retrieved"
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,270 @@
+# tool_executor.py
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("voice-assistant-tools")
+
+######################################
+# TOOL EXECUTION LAYER
+######################################
+# Every tool in AssistantTools does blocking I/O (requests, googleapiclient).
+# Running that work directly inside an `async def` stalls the job's event loop,
+# which also carries VAD, STT streaming and TTS playback. The executor moves
+# the blocking part onto a bounded thread pool and enforces a per-tool deadline
+# so a slow upstream turns into a spoken fallback instead of dead air.
+#
+# Configuration (environment):
+#   TOOL_MAX_WORKERS          size of the shared thread pool (default 8)
+#   TOOL_TIMEOUT_SECONDS      default deadline for any tool (default 8)
+#   TOOL_TIMEOUT_<TOOL_NAME>  per-tool override, e.g. TOOL_TIMEOUT_GET_WEATHER=4
+#
+# Barge-in: tool calls of a turn share a TurnCancellation. When the user
+# interrupts, the awaiting side returns immediately, work still queued in the
+# pool is dropped, and work already running stops at its next upstream request
+# (check_cancelled() is called before every Google/OpenWeather request).
+#
+# The agent runs function calls after the turn's speech has been committed, so
+# none of its interruption events fire while a tool is running. BargeInMonitor
+# watches the VAD instead: the user talking over in-flight tool calls for
+# BARGE_IN_MIN_SPEECH seconds (the agent's own interruption threshold) cancels
+# them.
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TIMEOUT_SECONDS = 8.0
+DEFAULT_BARGE_IN_MIN_SPEECH = 0.5
+
+# Deadlines tuned to what each tool has to do before it can answer
+DEFAULT_TOOL_TIMEOUTS = {
+    'get_weather': 5.0,
+    'fetch_calendar_events': 6.0,
+    'create_calendar_event': 8.0,
+    'get_email_summary': 10.0,
+    'get_email_details': 6.0,
+    'create_draft': 8.0,
+}
+
+CANCELLED_RESULT = "The user interrupted, so this request was cancelled."
+
+_current = threading.local()
+
+
+class ToolCancelled(Exception):
+    """Raised inside tool work whose turn was cancelled by the user."""
+
+
+def check_cancelled():
+    """Stop the calling pool thread if the turn it works for was cancelled."""
+    turn = getattr(_current, 'turn', None)
+    if turn is not None and turn.cancelled:
+        raise ToolCancelled(f"cancelled after {turn.reason}")
+
+
+class CancellationStats:
+    """How often tool calls were cancelled and how long they kept running afterwards."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.tools = 0
+        self.never_started = 0
+        self.settled = 0
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+
+    def record_turn(self):
+        with self._lock:
+            self.turns += 1
+
+    def record_tool(self, tool_name: str, started: bool, elapsed: float):
+        with self._lock:
+            self.tools += 1
+            if not started:
+                self.never_started += 1
+        logger.info(f"Cancelled {tool_name} after {elapsed:.3f}s ({'running' if started else 'queued'})")
+
+    def record_settled(self, lateness: float):
+        # Time between the cancellation and the pool thread actually letting go
+        with self._lock:
+            self.settled += 1
+            self.total_lateness += lateness
+            self.max_lateness = max(self.max_lateness, lateness)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'turns': self.turns,
+                'tools': self.tools,
+                'never_started': self.never_started,
+                'avg_lateness': round(self.total_lateness / self.settled, 3) if self.settled else 0.0,
+                'max_lateness': round(self.max_lateness, 3),
+            }
+
+
+class TurnCancellation:
+    """Cancellation flag for the tool calls of one turn, set on the event loop and read from pool threads."""
+
+    def __init__(self, stats: CancellationStats):
+        self.stats = stats
+        self.reason = None
+        self.cancelled_at = None
+        self.active = 0  # Tool calls of this turn still being awaited
+        self._flag = threading.Event()
+        self._event = asyncio.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._flag.is_set()
+
+    def cancel(self, reason: str) -> bool:
+        """Cancel the turn; returns True if it had tool calls in flight."""
+        if self._flag.is_set():
+            return False
+        self.reason = reason
+        self.cancelled_at = time.perf_counter()
+        self._flag.set()
+        self._event.set()
+        if self.active:
+            self.stats.record_turn()
+        return self.active > 0
+
+    async def wait(self):
+        await self._event.wait()
+
+
+class BargeInMonitor:
+    """Cancels in-flight tool calls once the user has talked over them long enough to mean it."""
+
+    def __init__(self, cancel_turn, in_flight, min_speech: float = None):
+        self._cancel_turn = cancel_turn  # (reason) -> None
+        self._in_flight = in_flight  # () -> bool
+        self.min_speech = min_speech if min_speech is not None else float(
+            os.environ.get('BARGE_IN_MIN_SPEECH', DEFAULT_BARGE_IN_MIN_SPEECH))
+        self._timer = None
+
+    def attach(self, agent):
+        """Follow the agent's VAD events."""
+        agent.on("user_started_speaking", lambda *_: self.speech_started())
+        agent.on("user_stopped_speaking", lambda *_: self.speech_stopped())
+
+    def speech_started(self):
+        self.speech_stopped()
+        self._timer = asyncio.get_running_loop().call_later(self.min_speech, self._expired)
+
+    def speech_stopped(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _expired(self):
+        self._timer = None
+        # Speech that started before the tools did still counts once they are running
+        if self._in_flight():
+            self._cancel_turn("barge-in")
+
+
+class ToolExecutor:
+    """Runs blocking tool work on a bounded thread pool with per-tool deadlines."""
+
+    def __init__(self, max_workers=None, default_timeout=None, timeouts=None):
+        if max_workers is None:
+            max_workers = int(os.environ.get('TOOL_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+        if default_timeout is None:
+            default_timeout = float(os.environ.get('TOOL_TIMEOUT_SECONDS', DEFAULT_TIMEOUT_SECONDS))
+
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self._timeouts = {**DEFAULT_TOOL_TIMEOUTS, **(timeouts or {})}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='lisa-tool')
+
+    def timeout_for(self, tool_name: str) -> float:
+        """Resolve the deadline for a tool, letting the environment override the defaults."""
+        override = os.environ.get(f"TOOL_TIMEOUT_{tool_name.upper()}")
+        if override:
+            try:
+                return float(override)
+            except ValueError:
+                logger.warning(f"Ignoring invalid TOOL_TIMEOUT_{tool_name.upper()}={override!r}")
+        return self._timeouts.get(tool_name, self.default_timeout)
+
+    async def run(self, tool_name: str, func, *args, fallback: str, timeout: float = None, cancel: TurnCancellation = None, **kwargs):
+        """Run `func` off the event loop and return its result, or `fallback` on timeout.
+
+        On timeout the awaiting side is cancelled: work still queued in the pool
+        is dropped, and work already running finishes in its thread with the
+        result discarded. With `cancel`, the same happens as soon as the turn is
+        cancelled, and CANCELLED_RESULT is returned instead of the fallback.
+        """
+        if timeout is None:
+            timeout = self.timeout_for(tool_name)
+        if cancel is not None and cancel.cancelled:
+            return CANCELLED_RESULT
+
+        started = threading.Event()
+        work = self._pool.submit(self._call, cancel, started, func, args, kwargs)
+        future = asyncio.wrap_future(work)
+        waiters = {future}
+        cancel_waiter = None
+        if cancel is not None:
+            cancel.active += 1
+            cancel_waiter = asyncio.ensure_future(cancel.wait())
+            waiters.add(cancel_waiter)
+
+        start = time.perf_counter()
+        try:
+            done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if future in done:
+                return future.result()
+            if cancel_waiter in done:
+                work.cancel()
+                cancel.stats.record_tool(tool_name, started.is_set(), time.perf_counter() - start)
+                if started.is_set():
+                    cancelled_at = cancel.cancelled_at
+                    work.add_done_callback(lambda _: cancel.stats.record_settled(time.perf_counter() - cancelled_at))
+                return CANCELLED_RESULT
+            logger.warning(f"{tool_name} exceeded its {timeout:.1f}s deadline, answering with fallback")
+            return fallback
+        except ToolCancelled:
+            return CANCELLED_RESULT
+        except Exception as e:
+            logger.error(f"Unexpected error running {tool_name}: {e}")
+            return fallback
+        finally:
+            if cancel is not None:
+                cancel.active -= 1
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.cancel()
+            logger.debug(f"{tool_name} finished in {time.perf_counter() - start:.3f}s")
+
+    @staticmethod
+    def _call(cancel, started, func, args, kwargs):
+        started.set()
+        _current.turn = cancel
+        try:
+            check_cancelled()
+            return func(*args, **kwargs)
+        finally:
+            _current.turn = None
+
+    def submit(self, func, *args, **kwargs):
+        """Schedule background work on the pool without waiting for it."""
+        return self._pool.submit(func, *args, **kwargs)
+
+    def shutdown(self, wait: bool = False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_default_executor = None
+
+
+def get_default_executor() -> ToolExecutor:
+    """Process-wide executor used when a session isn't handed one explicitly."""
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = ToolExecutor()
+    return _default_executor
@@ -8,13 +8,34 @@ from typing import Annotated
 from livekit.agents import llm
 import os
 import requests
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
 import base64
 from email.mime.text import MIMEText
+from tool_executor import CancellationStats, ToolExecutor, TurnCancellation, check_cancelled, get_default_executor
+from google_clients import GoogleClientPool, get_default_pool
+from mailbox_cache import MailboxCache, MailboxCacheRegistry, get_default_registry
+from weather_cache import WeatherCache, get_default_cache, normalize_location
+from calendar_cache import CalendarCache, CalendarCacheRegistry, event_bounds
+from calendar_cache import get_default_registry as get_default_calendar_registry
+from label_writer import LabelWriter
+from email_state import EmailRecord, SessionEmails
+from email_body import BODY_FIELDS, extract_speakable_body
+from write_queue import WriteBehindQueue, new_idempotency_key
+from quota_scheduler import BACKGROUND, PREFETCH, PriorityTicket, with_priority
+from googleapiclient.errors import HttpError
+from prefetch import SpeculativePrefetcher
+from tool_dispatch import ToolDispatcher
+from turn_timeline import timed_tool
 
 logger = logging.getLogger("voice-assistant-tools")
 
+# How many of the listed emails get their bodies fetched in the background
+EMAIL_PREFETCH_COUNT = int(os.environ.get("EMAIL_PREFETCH_COUNT", "2"))
+
+OPENWEATHER_URL = os.environ.get("OPENWEATHER_URL", "http://api.openweathermap.org/data/2.5/weather")
+
+# Socket-level timeout for OpenWeather; the executor deadline bounds the whole tool
+WEATHER_HTTP_TIMEOUT = float(os.environ.get("WEATHER_HTTP_TIMEOUT", "4"))
+
 ######################################
 # MAIN TOOLS LISTING
 ######################################
@@ -46,6 +67,10 @@ class AssistantTools(llm.FunctionContext):
     def kelvin_to_celsius(self, kelvin):
         return round(kelvin - 273.15)
 
+    def weather_stats(self):
+        """Hit/miss/coalesced counters of the shared weather cache."""
+        return self._weather.stats()
+
     def get_weather_description(self, weather_data):
         temp = self.kelvin_to_celsius(weather_data['main']['temp'])
         feels_like = self.kelvin_to_celsius(weather_data['main']['feels_like'])
@@ -63,6 +88,7 @@ class AssistantTools(llm.FunctionContext):
         return "".join(responses)
 
     @llm.ai_callable()
+    @timed_tool
     async def get_weather(
         self,
         location: Annotated[
@@ -71,18 +97,40 @@ class AssistantTools(llm.FunctionContext):
     ):
         """Get real weather information for a location using OpenWeather API."""
         logger.info(f"Getting weather for {location}")
+        dispatched = self._dispatcher.claim("get_weather", location=location)
+        if dispatched is not None:
+            return await dispatched
+        return await self._executor.run(
+            "get_weather", self._get_weather, location,
+            fallback="The weather service is taking too long to respond. Please ask me again in a moment.",
+            cancel=self._turn,
+        )
+
+    def fetch_weather(self, location_key: str):
+        """Call OpenWeather for a normalized location and return (status_code, data)."""
+        response = requests.get(
+            OPENWEATHER_URL,
+            params={'q': location_key, 'appid': os.getenv('OPENWEATHER_API_KEY')},
+            timeout=WEATHER_HTTP_TIMEOUT
+        )
+        return response.status_code, response.json() if response.status_code == 200 else None
+
+    def _get_weather(self, location: str):
         try:
             api_key = os.getenv('OPENWEATHER_API_KEY')
             if not api_key:
                 return "I'm sorry, but I can't access the weather service right now due to missing API key."
 
-            url = f"http://api.openweathermap.org/data/2.5/weather?q={location}&appid={api_key}"
-            response = requests.get(url)
+            # Cached per normalized city; concurrent askers share one upstream request,
+            # so an interrupted turn stops before joining it rather than inside it
+            check_cancelled()
+            status_code, weather_data = self._weather.get(
+                normalize_location(location), self.fetch_weather, submit=self._executor.submit
+            )
 
-            if response.status_code == 200:
-                weather_data = response.json()
+            if status_code == 200:
                 return self.get_weather_description(weather_data)
-            elif response.status_code == 404:
+            elif status_code == 404:
                 return f"I'm sorry, but I couldn't find weather information for {location}. Could you please check if the location name is correct?"
             else:
                 return "I'm having trouble getting the weather information right now."
@@ -98,6 +146,7 @@ class AssistantTools(llm.FunctionContext):
     # TIME & DATE TOOLS
     ######################################
     @llm.ai_callable()
+    @timed_tool
     async def get_current_time(
         self,
         timezone: Annotated[
@@ -118,6 +167,7 @@ class AssistantTools(llm.FunctionContext):
         
     
     @llm.ai_callable()
+    @timed_tool
     async def get_current_date(self):
         """Returns the current date in a natural format."""
         ist = pytz.timezone('Asia/Kolkata')
@@ -129,6 +179,14 @@ class AssistantTools(llm.FunctionContext):
     ######################################
     # CALENDAR TOOLS
     ######################################
+    def get_calendar_cache(self) -> CalendarCache:
+        """Calendar window cache for the account behind the pooled credentials."""
+        return self._calendars.for_user(self._google.user_key)
+
+    def warm_calendar(self):
+        """Speculatively load today's calendar window into the cache."""
+        self.get_calendar_cache().refresh(self._google.calendar())
+
     def get_date_range(self, date_query: str):
         """Convert date query to start and end datetime objects."""
         ist = pytz.timezone('Asia/Kolkata')
@@ -184,6 +242,7 @@ class AssistantTools(llm.FunctionContext):
             return f"{day}{suffix} {date_obj.strftime('%B')}"
 
     @llm.ai_callable()
+    @timed_tool
     async def fetch_calendar_events(
         self,
         date_query: Annotated[
@@ -191,23 +250,42 @@ class AssistantTools(llm.FunctionContext):
         ] = "today"
     ):
         """Fetch Google Calendar events for a specific date."""
+        dispatched = self._dispatcher.claim("fetch_calendar_events", date_query=date_query)
+        if dispatched is not None:
+            return await dispatched
+        return await self._executor.run(
+            "fetch_calendar_events", self._fetch_calendar_events, date_query,
+            fallback="Your calendar is taking too long to respond. Please ask me again in a moment.",
+            cancel=self._turn,
+        )
+
+    def _fetch_calendar_events(self, date_query: str):
         try:
-            credentials = Credentials.from_authorized_user_file('token.json', ['https://www.googleapis.com/auth/calendar.readonly'])
-            service = build('calendar', 'v3', credentials=credentials)
+            service = self._google.calendar()
 
             start_time, end_time = self.get_date_range(date_query)
             if not start_time or not end_time:
                 return "I couldn't understand that date. You can ask about today, tomorrow, or a specific date."
 
-            events_result = service.events().list(
-                calendarId='primary',
-                timeMin=start_time.isoformat(),
-                timeMax=end_time.isoformat(),
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
+            # Dates inside the cached window are answered from memory after a cheap sync
+            calendar = self.get_calendar_cache()
+            if calendar.covers(start_time, end_time):
+                self._prefetcher.claim('calendar')
+                calendar.refresh(service)
+                events = calendar.events_between(start_time, end_time)
+            else:
+                events_result = service.events().list(
+                    calendarId='primary',
+                    timeMin=start_time.isoformat(),
+                    timeMax=end_time.isoformat(),
+                    singleEvents=True,
+                    orderBy='startTime',
+                    fields='items(summary,start)'
+                ).execute()
+
+                events = events_result.get('items', [])
 
-            events = events_result.get('items', [])
+            events = self.with_pending_events(events, start_time, end_time)
 
             if not events:
                 date_str = self.format_date_for_speech(start_time)
@@ -233,6 +311,7 @@ class AssistantTools(llm.FunctionContext):
             return "I'm having trouble accessing your calendar right now."
 
     @llm.ai_callable()
+    @timed_tool
     async def create_calendar_event(
         self,
         summary: Annotated[str, llm.TypeInfo(description="The title of the event")],
@@ -241,60 +320,28 @@ class AssistantTools(llm.FunctionContext):
         date: Annotated[str, llm.TypeInfo(description="Date for the event (e.g., 'today', 'tomorrow', '2024-03-25' or '25-03-2024')")] = "today"
     ):
         """Create a new event in Google Calendar."""
+        dispatched = self._dispatcher.claim("create_calendar_event", summary=summary, start_time=start_time, end_time=end_time, date=date)
+        if dispatched is not None:
+            return await dispatched
+        return await self._executor.run(
+            "create_calendar_event", self._create_calendar_event, summary, start_time, end_time, date,
+            fallback="Google Calendar is responding slowly, so I couldn't confirm that event. Please check your calendar before trying again.",
+        )
+
+    def _create_calendar_event(self, summary: str, start_time: str, end_time: str, date: str):
         try:
-            credentials = Credentials.from_authorized_user_file('token.json', ['https://www.googleapis.com/auth/calendar'])
-            service = build('calendar', 'v3', credentials=credentials)
-
-            ist = pytz.timezone('Asia/Kolkata')
-            now = datetime.now(ist)
-
-            # Get the target date
-            if date.lower() == "today":
-                target_date = now.date()
-            elif date.lower() == "tomorrow":
-                target_date = (now + timedelta(days=1)).date()
+            event, problem = self.build_calendar_event(summary, start_time, end_time, date)
+            if problem:
+                return problem
+
+            if self._writes.enabled:
+                # Confirm now; the insert lands in the background under the event's own id
+                event['id'] = new_idempotency_key()
+                self._writes.submit('calendar_event', event, f"the event {summary}", key=event['id'])
             else:
-                try:
-                    # Try parsing both date formats
-                    try:
-                        target_date = datetime.strptime(date, "%Y-%m-%d").date()
-                    except ValueError:
-                        target_date = datetime.strptime(date, "%d-%m-%Y").date()
-                except ValueError:
-                    return "Please provide the date in YYYY-MM-DD or DD-MM-YYYY format"
-
-            try:
-                start_dt = datetime.strptime(start_time, "%I:%M %p").replace(
-                    year=target_date.year, month=target_date.month, day=target_date.day)
-                end_dt = datetime.strptime(end_time, "%I:%M %p").replace(
-                    year=target_date.year, month=target_date.month, day=target_date.day)
-
-                start_dt = ist.localize(start_dt)
-                end_dt = ist.localize(end_dt)
-
-                if end_dt < start_dt:
-                    end_dt += timedelta(days=1)
-            except ValueError:
-                return "Please provide the time in 12-hour format, like 2:30 PM"
-
-            # Check if the event is in the past
-            if start_dt < now:
-                return "Sorry, I cannot schedule events in the past."
-
-            event = {
-                'summary': summary,
-                'start': {
-                    'dateTime': start_dt.isoformat(),
-                    'timeZone': 'Asia/Kolkata',
-                },
-                'end': {
-                    'dateTime': end_dt.isoformat(),
-                    'timeZone': 'Asia/Kolkata',
-                },
-            }
-
-            created_event = service.events().insert(calendarId='primary', body=event).execute()
+                self.insert_calendar_event(event)
 
+            start_dt = datetime.fromisoformat(event['start']['dateTime'])
             time_str = self.format_event_time(start_dt)
             date_str = self.format_date_for_speech(start_dt)
             return f"I've scheduled {summary} for {time_str} {date_str}."
@@ -303,75 +350,459 @@ class AssistantTools(llm.FunctionContext):
             logger.error(f"Error creating calendar event: {e}")
             return "I couldn't create that event. Please try again with a different time."
 
+    def build_calendar_event(self, summary: str, start_time: str, end_time: str, date: str):
+        """Validate a spoken event request: returns (event body, None) or (None, what to tell the user)."""
+        ist = pytz.timezone('Asia/Kolkata')
+        now = datetime.now(ist)
+
+        # Get the target date
+        if date.lower() == "today":
+            target_date = now.date()
+        elif date.lower() == "tomorrow":
+            target_date = (now + timedelta(days=1)).date()
+        else:
+            try:
+                # Try parsing both date formats
+                try:
+                    target_date = datetime.strptime(date, "%Y-%m-%d").date()
+                except ValueError:
+                    target_date = datetime.strptime(date, "%d-%m-%Y").date()
+            except ValueError:
+                return None, "Please provide the date in YYYY-MM-DD or DD-MM-YYYY format"
+
+        try:
+            start_dt = datetime.strptime(start_time, "%I:%M %p").replace(
+                year=target_date.year, month=target_date.month, day=target_date.day)
+            end_dt = datetime.strptime(end_time, "%I:%M %p").replace(
+                year=target_date.year, month=target_date.month, day=target_date.day)
+
+            start_dt = ist.localize(start_dt)
+            end_dt = ist.localize(end_dt)
+
+            if end_dt < start_dt:
+                end_dt += timedelta(days=1)
+        except ValueError:
+            return None, "Please provide the time in 12-hour format, like 2:30 PM"
+
+        # Check if the event is in the past
+        if start_dt < now:
+            return None, "Sorry, I cannot schedule events in the past."
+
+        event = {
+            'summary': summary,
+            'start': {
+                'dateTime': start_dt.isoformat(),
+                'timeZone': 'Asia/Kolkata',
+            },
+            'end': {
+                'dateTime': end_dt.isoformat(),
+                'timeZone': 'Asia/Kolkata',
+            },
+        }
+
+        return event, None
+
+    def insert_calendar_event(self, event, key: str = None, attempt: int = 1):
+        """events.insert, written through to the calendar cache; a retried insert of an id that exists is a success."""
+        service = self._google.calendar()
+        try:
+            created_event = service.events().insert(
+                calendarId='primary',
+                body=event,
+                fields='id,status,summary,start,end'
+            ).execute()
+        except HttpError as e:
+            if not (key and attempt > 1 and e.resp.status == 409):
+                raise
+            # An earlier attempt got through before failing on our side
+            created_event = service.events().get(
+                calendarId='primary',
+                eventId=key,
+                fields='id,status,summary,start,end'
+            ).execute()
+        self.get_calendar_cache().add(created_event)
+        return created_event
+
+    def with_pending_events(self, events, start_time: datetime, end_time: datetime):
+        """Add events confirmed to the user but still queued for Google, so reads agree with what we said."""
+        pending = self._writes.pending('calendar_event')
+        if not pending:
+            return events
+        known = {event.get('id') for event in events}
+        for event in pending:
+            event_start, event_end = event_bounds(event)
+            if event['id'] not in known and event_end > start_time and event_start < end_time:
+                events = events + [event]
+        return sorted(events, key=lambda event: event_bounds(event)[0])
+
     ######################################
     # GMAIL TOOLS
     ######################################
     
-    GMAIL_SCOPES = [
-        'https://mail.google.com/',
-        'https://www.googleapis.com/auth/gmail.readonly',
-        'https://www.googleapis.com/auth/gmail.modify',
-        'https://www.googleapis.com/auth/gmail.labels'
-    ]
-
-    def __init__(self):
+    def __init__(
+        self,
+        executor: ToolExecutor = None,
+        google_clients: GoogleClientPool = None,
+        mailbox_caches: MailboxCacheRegistry = None,
+        weather_cache: WeatherCache = None,
+        calendar_caches: CalendarCacheRegistry = None,
+    ):
         super().__init__()
-        self.current_emails = {}  # Store email details for reference
+        self._executor = executor or get_default_executor()
+        self._google = google_clients or get_default_pool()
+        self._mailboxes = mailbox_caches or get_default_registry()
+        self._weather = weather_cache or get_default_cache()
+        self._calendars = calendar_caches or get_default_calendar_registry()
+        self.current_emails = SessionEmails()  # Numbered listing from the last email summary
         self.discussed_emails = set()  # Track which emails have been discussed
+        self._body_prefetches = {}  # Message id -> (background body fetch, its priority ticket)
+        self._labels = LabelWriter(self._executor, self.get_gmail_service, self.get_mailbox)
+        self._prefetcher = SpeculativePrefetcher(self._executor, {
+            'email': self.warm_inbox,
+            'calendar': self.warm_calendar,
+        })
+        self._dispatcher = ToolDispatcher(self)
+        self.on_tool_finished = None  # (tool name, seconds) hook for the turn timeline
+        self._cancellations = CancellationStats()
+        self._turn = TurnCancellation(self._cancellations)  # Shared by the tool calls of the current turn
+        self._writes = WriteBehindQueue(self._executor, user_key=self._google.user_key)
+        # Already confirmed to the user, so they yield Google quota to live requests
+        self._writes.register('calendar_event', with_priority(BACKGROUND, self.insert_calendar_event))
+        self._writes.register('draft', with_priority(BACKGROUND, self.save_draft))
+        self._writes.on_failed = self._write_failed
+        self.on_write_failed = None  # (notice) hook to tell the user a confirmed write didn't land
+
+    def cancel_turn(self, reason: str):
+        """Cancel tool calls still running for the current turn (the user talked over them).
+
+        Only reads are tied to the turn; drafts and calendar events the user asked
+        for are still written.
+        """
+        turn, self._turn = self._turn, TurnCancellation(self._cancellations)
+        if turn.cancel(reason):
+            logger.info(f"Cancelling in-flight tool calls after {reason}")
+
+    def tools_in_flight(self) -> bool:
+        """Whether tool calls of the current turn are still being awaited."""
+        return self._turn.active > 0
+
+    def cancellation_stats(self):
+        return self._cancellations.stats()
+
+    def _write_failed(self, notice: str):
+        if self.on_write_failed is not None:
+            self.on_write_failed(notice)
+
+    def resume_writes(self):
+        """Pick up queued writes that earlier sessions of this account on the host left unfinished."""
+        self._writes.resume()
+
+    async def drain_writes(self):
+        """Give queued drafts and events a chance to land, e.g. at session shutdown."""
+        await self._writes.drain()
+
+    def write_stats(self):
+        return self._writes.stats()
+
+    def quota_stats(self):
+        return self._google.scheduler.stats()
+
+    def dump_quota_counters(self, directory: str):
+        self._google.scheduler.dump(directory)
+
+    @property
+    def user_key(self) -> str:
+        """Key of the Google account this session acts for."""
+        return self._google.user_key
+
+    async def run_blocking(self, func, *args):
+        """Run blocking session housekeeping (e.g. SQLite) on the tool pool instead of the event loop."""
+        return await asyncio.wrap_future(self._executor.submit(func, *args))
+
+    def export_state(self):
+        """Per-session tool state as JSON, so a rejoining participant can pick up where they left off."""
+        return {
+            'user_key': self._google.user_key,
+            # Saved state can land in the on-disk shared cache; bodies are fetched again on resume
+            'emails': self.current_emails.export(bodies=False),
+            'discussed': sorted(self.discussed_emails),
+        }
+
+    def restore_state(self, state) -> bool:
+        """Reattach state saved by export_state(); ignored if it belongs to another Google account."""
+        try:
+            if state.get('user_key') != self._google.user_key:
+                return False
+            self.current_emails.restore(state.get('emails', []))
+            self.discussed_emails = set(state.get('discussed', []))
+            return True
+        except Exception as e:
+            logger.error(f"Could not restore the previous session's tool state: {e}")
+            return False
+
+    def dispatch_calls(self, function_calls):
+        """Start the independent calls of one LLM response together instead of one by one."""
+        self._dispatcher.dispatch(function_calls)
+
+    def dispatch_stats(self):
+        return self._dispatcher.stats()
+
+    def prefetch_for_input(self, user_input: str):
+        """Start warming the data a user turn is likely to need, before the LLM asks for it."""
+        return self._prefetcher.start(user_input)
+
+    def settle_prefetches(self):
+        """Give up on prefetches the conversation didn't use."""
+        self._prefetcher.settle()
+
+    def prefetch_stats(self):
+        return self._prefetcher.stats()
 
     def get_gmail_service(self):
-        """Helper function to create authenticated Gmail service."""
+        """Helper function to borrow the pooled Gmail service for this thread."""
         try:
-            credentials = Credentials.from_authorized_user_file(
-                'token.json', 
-                self.GMAIL_SCOPES + [
-                    'https://www.googleapis.com/auth/calendar',
-                    'https://www.googleapis.com/auth/calendar.readonly'
-                ]
-            )
-            return build('gmail', 'v1', credentials=credentials)
+            return self._google.gmail()
         except Exception as e:
             logger.error(f"Error creating Gmail service: {e}")
             raise
 
+    def get_mailbox(self) -> MailboxCache:
+        """Mailbox cache for the account behind the pooled credentials."""
+        return self._mailboxes.for_user(self._google.user_key)
+
+    def parse_email_headers(self, message):
+        """Turn a metadata-format message into the fields we speak and reply to."""
+        headers = message['payload']['headers']
+        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No subject')
+        sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown sender')
+        return {
+            'sender_name': sender.split('<')[0].strip(),
+            'sender_email': sender.split('<')[1].strip('>') if '<' in sender else sender,
+            'subject': subject,
+            'snippet': message.get('snippet', ''),
+            'history_id': message.get('historyId'),
+            'body': None,  # Loaded lazily by get_email_details
+        }
+
+    def fetch_email_metadata(self, service, message_ids):
+        """Fetch Subject/From headers for many messages in one batch round trip."""
+        results = {}
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                logger.error(f"Error fetching email metadata: {exception}")
+                return
+            results[request_id] = response
+
+        batch = service.new_batch_http_request(callback=on_response)
+        for message_id in message_ids:
+            batch.add(
+                service.users().messages().get(
+                    userId='me',
+                    id=message_id,
+                    format='metadata',
+                    metadataHeaders=['Subject', 'From'],
+                    fields='id,historyId,snippet,payload/headers'
+                ),
+                request_id=message_id
+            )
+        batch.execute()
+        return results
+
+    def fetch_email_body(self, message_id: str):
+        """Decoded body of a message, from the mailbox cache or Gmail, and whether a speech cap cut it off."""
+        mailbox = self.get_mailbox()
+        body = mailbox.get_body(message_id)
+        if body is not None:
+            return body, mailbox.body_cut_off(message_id)
+
+        service = self.get_gmail_service()
+        message = service.users().messages().get(
+            userId='me',
+            id=message_id,
+            format='full',
+            fields=BODY_FIELDS
+        ).execute()
+
+        def fetch_part(attachment_id):
+            # Bodies too large to come inline are fetched only if they are the part we read
+            return service.users().messages().attachments().get(
+                userId='me', messageId=message_id, id=attachment_id, fields='data'
+            ).execute()['data']
+
+        body, cut_off = extract_speakable_body(message['payload'], fetch_data=fetch_part)
+        mailbox.set_body(message_id, body, cut_off)
+        return body, cut_off
+
+    def load_email_body(self, record: EmailRecord) -> str:
+        """Speakable head of a listed email's body, fetched the first time it is needed."""
+        body = record.body
+        if body is None:
+            body, _ = self.fetch_email_body(record.id)
+            return self.current_emails.set_body(record, body)
+        self.current_emails.touch(record)
+        return body
+
+    def prefetch_email_bodies(self, count: int):
+        """Start background body fetches for the first few listed emails."""
+        for record in self.current_emails.first(count):
+            if record.body is None:
+                ticket = PriorityTicket(PREFETCH)
+                future = self._executor.submit(with_priority(ticket, self.load_email_body), record)
+                self._body_prefetches[record.id] = (future, ticket)
+
+    def wait_for_email_body(self, record: EmailRecord) -> str:
+        """Use a body prefetch already in flight, or fetch it now if the prefetch hasn't started."""
+        future, ticket = self._body_prefetches.pop(record.id, (None, None))
+        if future is not None and not future.cancel():
+            # The user is waiting now; stop yielding quota to other work
+            ticket.escalate()
+            try:
+                future.result()
+            except Exception as e:
+                logger.warning(f"Email body prefetch failed, fetching again: {e}")
+        return self.load_email_body(record)
+
+    def load_email_listing(self, service, search_query: str = None):
+        """Resolve the message ids for a query and their cached or freshly batched headers."""
+        # Build search query
+        query = search_query if search_query else ''
+
+        # Reuse the last listing for this query when history shows no mailbox changes
+        mailbox = self.get_mailbox()
+        unchanged = mailbox.sync(service)
+        message_ids = None
+
+        # Free-text searches over the recent window are answered from the local index;
+        # Gmail operators (from:, is:, ...) and misses still go to Gmail search
+        if unchanged and search_query and ':' not in search_query:
+            message_ids = mailbox.search(search_query) or None
+            if message_ids:
+                logger.info(f"Answered email search '{search_query}' from the local index")
+
+        if message_ids is None and unchanged:
+            message_ids = mailbox.listing(query)
+
+        if message_ids is None:
+            # Get recent emails - fetch more but show less
+            results = service.users().messages().list(
+                userId='me',
+                maxResults=25,  # Fetch last 25 emails
+                q=query,  # Include search query if provided
+                fields='messages(id)'
+            ).execute()
+            message_ids = [msg['id'] for msg in results.get('messages', [])]
+            mailbox.set_listing(query, message_ids)
+
+        if not message_ids:
+            return message_ids, {}
+
+        # Serve known messages from the cache and collect the ones we've never seen
+        entries = {}
+        missing_ids = []
+        for message_id in message_ids:
+            entry = mailbox.get(message_id)
+            if entry is None:
+                missing_ids.append(message_id)
+            else:
+                entries[message_id] = entry
+
+        # Headers only, all in one batch; bodies are fetched when an email is read
+        if missing_ids:
+            for message_id, message in self.fetch_email_metadata(service, missing_ids).items():
+                entry = self.parse_email_headers(message)
+                mailbox.put(message_id, entry)
+                entries[message_id] = entry
+
+        return message_ids, entries
+
+    def fetch_unread_count(self) -> int:
+        """Read the INBOX unread counter (one labels.get) and cache it with the mailbox state."""
+        label = self.get_gmail_service().users().labels().get(
+            userId='me',
+            id='INBOX',
+            fields='messagesUnread'
+        ).execute()
+        unread_count = label.get('messagesUnread', 0)
+        self.get_mailbox().unread_count = unread_count
+        return unread_count
+
+    def warm_inbox(self):
+        """Speculatively sync the inbox listing and headers into the mailbox cache."""
+        self.load_email_listing(self.get_gmail_service())
+
     @llm.ai_callable()
+    @timed_tool
     async def get_email_details(
         self,
-        email_number: Annotated[str, llm.TypeInfo(description="The number of the email to read")]
+        email_number: Annotated[str, llm.TypeInfo(description="The number of the email to read")],
+        read_rest: Annotated[
+            bool, llm.TypeInfo(description="True only when the user asks to hear the rest of a long email")
+        ] = False
     ):
         """Get detailed content of a specific email and mark it as discussed."""
+        dispatched = self._dispatcher.claim("get_email_details", email_number=email_number, read_rest=read_rest)
+        if dispatched is not None:
+            return await dispatched
+        result = await self._executor.run(
+            "get_email_details", self._get_email_details, email_number, read_rest,
+            fallback="Gmail is taking too long to respond. Please ask me to read that email again in a moment.",
+            cancel=self._turn,
+        )
+        # Labelling happens after the turn, batched with other discussed emails
+        self._labels.schedule_flush()
+        return result
+
+    async def flush_labels(self):
+        """Write any pending "seen-by-lisa" labels now, e.g. at session shutdown."""
+        await self._labels.flush()
+
+    def _get_email_details(self, email_number: str, read_rest: bool = False):
         try:
-            if email_number not in self.current_emails:
+            record = self.current_emails.by_number(email_number)
+            if record is None:
                 return "Email not found in current conversation."
-                
-            email_data = self.current_emails[email_number]
-            service = self.get_gmail_service()
 
-            # Mark this email as discussed
-            self.discussed_emails.add(email_data['id'])
-
-            # Get the label ID for "seen-by-lisa"
-            labels = service.users().labels().list(userId='me').execute()
-            lisa_label_id = next(
-                (label['id'] for label in labels['labels'] if label['name'] == 'seen-by-lisa'),
-                None
-            )
+            body = self.wait_for_email_body(record)
+            truncated = record.body_truncated
 
-            # Only label emails that are specifically discussed
-            if lisa_label_id:
-                service.users().messages().modify(
-                    userId='me',
-                    id=email_data['id'],
-                    body={'addLabelIds': [lisa_label_id]}
-                ).execute()
-
-            return f"Email from {email_data['sender_name']} with subject '{email_data['subject']}'\n\nContent:\n{email_data['body']}"
+            # Mark this email as discussed
+            self.discussed_emails.add(record.id)
+
+            # Only label emails that are specifically discussed; the write is queued
+            self._labels.queue(record.id)
+
+            # The body itself may stop at the speech cap, well before the email does
+            cut_off_notice = (f"That is as much of the email from {record.sender_name} as I can read; "
+                              "the rest was cut off because the email is too long.")
+            if read_rest:
+                if not truncated:
+                    if self.get_mailbox().body_cut_off(record.id):
+                        return cut_off_notice
+                    return f"That was the whole email from {record.sender_name}; there is nothing more to read."
+                # Only the head is kept per session; the rest comes from the mailbox cache or Gmail
+                text, cut_off = self.fetch_email_body(record.id)
+                body, truncated = self.current_emails.next_part(record, text)
+                if not body:
+                    if cut_off:
+                        return cut_off_notice
+                    return f"That was the end of the email from {record.sender_name}; there is nothing more to read."
+                details = f"Continuation of the email from {record.sender_name} with subject '{record.subject}'\n\nContent:\n{body}"
+            else:
+                cut_off = not truncated and self.get_mailbox().body_cut_off(record.id)
+                details = f"Email from {record.sender_name} with subject '{record.subject}'\n\nContent:\n{body}"
+            if truncated:
+                details += "\n\n(There is more to this email; the user can ask to hear the rest.)"
+            elif cut_off:
+                details += "\n\n(The email was cut off here because it is too long to read the rest.)"
+            return details
 
         except Exception as e:
             logger.error(f"Error getting email details: {e}")
             return "Failed to get email details."
 
     @llm.ai_callable()
+    @timed_tool
     async def get_email_summary(
         self,
         max_results: Annotated[
@@ -382,96 +813,66 @@ class AssistantTools(llm.FunctionContext):
         ] = None
     ):
         """Get a summary of recent emails including unread and important messages."""
+        dispatched = self._dispatcher.claim("get_email_summary", max_results=max_results, search_query=search_query)
+        if dispatched is not None:
+            return await dispatched
+        return await self._executor.run(
+            "get_email_summary", self._get_email_summary, max_results, search_query,
+            fallback="Gmail is taking too long to respond right now. Please ask me to check your emails again in a moment.",
+            cancel=self._turn,
+        )
+
+    def _get_email_summary(self, max_results: int, search_query: str = None):
         try:
             service = self.get_gmail_service()
             
             # Clear previous email cache and discussed emails
             self.current_emails.clear()
             self.discussed_emails.clear()
+            for prefetch, _ in self._body_prefetches.values():
+                prefetch.cancel()
+            self._body_prefetches.clear()
             
-            # Get unread emails count first
-            unread_results = service.users().messages().list(
-                userId='me',
-                q='is:unread',
-                maxResults=1
-            ).execute()
-            unread_count = len(unread_results.get('messages', []))
-            
-            # Build search query
-            query = search_query if search_query else ''
-            
-            # Get recent emails - fetch more but show less
-            results = service.users().messages().list(
-                userId='me',
-                maxResults=25,  # Fetch last 25 emails
-                q=query  # Include search query if provided
-            ).execute()
-            messages = results.get('messages', [])
+            # Unread count comes from the INBOX label counter, fetched alongside the listing
+            mailbox = self.get_mailbox()
+            unread_future = None
+            if mailbox.unread_count is None:
+                unread_future = self._executor.submit(self.fetch_unread_count)
+
+            self._prefetcher.claim('email')
+            message_ids, entries = self.load_email_listing(service, search_query)
 
-            if not messages:
+            if unread_future is not None and not unread_future.cancel():
+                unread_count = unread_future.result()
+            else:
+                # Cached and still valid, or the pool was too busy to start the lookup
+                unread_count = mailbox.unread_count
+                if unread_count is None:
+                    unread_count = self.fetch_unread_count()
+
+            if not message_ids:
                 return "No emails found matching your criteria."
 
-            # Process only the first max_results for display
-            display_messages = messages[:max_results]
-            
-            email_details = []
-            # Store all messages in cache but only show max_results
-            for i, msg in enumerate(messages):
-                try:
-                    message = service.users().messages().get(
-                        userId='me', 
-                        id=msg['id'],
-                        format='full'
-                    ).execute()
-
-                    headers = message['payload']['headers']
-                    subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No subject')
-                    sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown sender')
-                    sender_name = sender.split('<')[0].strip()
-                    sender_email = sender.split('<')[1].strip('>') if '<' in sender else sender
-                    
-                    # Extract email body
-                    body = ""
-                    if 'parts' in message['payload']:
-                        for part in message['payload']['parts']:
-                            if part['mimeType'] == 'text/plain':
-                                body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                                break
-                    elif 'body' in message['payload'] and 'data' in message['payload']['body']:
-                        body = base64.urlsafe_b64decode(message['payload']['body']['data']).decode('utf-8')
-
-                    # Store all emails in cache with their index
-                    self.current_emails[str(i + 1)] = {
-                        'id': msg['id'],
-                        'sender_name': sender_name,
-                        'sender_email': sender_email,
-                        'subject': subject,
-                        'body': body
-                    }
-                    
-                    # Only add to display list if it's within max_results
-                    if msg['id'] in [m['id'] for m in display_messages]:
-                        email_details.append({
-                            'number': len(email_details) + 1,
-                            'sender': sender_name,
-                            'subject': subject
-                        })
+            # Number every listed email we have headers for, but only show max_results
+            self.current_emails.replace(
+                (message_id, entries[message_id]) for message_id in message_ids if message_id in entries
+            )
+            displayed = self.current_emails.first(max_results)
 
-                except Exception as e:
-                    logger.error(f"Error fetching email details: {e}")
-                    continue
+            if EMAIL_PREFETCH_COUNT > 0:
+                self.prefetch_email_bodies(min(EMAIL_PREFETCH_COUNT, len(displayed)))
 
-            if not email_details:
+            if not displayed:
                 return "I can see your emails but couldn't read their details. Please try again."
 
             # Construct response based on whether this was a search or regular summary
             if search_query:
-                summary = f"Found {len(messages)} emails matching your search. Here are the most recent {len(email_details)}:\n"
+                summary = f"Found {len(message_ids)} emails matching your search. Here are the most recent {len(displayed)}:\n"
             else:
-                summary = f"You have {unread_count} unread emails. Here are your {len(email_details)} most recent messages:\n"
+                summary = f"You have {unread_count} unread emails. Here are your {len(displayed)} most recent messages:\n"
             
-            for email in email_details:
-                summary += f"\n{email['number']}. From {email['sender']} about '{email['subject']}'"
+            for record in displayed:
+                summary += f"\n{record.number}. From {record.sender_name} about '{record.subject}'"
             
             summary += "\n\nYou can ask me to read any email by saying 'read email number [1-5]'"
             if search_query:
@@ -484,6 +885,7 @@ class AssistantTools(llm.FunctionContext):
             return "I'm having trouble accessing your Gmail right now. Please make sure I have the correct permissions."
 
     @llm.ai_callable()
+    @timed_tool
     async def create_draft(
         self,
         to: Annotated[str, llm.TypeInfo(description="Email address of the recipient")],
@@ -491,52 +893,83 @@ class AssistantTools(llm.FunctionContext):
         body: Annotated[str, llm.TypeInfo(description="Content of the email")]
     ):
         """Create a new draft email."""
+        dispatched = self._dispatcher.claim("create_draft", to=to, subject=subject, body=body)
+        if dispatched is not None:
+            return await dispatched
+        return await self._executor.run(
+            "create_draft", self._create_draft, to, subject, body,
+            fallback="Gmail is responding slowly, so I couldn't confirm the draft was saved. Please check your drafts before trying again.",
+        )
+
+    def _create_draft(self, to: str, subject: str, body: str):
         try:
-            service = self.get_gmail_service()
-            
             # Check if user referred to a sender by name or number
-            if to.isdigit() and to in self.current_emails:
-                to = self.current_emails[to]['sender_email']
+            if to.isdigit() and self.current_emails.by_number(to) is not None:
+                to = self.current_emails.by_number(to).sender_email
             elif not '@' in to and self.current_emails:
                 # Try to find sender by name
-                for email in self.current_emails.values():
-                    if to.lower() in email['sender_name'].lower():
-                        to = email['sender_email']
-                        break
+                record = self.current_emails.find_sender(to)
+                if record is not None:
+                    to = record.sender_email
             
             # Basic email validation
             if not '@' in to:
                 return "Please provide a valid email address with @ symbol."
-            
-            # Create message container
-            message = MIMEText(body, 'plain', 'utf-8')
-            message['to'] = to
-            message['from'] = 'me'  # Gmail API requires this
-            message['subject'] = subject
 
-            # Properly encode the message
-            raw_message = base64.urlsafe_b64encode(
-                message.as_string().encode('utf-8')
-            ).decode('utf-8')
+            draft = {'to': to, 'subject': subject, 'body': body}
+            recipient_name = to.split('@')[0]
 
-            try:
-                draft = service.users().drafts().create(
-                    userId='me',
-                    body={
-                        'message': {
-                            'raw': raw_message
-                        }
-                    }
-                ).execute()
-
-                recipient_name = to.split('@')[0]
-                return f"I've saved your email to {recipient_name} as a draft. You can review and send it from your Gmail."
+            if self._writes.enabled:
+                self._writes.submit('draft', draft, f"your draft to {recipient_name}")
+            else:
+                try:
+                    self.save_draft(draft)
+                except Exception as e:
+                    if 'Invalid To header' in str(e):
+                        return f"The email address '{to}' appears to be invalid. Please provide a valid email address."
+                    raise
 
-            except Exception as e:
-                if 'Invalid To header' in str(e):
-                    return f"The email address '{to}' appears to be invalid. Please provide a valid email address."
-                raise
+            return f"I've saved your email to {recipient_name} as a draft. You can review and send it from your Gmail."
 
         except Exception as e:
             logger.error(f"Error creating draft: {e}")
             return "I couldn't create the draft email. Please try again with a valid email address."
+
+    def save_draft(self, draft, key: str = None, attempt: int = 1):
+        """drafts.create; with an idempotency key the draft carries it as its Message-ID so retries can't duplicate it."""
+        service = self.get_gmail_service()
+
+        # Create message container
+        message = MIMEText(draft['body'], 'plain', 'utf-8')
+        message['to'] = draft['to']
+        message['from'] = 'me'  # Gmail API requires this
+        message['subject'] = draft['subject']
+
+        if key:
+            message_id = f"{key}@lisa.local"
+            message['Message-ID'] = f"<{message_id}>"
+            if attempt > 1:
+                # An earlier attempt may have been saved before its response was lost
+                existing = service.users().messages().list(
+                    userId='me',
+                    q=f"in:drafts rfc822msgid:{message_id}",
+                    maxResults=1,
+                    fields='messages(id)'
+                ).execute()
+                if existing.get('messages'):
+                    return
+
+        # Properly encode the message
+        raw_message = base64.urlsafe_b64encode(
+            message.as_string().encode('utf-8')
+        ).decode('utf-8')
+
+        service.users().drafts().create(
+            userId='me',
+            body={
+                'message': {
+                    'raw': raw_message
+                }
+            },
+            fields='id'
+        ).execute()
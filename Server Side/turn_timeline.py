@@ -0,0 +1,384 @@
+# turn_timeline.py
+
+import functools
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from livekit.agents import metrics
+
+from quota_scheduler import render_counters
+from tool_dispatch import claimed
+
+logger = logging.getLogger("voice-assistant")
+
+######################################
+# TURN LATENCY TIMELINE
+######################################
+# Every user turn is timed from the moment the user stops speaking (VAD), or a
+# chat message arrives, until Lisa's audio starts playing:
+#
+#   end_of_utterance  VAD end of speech -> end of utterance decided
+#   stt_final         VAD end of speech -> final transcript
+#   llm_ttft          first LLM request of the turn, time to first token
+#   tool:<name>       each tool call's own duration
+#   tts_ttfb          first TTS request of the turn, time to first byte
+#   playout_start     end of speech -> agent starts speaking
+#
+# Finished turns are appended to a JSONL file per session and fed into the
+# job process's per-stage summaries (p50/p95/p99 over recent turns), logged
+# when the session ends.
+#
+# Each session runs in its own job process, so the /metrics endpoint is not
+# served from there. The worker's main process serves it on one fixed port and
+# builds it from the files the job processes leave in TURN_LOG_DIR: it tails
+# every session's JSONL for turns finished since it started, and sums the
+# Google quota counters each job process writes there as its sessions end.
+# A counters file counts only while the process that wrote it is alive (it
+# removes the file as it exits) and is younger than the retention period. A
+# scrape only opens the logs that grew since the previous one. The JSONL files
+# remain the record for offline analysis until they are older than the
+# retention period; the main process then deletes them.
+#
+# Configuration (environment):
+#   METRICS_PORT              port of the host-wide /metrics; 0 disables it (default 9464)
+#   TURN_LOG_DIR              directory of the per-session JSONL files (default turn_logs)
+#   TURN_LOG_RETENTION_DAYS   days a session's JSONL is kept; 0 keeps them forever (default 7)
+
+DEFAULT_METRICS_PORT = 9464
+DEFAULT_TURN_LOG_DIR = 'turn_logs'
+DEFAULT_TURN_LOG_RETENTION_DAYS = 7.0
+PRUNE_INTERVAL = 3600.0  # Seconds between sweeps for expired logs
+
+# Room names come from clients; only these characters reach a file name
+_UNSAFE_NAME = re.compile(r'[^A-Za-z0-9_-]')
+_COUNTERS_FILE = re.compile(r'google-(\d+)\.json$')
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Alive, just owned by another user
+    return True
+
+QUANTILES = (0.5, 0.95, 0.99)
+SAMPLE_WINDOW = 2000  # Recent samples kept per stage for the quantiles
+SLOW_TURN_SECONDS = 3.0  # Turns slower than this to first audio are logged in full
+
+
+def timed_tool(func):
+    """Report an AssistantTools call's duration to the session's `on_tool_finished` hook."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        token = claimed.set(False)
+        start = time.perf_counter()
+        try:
+            return await func(self, *args, **kwargs)
+        finally:
+            # A claimed call is timed by the dispatched task that did the work
+            if self.on_tool_finished is not None and not claimed.get():
+                self.on_tool_finished(name, time.perf_counter() - start)
+            claimed.reset(token)
+
+    return wrapper
+
+
+class LatencyRegistry:
+    """Per-stage latency samples with their Prometheus text exposition."""
+
+    def __init__(self, window: int = SAMPLE_WINDOW):
+        self.window = window
+        self._samples = {}  # stage -> deque of recent seconds
+        self._totals = {}  # stage -> (count, sum) since start
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+            samples.append(seconds)
+            count, total = self._totals.get(stage, (0, 0.0))
+            self._totals[stage] = (count + 1, total + seconds)
+
+    def quantiles(self, stage: str):
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if not samples:
+            return {}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in QUANTILES}
+
+    def render(self) -> str:
+        """Prometheus text exposition of every stage as a summary."""
+        with self._lock:
+            stages = sorted(self._samples)
+            totals = dict(self._totals)
+        lines = [
+            "# HELP lisa_turn_stage_seconds Latency of each stage of a conversation turn.",
+            "# TYPE lisa_turn_stage_seconds summary",
+        ]
+        for stage in stages:
+            for q, value in self.quantiles(stage).items():
+                lines.append(f'lisa_turn_stage_seconds{{stage="{stage}",quantile="{q}"}} {value:.6f}')
+            count, total = totals[stage]
+            lines.append(f'lisa_turn_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'lisa_turn_stage_seconds_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        return {
+            stage: {f"p{int(q * 100)}": round(v, 3) for q, v in self.quantiles(stage).items()}
+            for stage in sorted(self._samples)
+        }
+
+
+class TurnLogAggregator:
+    """Host-wide /metrics, built in the main process from the files every job process writes."""
+
+    def __init__(self, log_dir: str = None, window: int = SAMPLE_WINDOW, retention_days: float = None):
+        self.log_dir = log_dir or os.environ.get('TURN_LOG_DIR', DEFAULT_TURN_LOG_DIR)
+        os.makedirs(self.log_dir, exist_ok=True)
+        if retention_days is None:
+            retention_days = float(os.environ.get('TURN_LOG_RETENTION_DAYS', DEFAULT_TURN_LOG_RETENTION_DAYS))
+        self.retention = retention_days * 86400
+        self.latency = LatencyRegistry(window)
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+        self._server = None
+        self.port = None
+        self.pruned = 0
+        # Counted from now on, like any other counter of this process
+        self._offsets = dict(self._turn_logs())  # turn log path -> bytes already read
+
+    def _turn_logs(self):
+        """(path, size) of every session log in the directory."""
+        logs = []
+        with os.scandir(self.log_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.jsonl'):
+                    try:
+                        logs.append((entry.path, entry.stat().st_size))
+                    except OSError:
+                        continue
+        return logs
+
+    def prune(self):
+        """Delete session logs past the retention period and counters of processes that are gone."""
+        for path in glob.glob(os.path.join(self.log_dir, 'google-*.json')):
+            match = _COUNTERS_FILE.search(path)
+            if match is not None and not _process_alive(int(match.group(1))):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+        if not self.retention:
+            return
+        cutoff = time.time() - self.retention
+        for path in glob.glob(os.path.join(self.log_dir, '*.jsonl')):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    self.pruned += 1
+            except OSError:
+                continue
+
+    def collect(self):
+        """Fold in the turns appended to any session's log since the last scrape."""
+        with self._lock:
+            if time.time() - self._pruned_at > PRUNE_INTERVAL:
+                self._pruned_at = time.time()
+                self.prune()
+            logs = self._turn_logs()
+            # Deleted logs are forgotten, so the map stays as small as the directory
+            self._offsets = {path: self._offsets.get(path, 0) for path, _ in logs}
+            for path, size in logs:
+                offset = self._offsets[path]
+                if size <= offset:
+                    # Nothing appended since the last scrape: not even opened
+                    continue
+                try:
+                    with open(path, 'rb') as f:
+                        f.seek(offset)
+                        data = f.read(size - offset)
+                except OSError:
+                    continue
+                # A line still being written is picked up by the next scrape
+                end = data.rfind(b"\n") + 1
+                self._offsets[path] = offset + end
+                for line in data[:end].splitlines():
+                    try:
+                        self._observe(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        continue
+
+    def _observe(self, record):
+        for tool in record.get('tools', []):
+            self.latency.observe(f"tool:{tool['name']}", tool['seconds'])
+        if record.get('completed'):
+            for stage, seconds in record['stages'].items():
+                self.latency.observe(stage, seconds)
+
+    def google_counters(self):
+        """Sum of the quota counters every job process on this host has written."""
+        totals = {}
+        cutoff = time.time() - self.retention if self.retention else 0
+        for path in glob.glob(os.path.join(self.log_dir, 'google-*.json')):
+            match = _COUNTERS_FILE.search(path)
+            # Left behind by a process that was killed, or a pid that has since been reused
+            if match is None or not _process_alive(int(match.group(1))):
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    continue
+                with open(path, encoding='utf-8') as f:
+                    counters = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, values in counters.items():
+                merged = totals.setdefault(name, {})
+                for key, n in values.items():
+                    merged[key] = merged.get(key, 0) + n
+        return totals
+
+    def render(self) -> str:
+        self.collect()
+        return self.latency.render() + render_counters(self.google_counters())
+
+    def serve(self, port: int = None):
+        """Start /metrics on METRICS_PORT; returns the port or None."""
+        if port is None:
+            port = int(os.environ.get('METRICS_PORT', DEFAULT_METRICS_PORT))
+        if not port:
+            return None
+
+        aggregator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = aggregator.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name='lisa-metrics', daemon=True).start()
+        logger.info(f"Serving turn latency metrics on http://127.0.0.1:{self.port}/metrics")
+        return self.port
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class TurnTimeline:
+    """Per-session turn timer fed by agent events, metrics and tool calls."""
+
+    def __init__(self, registry: LatencyRegistry, session_id: str, log_dir: str = None):
+        self._registry = registry
+        self.session_id = session_id
+        self.log_dir = log_dir or os.environ.get('TURN_LOG_DIR', DEFAULT_TURN_LOG_DIR)
+        os.makedirs(self.log_dir, exist_ok=True)
+        name = _UNSAFE_NAME.sub('_', session_id) or 'session'
+        self.path = os.path.join(self.log_dir, f"{name}-{int(time.time())}.jsonl")
+        self._turn = None
+        self.turns = 0
+
+    def start_turn(self, source: str = 'voice'):
+        """User stopped speaking (or a chat message arrived): the clock starts."""
+        if self._turn is not None:
+            self._finish(completed=False)
+        self._turn = {
+            'source': source,
+            'started_at': time.time(),
+            'start': time.perf_counter(),
+            'stages': {},
+            'tools': [],
+            'llm_ttft': [],
+            'tts_ttfb': [],
+        }
+
+    def collect(self, mtrcs):
+        """Attach pipeline metrics to the open turn."""
+        turn = self._turn
+        if turn is None:
+            return
+        if isinstance(mtrcs, metrics.PipelineEOUMetrics):
+            self._stage('end_of_utterance', mtrcs.end_of_utterance_delay)
+            self._stage('stt_final', mtrcs.transcription_delay)
+        elif isinstance(mtrcs, metrics.LLMMetrics):
+            turn['llm_ttft'].append(round(mtrcs.ttft, 4))
+            self._stage('llm_ttft', mtrcs.ttft)
+        elif isinstance(mtrcs, metrics.TTSMetrics):
+            turn['tts_ttfb'].append(round(mtrcs.ttfb, 4))
+            self._stage('tts_ttfb', mtrcs.ttfb)
+
+    def tool_finished(self, name: str, seconds: float):
+        if self._turn is not None:
+            self._turn['tools'].append({'name': name, 'seconds': round(seconds, 4)})
+        self._registry.observe(f"tool:{name}", seconds)
+
+    def playout_started(self):
+        """The agent's audio began playing: the turn is complete."""
+        if self._turn is None:
+            return
+        self._stage('playout_start', time.perf_counter() - self._turn['start'])
+        self._finish(completed=True)
+
+    def _stage(self, stage: str, seconds: float):
+        # Only the first occurrence counts; later LLM/TTS requests are follow-ups after tools
+        stages = self._turn['stages']
+        if stage not in stages and seconds is not None and seconds >= 0:
+            stages[stage] = round(seconds, 4)
+
+    def _finish(self, completed: bool):
+        turn, self._turn = self._turn, None
+        self.turns += 1
+        if completed:
+            for stage, seconds in turn['stages'].items():
+                self._registry.observe(stage, seconds)
+
+        record = {
+            'session': self.session_id,
+            'turn': self.turns,
+            'source': turn['source'],
+            'started_at': round(turn['started_at'], 3),
+            'completed': completed,
+            'stages': turn['stages'],
+            'tools': turn['tools'],
+            'llm_ttft': turn['llm_ttft'],
+            'tts_ttfb': turn['tts_ttfb'],
+        }
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write turn timeline: {e}")
+
+        if completed and turn['stages'].get('playout_start', 0) > SLOW_TURN_SECONDS:
+            logger.info(f"Slow turn {self.turns}: {turn['stages']} tools={turn['tools']}")
+
+    def close(self):
+        if self._turn is not None:
+            self._finish(completed=False)
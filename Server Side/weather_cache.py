@@ -0,0 +1,209 @@
+# weather_cache.py
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger("voice-assistant-tools")
+
+######################################
+# WEATHER CACHE
+######################################
+# Weather changes slowly compared to how often people ask about it, so answers
+# are cached per normalized location. Within the TTL an answer is served as-is;
+# after that and up to the stale TTL it is still served immediately while a
+# single background refresh runs (stale-while-revalidate). Concurrent misses
+# for the same city share one upstream request (single flight).
+#
+# With a SharedCache, a miss first looks in the host-wide tier, where every job
+# process on the host publishes the answers it fetched.
+#
+# Configuration (environment):
+#   WEATHER_CACHE_TTL        seconds an answer is fresh (default 600)
+#   WEATHER_CACHE_STALE_TTL  seconds a stale answer may still be served (default 3600)
+
+DEFAULT_TTL = 600
+DEFAULT_STALE_TTL = 3600
+NOT_FOUND_TTL = 300  # Unknown locations are remembered briefly, never served stale
+MAX_ENTRIES = 512
+
+# Old names, common spellings and Hindi names -> the name OpenWeather knows
+LOCATION_ALIASES = {
+    'bombay': 'mumbai',
+    'bangalore': 'bengaluru',
+    'calcutta': 'kolkata',
+    'madras': 'chennai',
+    'gurgaon': 'gurugram',
+    'poona': 'pune',
+    'baroda': 'vadodara',
+    'banaras': 'varanasi',
+    'benares': 'varanasi',
+    'dilli': 'delhi',
+    'new delhi': 'delhi',
+    'दिल्ली': 'delhi',
+    'नई दिल्ली': 'delhi',
+    'मुंबई': 'mumbai',
+    'मुम्बई': 'mumbai',
+    'बेंगलुरु': 'bengaluru',
+    'बैंगलोर': 'bengaluru',
+    'कोलकाता': 'kolkata',
+    'चेन्नई': 'chennai',
+    'हैदराबाद': 'hyderabad',
+    'पुणे': 'pune',
+    'जयपुर': 'jaipur',
+    'लखनऊ': 'lucknow',
+    'अहमदाबाद': 'ahmedabad',
+    'नोएडा': 'noida',
+    'गुड़गांव': 'gurugram',
+    'गुरुग्राम': 'gurugram',
+    'चंडीगढ़': 'chandigarh',
+    'भोपाल': 'bhopal',
+    'पटना': 'patna',
+    'वाराणसी': 'varanasi',
+    'आगरा': 'agra',
+}
+
+LOCATION_NOISE = re.compile(r"^(weather (in|at|for) |the )|( city| ka mausam| का मौसम)$")
+
+
+def normalize_location(location: str) -> str:
+    """Canonical cache key for a spoken location, e.g. ' New  Delhi ' -> 'delhi'."""
+    location = re.sub(r"\s+", " ", (location or '').strip().lower()).strip(' .?!')
+    location = LOCATION_NOISE.sub('', location).strip()
+    parts = [part.strip() for part in location.split(',') if part.strip()]
+    if not parts:
+        return ''
+    parts[0] = LOCATION_ALIASES.get(parts[0], parts[0])
+    return ','.join(parts)
+
+
+class WeatherCache:
+    """TTL cache of upstream weather answers with single-flight and stale-while-revalidate."""
+
+    def __init__(self, ttl: float = None, stale_ttl: float = None, max_entries: int = MAX_ENTRIES, shared=None):
+        self.ttl = ttl if ttl is not None else float(os.environ.get('WEATHER_CACHE_TTL', DEFAULT_TTL))
+        self.stale_ttl = stale_ttl if stale_ttl is not None else float(os.environ.get('WEATHER_CACHE_STALE_TTL', DEFAULT_STALE_TTL))
+        self.max_entries = max_entries
+        self._shared = shared
+
+        self._entries = OrderedDict()  # key -> (fetched_at, (status_code, data))
+        self._inflight = {}  # key -> Future shared by everyone waiting on that key
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.shared_hits = 0
+
+    def get(self, key: str, fetch, submit=None):
+        """Return `(status_code, data)` for a location key.
+
+        `fetch(key)` performs the upstream call and returns `(status_code, data)`.
+        `submit(func, *args)` schedules background work; without it stale entries
+        are refreshed inline instead of in the background.
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                fetched_at, value = cached
+                age = now - fetched_at
+                fresh_for = NOT_FOUND_TTL if value[0] == 404 else self.ttl
+                if age < fresh_for:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return value
+                if value[0] == 200 and age < self.stale_ttl and submit is not None:
+                    self.stale_hits += 1
+                    if key not in self._inflight:
+                        self.refreshes += 1
+                        self._inflight[key] = Future()
+                        submit(self._load, key, fetch)
+                    return value
+
+            inflight = self._inflight.get(key)
+            leader = inflight is None
+            if leader:
+                self.misses += 1
+                self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return inflight.result()
+        return self._load(key, fetch)
+
+    def _load(self, key: str, fetch):
+        """Run the upstream fetch for a key whose in-flight future is already registered."""
+        with self._lock:
+            inflight = self._inflight[key]
+        try:
+            fetched_at, value = self._shared_get(key)
+            if value is None:
+                value = fetch(key)
+                fetched_at = time.monotonic()
+                self._shared_put(key, value)
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            inflight.set_exception(e)
+            raise
+
+        with self._lock:
+            if value[0] in (200, 404):
+                self._entries[key] = (fetched_at, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self._inflight.pop(key, None)
+        inflight.set_result(value)
+        return value
+
+    def _shared_get(self, key: str):
+        """(monotonic fetch time, value) of an answer another process fetched, or (None, None)."""
+        if self._shared is None:
+            return None, None
+        cached = self._shared.get('weather', key)
+        if cached is None:
+            return None, None
+        fetched_wall, status_code, data = cached
+        with self._lock:
+            self.shared_hits += 1
+        # Keep the answer's real age so it goes stale on the same schedule everywhere
+        return time.monotonic() - max(0.0, time.time() - fetched_wall), (status_code, data)
+
+    def _shared_put(self, key: str, value):
+        if self._shared is None or value[0] not in (200, 404):
+            return
+        # Only fresh answers are shared; stale serving stays a per-process decision
+        ttl = NOT_FOUND_TTL if value[0] == 404 else self.ttl
+        self._shared.set('weather', key, [time.time(), value[0], value[1]], ttl=ttl)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'refreshes': self.refreshes,
+            }
+
+
+_default_cache = None
+
+
+def get_default_cache() -> WeatherCache:
+    """Process-wide cache used when a session isn't handed one explicitly."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = WeatherCache()
+    return _default_cache
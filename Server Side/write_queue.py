@@ -0,0 +1,235 @@
+# write_queue.py
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger("voice-assistant-tools")
+
+######################################
+# WRITE-BEHIND QUEUE
+######################################
+# Saving a draft or creating an event used to hold the spoken confirmation
+# until Google answered. In write-behind mode the tool validates the request
+# locally, confirms right away, and hands the write to this queue:
+#
+#   - every write gets an idempotency key and is journalled to disk before the
+#     confirmation is spoken, so a crash or shutdown never loses it,
+#   - it is retried with jittered exponential backoff on timeouts, 429s and
+#     5xx errors; the handler uses the key so a retry never creates a second
+#     copy (calendar events use it as their id, drafts as their Message-ID),
+#   - if it finally fails, the session's on_failed hook speaks a notice.
+#
+# The queue is drained at session shutdown. Writes still unfinished stay in
+# the journal, and a later session on the host picks up journal files that
+# nobody has touched for WRITE_RECOVER_AFTER seconds. Journals are kept in one
+# subdirectory per Google account (its user key), so a session only ever
+# resumes writes for the account it is signed in to.
+#
+# Configuration (environment):
+#   WRITE_BEHIND          "1" to confirm writes before Google does (default off)
+#   WRITE_QUEUE_DIR       journal directory (default write_queue)
+#   WRITE_MAX_ATTEMPTS    attempts per write before giving up (default 5)
+#   WRITE_RETRY_BASE      seconds before the first retry, doubled each time (default 1)
+#   WRITE_DRAIN_TIMEOUT   seconds shutdown waits for pending writes (default 10)
+#   WRITE_RECOVER_AFTER   seconds before an untouched journal entry is adopted (default 300)
+
+DEFAULT_DIR = 'write_queue'
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BASE = 1.0
+DEFAULT_DRAIN_TIMEOUT = 10.0
+DEFAULT_RECOVER_AFTER = 300.0
+MAX_RETRY_DELAY = 30.0
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Transient failures worth another attempt; other API errors are final."""
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUSES
+    return isinstance(error, (OSError, TimeoutError))
+
+
+def new_idempotency_key() -> str:
+    # Hex is valid in Calendar event ids (base32hex) and in a Message-ID
+    return uuid.uuid4().hex
+
+
+class WriteBehindQueue:
+    """Durable, retrying queue of Google writes confirmed to the user before they land."""
+
+    def __init__(self, executor, user_key: str = None, enabled: bool = None, directory: str = None,
+                 max_attempts: int = None, retry_base: float = None):
+        self._executor = executor
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+        self.enabled = enabled if enabled is not None else os.environ.get('WRITE_BEHIND', '0') == '1'
+        # Writes are started on the session's event loop; without one they stay synchronous
+        self.enabled = self.enabled and self._loop is not None
+        self.directory = directory or os.environ.get('WRITE_QUEUE_DIR', DEFAULT_DIR)
+        if user_key:
+            self.directory = os.path.join(self.directory, user_key)
+        self.max_attempts = max_attempts or int(os.environ.get('WRITE_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS))
+        self.retry_base = retry_base if retry_base is not None else float(
+            os.environ.get('WRITE_RETRY_BASE', DEFAULT_RETRY_BASE))
+
+        self._handlers = {}  # kind -> handler(payload, key, attempt), run on the executor
+        self._jobs = {}  # key -> job dict, while pending
+        self._tasks = set()
+
+        self.on_failed = None  # (notice) hook, e.g. to speak it
+
+        self.queued = 0
+        self.completed = 0
+        self.retries = 0
+        self.failed = 0
+        self.recovered = 0
+
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def register(self, kind: str, handler):
+        self._handlers[kind] = handler
+
+    ######################################
+    # JOURNAL
+    ######################################
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _persist(self, job):
+        # Write-then-rename so a crash never leaves a half-written entry
+        path = self._path(job['key'])
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(job, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _forget(self, job, failed: bool = False):
+        self._jobs.pop(job['key'], None)
+        try:
+            if failed:
+                # Kept for inspection, never picked up again
+                os.replace(self._path(job['key']), f"{self._path(job['key'])}.failed")
+            else:
+                os.remove(self._path(job['key']))
+        except FileNotFoundError:
+            pass
+
+    ######################################
+    # QUEUE
+    ######################################
+    def submit(self, kind: str, payload, description: str, key: str = None) -> str:
+        """Journal a write and start it in the background; safe to call from executor threads.
+
+        `description` names the write in a failure notice, e.g. "your draft to Priya".
+        """
+        key = key or new_idempotency_key()
+        job = {
+            'key': key,
+            'kind': kind,
+            'payload': payload,
+            'description': description,
+            'attempts': 0,
+            'created_at': time.time(),
+        }
+        self._persist(job)
+        self._jobs[key] = job
+        self.queued += 1
+        self._loop.call_soon_threadsafe(self._start, job, True)
+        return key
+
+    def _start(self, job, notify: bool):
+        task = self._loop.create_task(self._run(job, notify))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job, notify: bool):
+        handler = self._handlers[job['kind']]
+        while True:
+            job['attempts'] += 1
+            self._persist(job)
+            try:
+                await asyncio.wrap_future(self._executor.submit(handler, job['payload'], job['key'], job['attempts']))
+            except Exception as e:
+                if job['attempts'] < self.max_attempts and is_retryable(e):
+                    self.retries += 1
+                    delay = min(MAX_RETRY_DELAY, self.retry_base * 2 ** (job['attempts'] - 1))
+                    delay *= random.uniform(0.5, 1.5)
+                    logger.warning(f"{job['kind']} write {job['key']} failed ({e}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                self.failed += 1
+                logger.error(f"Giving up on {job['kind']} write {job['key']} after {job['attempts']} attempts: {e}")
+                self._forget(job, failed=True)
+                if notify and self.on_failed is not None:
+                    self.on_failed(f"Sorry, I couldn't save {job['description']} after all. Please ask me to try again.")
+                return
+            self.completed += 1
+            self._forget(job)
+            return
+
+    def pending(self, kind: str):
+        """Payloads of writes of one kind that haven't landed yet."""
+        return [job['payload'] for job in list(self._jobs.values()) if job['kind'] == kind]
+
+    def resume(self):
+        """Adopt this account's journal entries abandoned by earlier sessions (crash, or early shutdown)."""
+        if not self.enabled:
+            return
+        recover_after = float(os.environ.get('WRITE_RECOVER_AFTER', DEFAULT_RECOVER_AFTER))
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            claimed = f"{path}.{os.getpid()}"
+            try:
+                if now - os.path.getmtime(path) < recover_after:
+                    continue
+                # Only one session wins the rename, so each entry is adopted once
+                os.rename(path, claimed)
+                with open(claimed) as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if job.get('kind') not in self._handlers:
+                os.replace(claimed, path)
+                continue
+            self._persist(job)
+            os.remove(claimed)
+            self._jobs[job['key']] = job
+            self.recovered += 1
+            logger.info(f"Resuming {job['kind']} write {job['key']} left by an earlier session")
+            self._start(job, False)
+
+    async def drain(self, timeout: float = None):
+        """Wait for pending writes; whatever is still unfinished stays journalled for recovery."""
+        timeout = timeout if timeout is not None else float(os.environ.get('WRITE_DRAIN_TIMEOUT', DEFAULT_DRAIN_TIMEOUT))
+        # Submissions from executor threads may still be on their way to the loop
+        await asyncio.sleep(0)
+        if not self._tasks:
+            return
+        _, unfinished = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in unfinished:
+            task.cancel()
+        if unfinished:
+            logger.warning(f"{len(unfinished)} writes still pending at shutdown; kept in {self.directory} for recovery")
+
+    def stats(self):
+        return {
+            'queued': self.queued,
+            'completed': self.completed,
+            'retries': self.retries,
+            'failed': self.failed,
+            'recovered': self.recovered,
+            'pending': len(self._jobs),
+        }